@@ -9,16 +9,32 @@
 from __future__ import annotations
 
 import argparse
+import atexit
+import hashlib
+import importlib.util
 import json
 import logging
+import os
+import queue
 import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Final, List, Tuple
 
+import httpx
 from openai import OpenAI
 
-from model_config import MODEL_CONFIG
+try:  # orjson 为可选依赖，缺失时退回标准库 json
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from model_config import ModelSpec, get_model_config
 from intelligent_search.tool_entry import (
     PROSPECTUS_SEARCH_TOOL_SPEC,
     TOOL_NAME,
@@ -29,13 +45,70 @@ from intelligent_search.tool_entry import (
 LOG_DIR = Path(__file__).resolve().parent / "log"
 OUTPUT_DIR = Path(__file__).resolve().parent / "output"
 DEFAULT_QA_FILE = Path(__file__).resolve().parent / "招募说明书_qa.json"
+PROMPT_CACHE_FILE = LOG_DIR / ".prompt_cache.json"
 LOGGER_NAME = "prospectus_tool_test"
 DEFAULT_TEST_QUESTION = "根据180101.SZ招募说明书中的基础设施基金整体架构章节内容，该基金是否有外部借款（外部杠杆）安排，如果有请详细介绍。"
 
+# 模型输出解析所用正则，模块加载时编译一次，避免每轮重复编译
+_ANALYSIS_RES = [
+    re.compile(r'本轮分析[：:]\s*(.*?)(?=TOOL_CALLS?:|FINAL_ANSWER:|$)', re.DOTALL),
+    re.compile(r'最终分析[：:]\s*(.*?)(?=FINAL_ANSWER:|$)', re.DOTALL),
+]
+_FINAL_RE = re.compile(r'FINAL_ANSWER:\s*(.*)\s*$', re.DOTALL)
+
+# 同一轮多个工具调用并行执行时的最大线程数
+MAX_PARALLEL_TOOL_CALLS = 4
+# 设置 LOG_CANONICAL=1 时工具入参按键排序记录，便于回归比对日志
+LOG_CANONICAL = os.environ.get("LOG_CANONICAL") == "1"
+_REQUIRED_TOOL_PARAMS = ("fund_code", "search_info")
+# raw_decode 由 C 实现，一次调用同时完成定位结束位置与解析
+_DECODER = json.JSONDecoder()
+# 解析失败时日志中记录的模型原始输出长度上限
+_LOG_PREVIEW_CHARS = 500
+
+
+# 已确认存在的目录，避免同一进程内重复发起 mkdir 系统调用
+_DIRS_READY: set[Path] = set()
+
+
+def _ensure_dir(path: Path) -> None:
+    """确保目录存在，同一进程内每个目录只创建一次"""
+    if path in _DIRS_READY:
+        return
+    path.mkdir(parents=True, exist_ok=True)
+    _DIRS_READY.add(path)
+
+
+def _json_dumps(obj: Any, sort_keys: bool = False) -> str:
+    """日志用的 JSON 序列化，优先使用 orjson"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, option=option, default=str).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, default=str)
+
+
+def _write_json_file(path: Path, payload: Any) -> None:
+    """以缩进格式写出 JSON 文件，优先使用 orjson"""
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str))
+        return
+    with path.open("w", encoding="utf-8") as output_file:
+        json.dump(payload, output_file, ensure_ascii=False, indent=2, default=str)
+
+
+def _persist_output(output_path: Path, output_payload: Dict[str, Any], logger: logging.Logger) -> None:
+    """保存会话记录 JSON，异常只记录日志不向外抛出"""
+    try:
+        _ensure_dir(output_path.parent)
+        _write_json_file(output_path, output_payload)
+        logger.info("会话记录已保存至: %s", output_path)
+    except Exception as json_exc:  # noqa: BLE001
+        logger.exception("保存会话 JSON 失败: %s", json_exc)
+
 
 def setup_logging() -> Tuple[logging.Logger, Path]:
     """初始化日志，输出到控制台与文件"""
-    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    _ensure_dir(LOG_DIR)
     log_path = LOG_DIR / f"prospectus_tool_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
 
     logger = logging.getLogger(LOGGER_NAME)
@@ -47,7 +120,13 @@ def setup_logging() -> Tuple[logging.Logger, Path]:
     file_handler = logging.FileHandler(log_path, encoding="utf-8")
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+
+    # 文件写入交由后台线程完成，主线程只负责入队，避免大段推理日志阻塞请求路径
+    log_queue: queue.Queue = queue.Queue(-1)
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
 
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
@@ -69,8 +148,8 @@ def _parse_arguments() -> argparse.Namespace:
         ),
     )
     parser.add_argument("--is-expansion", action="store_true", help="是否检索扩募版招募说明书")
-    parser.add_argument("--provider", default="deepseek", help="MODEL_CONFIG 中的提供商键，默认 deepseek")
-    parser.add_argument("--model", default="deepseek-reasoner", help="MODEL_CONFIG 中的模型键，默认 deepseek-reasoner")
+    parser.add_argument("--provider", default="deepseek", help="模型提供商（api_key 取自 <PROVIDER>_API_KEY 环境变量），默认 deepseek")
+    parser.add_argument("--model", default="deepseek-reasoner", help="模型名称，默认 deepseek-reasoner")
     parser.add_argument(
         "--qa-file",
         type=Path,
@@ -83,12 +162,61 @@ def _parse_arguments() -> argparse.Namespace:
         default=20,
         help="LLM 交互的最大轮数，默认 20 轮",
     )
+    parser.add_argument(
+        "--compact-history",
+        action="store_true",
+        help="启用滑动窗口压缩对话历史，较早轮次的工具结果替换为一行摘要",
+    )
+    parser.add_argument(
+        "--keep-tail",
+        type=int,
+        default=3,
+        help="压缩对话历史时保留完整内容的最近轮数，默认 3 轮",
+    )
+    parser.add_argument(
+        "--compact-tool-feedback",
+        action="store_true",
+        help="工具结果只向模型反馈摘要与正文预览，完整文本在模型按 chunk_id 范围再次检索时直接返回",
+    )
+    parser.add_argument(
+        "--feedback-preview-chars",
+        type=int,
+        default=500,
+        help="精简工具反馈时每条结果保留的正文预览字符数，默认 500",
+    )
+    parser.add_argument(
+        "--questions-file",
+        type=Path,
+        default=None,
+        help="批量评测问题文件（JSONL，每行一个问题或含 question 字段的对象）；提供时忽略 --question",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="批量评测时并发处理的问题数，默认 4",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="工具结果持久化缓存目录；不提供则不启用缓存",
+    )
     return parser.parse_args()
 
 
-def _extract_model_config(provider: str, model_name: str) -> Dict[str, str]:
+def _build_http_client() -> httpx.Client:
+    """构建复用连接的 HTTP 客户端，各轮请求共享同一 TCP/TLS 会话；安装 h2 时启用 HTTP/2"""
+    return httpx.Client(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300),
+        timeout=httpx.Timeout(120.0, connect=10.0),
+    )
+
+
+def _extract_model_config(provider: str, model_name: str) -> ModelSpec:
     try:
-        return MODEL_CONFIG[provider][model_name]
+        return get_model_config(provider, model_name)
     except KeyError as exc:
         raise SystemExit(f"未找到模型配置 {provider}.{model_name}: {exc}")
 
@@ -100,11 +228,13 @@ def load_reference_qas(path: Path, logger: logging.Logger) -> List[Dict[str, str
         return []
 
     try:
-        with path.open("r", encoding="utf-8") as file:
-            data = json.load(file)
+        # 以字节读取交给解析器自行解码，省去一次 Python 层的 UTF-8 解码
+        raw = path.read_bytes()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        # 条目结构由 QA 文件生成方保证，这里只校验顶层类型
         if isinstance(data, list):
             logger.info("载入参考 QA 条目 %d 条", len(data))
-            return [item for item in data if isinstance(item, dict)]
+            return data
         logger.warning("参考 QA 文件格式异常，期望列表，实际类型: %s", type(data))
     except json.JSONDecodeError as exc:
         logger.error("解析参考 QA 文件失败: %s", exc)
@@ -118,62 +248,64 @@ def format_reference_text(qas: List[Dict[str, str]], limit: int = 20) -> str:
     if not qas:
         return "（未提供参考问答）"
 
-    lines: List[str] = []
-    for idx, item in enumerate(qas, start=1):
-        question = item.get("q", "-").strip()
-        answer = item.get("a", "-").strip()
-        lines.append(f"{idx}. 问题：{question}\n   要点：{answer}")
-        if limit and idx >= limit:
-            if len(qas) > limit:
-                lines.append(f"…… 其余 {len(qas) - limit} 条问答已省略")
-            break
+    # 先按上限截取，循环内不再逐条判断是否到达上限
+    count = min(len(qas), limit) if limit else len(qas)
+    lines = [
+        f"{idx}. 问题：{item.get('q', '-').strip()}\n   要点：{item.get('a', '-').strip()}"
+        for idx, item in enumerate(qas[:count], start=1)
+    ]
+    if count < len(qas):
+        lines.append(f"…… 其余 {len(qas) - count} 条问答已省略")
     return "\n".join(lines)
 
 
+# 系统提示词的固定部分，只在运行时拼接参考章节要点
+_PROMPT_HEAD: Final[str] = (
+    "你是一名熟悉中国基础设施公募REITs招募说明书结构的专业助手，全部的基础设施公募REITs的招募说明书文本已被按照200-1500字符切分成众多的文本块，你的目标是在回答前通过多轮工具调用获取相应的原文信息，确保依据充分。请严格执行以下作业流程：\n"
+    "一、准备阶段\n"
+    "1. 阅读下方提供的招募说明书参考章节要点，了解各章节常见内容与排布顺序。\n"
+    "2. 仔细研读用户问题，主动识别其中的基金代码以及适用的招募说明书版本（首发/扩募），如未明确则视为首发；如无法确定基金代码，应先向用户确认后再继续。\n"
+    "3. 第一轮工具调用必须获取该基金的招募说明书目录，调用参数需包含识别出的 fund_code 及必要的 is_expansion（如需） 标记，search_info=\"目录\"。\n"
+    "二、定位具体章节阶段\n"
+    "4. 对照目录和参考章节要点，推断问题所属章节。示例：若问题是“基础设施项目最近三年及一期的EBITDA是多少？”，参考章节要点说明【基础设施项目基本情况】章节包含历史收益信息，其中很可能包括EBITDA指标信息，则应检索该章节。\n"
+    "5. 定位目标章节正文：有两种方法：\n"
+    "（1）使用start_page等于目录中目标章节的页码，search_info为空，并且合理确定end_page，end_page确定方式是：如果目录中下一章节的页码与目标章节页码的差值在100以内，则可以一次性获取该章节全部内容，end_page选取略大于下一个章节的页码的数即可（因为实际的页码可能会大于目录中的页码，但是偏差不超过30页）；如果目录中下一章节的页码与目标章节页码的差值超过100则说明该章节内容过长，则end_page适当选取（比如比start_page大100），先预览一部分信息，后续再逐步往后扩展。\n"
+    "（2）如果目录没有页码或前一种方法失败，则使用“章节标题检索：目标章节标题”定位章节首段，例如search_info=“第十四部分 基础设施项目基本情况”， expand_after设置一个数（例如5），预览后续内容（这种方法有可能会返回的内容仅是对于目标章节的引用而不是目标章节的正文）。\n两种方式都需要记录返回的页码与 chunk_id。\n"
+    "三、章节深入检索阶段（如需）\n"
+    "6. 若首轮未提取完整章节文本、且未覆盖目标信息，则继续往后扩展文本块以提取该章节剩余部分，可参考参考章节要点中对于该章节内容结构介绍以及页数范围，决定是否进一步往后扩展以及往后扩展多少页或多少文本块。可按页码或 chunk_id 连续提取，例如上一轮结束 chunk_id=100，则下一轮设置 start_chunk_id=101、end_chunk_id=120、search_info=空字符串；也可按页码区间提取。章节内容过长的可不断重复此操作，直至获得答案或已获得该章节完整信息。\n"
+    "四、调整范围（如需）\n"
+    "7. 若已获取目标章节完整信息，但仍未获得答案，则需要更换检索章节，可考虑以下两种情况：\n"
+    "（1）若判断其他章节可能有答案，则找出最可能的章节重复上述步骤；\n"
+    "（2）如无法准确判断目标章节，则可以考虑使用search_info=“内容检索：关键词”获取包含关键词文本块，例如直接检索问题的关键词或者检索参考章节要点中提到的可能出现的小标题，结合适当的expand_before/expand_after（比如均为1），工具将返回多条包含检索关键词的文本信息（最多20条）及对应的页码和chunk_id，然后从中找出最有可能含有答案的文本信息，并根据其chunk_id或页码进一步扩展以获得完整信息。如果知道大致范围，可结合已知页码或已知chunk_id的使用 start_chunk_id/end_chunk_id 或 start_page/end_page 限定范围进行检索，但无法判断检索范围，可不限制范围的使用search_info=“内容检索：关键词”，则会在全文内检索。\n"
+    "四、回答阶段\n"
+    "8. 汇总结果时务必引用工具返回文本中的证据，并标注来源（如所在具体章节标题、表格标题等（如有），无需提供页码范围）；若信息不足，需要说明缺口及下一步建议。\n"
+    "五、工具说明与注意事项\n"
+    "- fund_code：必填，请使用从用户问题中解析出的基金代码。\n"
+    "- search_info：必填，支持：\n"
+    "  • “目录”——获取完整目录。请注意，目录中的页码并非实际页码，实际页码可能会大于目录中的页码，但是偏差一般在30页以内；\n"
+    "  • “章节标题检索：目标章节标题”——定位章节开头，请注意，请提供目录中准确的标题信息及序号，例如：第十四部分 基础设施项目基本情况”；\n"
+    "  • “内容检索：需要检索的内容”——检索关键信息，例如检索问题的关键词或者检索参考章节要点中提到的可能出现的小标题关键词。\n"
+    "  • 空字符串——直接返回限定范围内的原文文本块。\n"
+    "- is_expansion：选填，为 True 时检索扩募版招募说明书。\n"
+    "- start_page/end_page、start_chunk_id/end_chunk_id：选填，限制检索范围。\n"
+    "- expand_before/expand_after：选填，控制返回的上下文扩展文本块数量，检索结果文本块仅为单个文本块，但是使用这两个参数可以将检索结果文本块前后的文本块一同返回，以获取完整的上下文；单个文本块约 200-1500 字，请结合需求设定，初步预览可考虑前后各扩展1个文本块，找到需要的文本信息后可考虑上下文多个文本块。\n"
+    "- 工具调用非常灵活，可以多轮调用，目标是获取需要的文本信息，情形包括但不限于：1）获取招募说明书目录：search_info填写“目录”；2）获取目录展示的特定章节标题所在的正本文本块，根据目录中的页码合理填写start_page和end_page，或者search_info填写“章节标题检索：目标章节标题”，expand_after根据需要填写；3）检索特定信息，search_info填写“内容检索：需要检索的内容”，根据已知的信息确定是否需要填写start_page/end_page/start_chunk_id/end_chunk_id。4）获取特定页面范围内/特定chunk_id范围内的文本信息，这时search_info填写为空，根据需要填写start_page和end_page（或start_chunk_id和end_chunk_id）。\n"
+    "- 在目标章节页数可控情况下（100页以内），优先探索完毕完整的章节文本信息，除非目标章节内容特别长或者确实没有答案，才考虑使用内容检索功能。在目标章节页数比较长时，已获得的该章节信息不够时，仍需对该章节进行探索时，可以使用内容检索，但尽量结合已获得信息的chunk_id或页码缩小检索窗口的范围。\n"
+    "- 工具返回出内容：将返回执行状态（success）、文件名称（source_file）、检索结果的数量（retrieved_count）、每个检索结果对应的文本信息（扩展后）（text或content）、每个文本信息对应的起始页码（start_page）、每个文本信息对应的终止页码（end_page）、每个文本信息对应的起始chunk_id（start_chunk_id）、每个文本信息对应的起始chunk_id（end_chunk_id）。\n"        
+    "六、特殊提醒\n"
+    "- 章节标题可能与参考章节要点中存在措辞差异，匹配时需灵活处理。\n"
+    "- 参考章节要点提供的是通用结构，与真实招募说明书的内容顺序高度相似，可据此推断但不得武断。请多多结合参考章节要点锁定范围。\n"
+    "- 若模型出现遗漏工具调用、未按目录操作等情况，需主动纠正并重新按流程执行。\n"
+    "- 始终以中文作答，禁止凭空推测和编造数据。\n"
+    "- 调用工具时，每一轮输出一个 TOOL_CALL；本轮有多个互不依赖的检索时，可用 TOOL_CALLS 一次给出，存在先后依赖的检索需分轮调用。\n"
+    "\n参考章节要点：\n"
+)
+_PROMPT_TAIL: Final[str] = "\n如参考信息不足，可在作答中说明需要补充的材料。"
+
+
 def build_system_prompt(reference_text: str) -> str:
     """生成系统提示词，指导 LLM 的工作流程和工具使用方式"""
-    return (
-        "你是一名熟悉中国基础设施公募REITs招募说明书结构的专业助手，全部的基础设施公募REITs的招募说明书文本已被按照200-1500字符切分成众多的文本块，你的目标是在回答前通过多轮工具调用获取相应的原文信息，确保依据充分。请严格执行以下作业流程：\n"
-        "一、准备阶段\n"
-        "1. 阅读下方提供的招募说明书参考章节要点，了解各章节常见内容与排布顺序。\n"
-        "2. 仔细研读用户问题，主动识别其中的基金代码以及适用的招募说明书版本（首发/扩募），如未明确则视为首发；如无法确定基金代码，应先向用户确认后再继续。\n"
-        "3. 第一轮工具调用必须获取该基金的招募说明书目录，调用参数需包含识别出的 fund_code 及必要的 is_expansion（如需） 标记，search_info=\"目录\"。\n"
-        "二、定位具体章节阶段\n"
-        "4. 对照目录和参考章节要点，推断问题所属章节。示例：若问题是“基础设施项目最近三年及一期的EBITDA是多少？”，参考章节要点说明【基础设施项目基本情况】章节包含历史收益信息，其中很可能包括EBITDA指标信息，则应检索该章节。\n"
-        "5. 定位目标章节正文：有两种方法：\n"
-        "（1）使用start_page等于目录中目标章节的页码，search_info为空，并且合理确定end_page，end_page确定方式是：如果目录中下一章节的页码与目标章节页码的差值在100以内，则可以一次性获取该章节全部内容，end_page选取略大于下一个章节的页码的数即可（因为实际的页码可能会大于目录中的页码，但是偏差不超过30页）；如果目录中下一章节的页码与目标章节页码的差值超过100则说明该章节内容过长，则end_page适当选取（比如比start_page大100），先预览一部分信息，后续再逐步往后扩展。\n"
-        "（2）如果目录没有页码或前一种方法失败，则使用“章节标题检索：目标章节标题”定位章节首段，例如search_info=“第十四部分 基础设施项目基本情况”， expand_after设置一个数（例如5），预览后续内容（这种方法有可能会返回的内容仅是对于目标章节的引用而不是目标章节的正文）。\n两种方式都需要记录返回的页码与 chunk_id。\n"
-        "三、章节深入检索阶段（如需）\n"
-        "6. 若首轮未提取完整章节文本、且未覆盖目标信息，则继续往后扩展文本块以提取该章节剩余部分，可参考参考章节要点中对于该章节内容结构介绍以及页数范围，决定是否进一步往后扩展以及往后扩展多少页或多少文本块。可按页码或 chunk_id 连续提取，例如上一轮结束 chunk_id=100，则下一轮设置 start_chunk_id=101、end_chunk_id=120、search_info=空字符串；也可按页码区间提取。章节内容过长的可不断重复此操作，直至获得答案或已获得该章节完整信息。\n"
-        "四、调整范围（如需）\n"
-        "7. 若已获取目标章节完整信息，但仍未获得答案，则需要更换检索章节，可考虑以下两种情况：\n"
-        "（1）若判断其他章节可能有答案，则找出最可能的章节重复上述步骤；\n"
-        "（2）如无法准确判断目标章节，则可以考虑使用search_info=“内容检索：关键词”获取包含关键词文本块，例如直接检索问题的关键词或者检索参考章节要点中提到的可能出现的小标题，结合适当的expand_before/expand_after（比如均为1），工具将返回多条包含检索关键词的文本信息（最多20条）及对应的页码和chunk_id，然后从中找出最有可能含有答案的文本信息，并根据其chunk_id或页码进一步扩展以获得完整信息。如果知道大致范围，可结合已知页码或已知chunk_id的使用 start_chunk_id/end_chunk_id 或 start_page/end_page 限定范围进行检索，但无法判断检索范围，可不限制范围的使用search_info=“内容检索：关键词”，则会在全文内检索。\n"
-        "四、回答阶段\n"
-        "8. 汇总结果时务必引用工具返回文本中的证据，并标注来源（如所在具体章节标题、表格标题等（如有），无需提供页码范围）；若信息不足，需要说明缺口及下一步建议。\n"
-        "五、工具说明与注意事项\n"
-        "- fund_code：必填，请使用从用户问题中解析出的基金代码。\n"
-        "- search_info：必填，支持：\n"
-        "  • “目录”——获取完整目录。请注意，目录中的页码并非实际页码，实际页码可能会大于目录中的页码，但是偏差一般在30页以内；\n"
-        "  • “章节标题检索：目标章节标题”——定位章节开头，请注意，请提供目录中准确的标题信息及序号，例如：第十四部分 基础设施项目基本情况”；\n"
-        "  • “内容检索：需要检索的内容”——检索关键信息，例如检索问题的关键词或者检索参考章节要点中提到的可能出现的小标题关键词。\n"
-        "  • 空字符串——直接返回限定范围内的原文文本块。\n"
-        "- is_expansion：选填，为 True 时检索扩募版招募说明书。\n"
-        "- start_page/end_page、start_chunk_id/end_chunk_id：选填，限制检索范围。\n"
-        "- expand_before/expand_after：选填，控制返回的上下文扩展文本块数量，检索结果文本块仅为单个文本块，但是使用这两个参数可以将检索结果文本块前后的文本块一同返回，以获取完整的上下文；单个文本块约 200-1500 字，请结合需求设定，初步预览可考虑前后各扩展1个文本块，找到需要的文本信息后可考虑上下文多个文本块。\n"
-        "- 工具调用非常灵活，可以多轮调用，目标是获取需要的文本信息，情形包括但不限于：1）获取招募说明书目录：search_info填写“目录”；2）获取目录展示的特定章节标题所在的正本文本块，根据目录中的页码合理填写start_page和end_page，或者search_info填写“章节标题检索：目标章节标题”，expand_after根据需要填写；3）检索特定信息，search_info填写“内容检索：需要检索的内容”，根据已知的信息确定是否需要填写start_page/end_page/start_chunk_id/end_chunk_id。4）获取特定页面范围内/特定chunk_id范围内的文本信息，这时search_info填写为空，根据需要填写start_page和end_page（或start_chunk_id和end_chunk_id）。\n"
-        "- 在目标章节页数可控情况下（100页以内），优先探索完毕完整的章节文本信息，除非目标章节内容特别长或者确实没有答案，才考虑使用内容检索功能。在目标章节页数比较长时，已获得的该章节信息不够时，仍需对该章节进行探索时，可以使用内容检索，但尽量结合已获得信息的chunk_id或页码缩小检索窗口的范围。\n"
-        "- 工具返回出内容：将返回执行状态（success）、文件名称（source_file）、检索结果的数量（retrieved_count）、每个检索结果对应的文本信息（扩展后）（text或content）、每个文本信息对应的起始页码（start_page）、每个文本信息对应的终止页码（end_page）、每个文本信息对应的起始chunk_id（start_chunk_id）、每个文本信息对应的起始chunk_id（end_chunk_id）。\n"        
-        "六、特殊提醒\n"
-        "- 章节标题可能与参考章节要点中存在措辞差异，匹配时需灵活处理。\n"
-        "- 参考章节要点提供的是通用结构，与真实招募说明书的内容顺序高度相似，可据此推断但不得武断。请多多结合参考章节要点锁定范围。\n"
-        "- 若模型出现遗漏工具调用、未按目录操作等情况，需主动纠正并重新按流程执行。\n"
-        "- 始终以中文作答，禁止凭空推测和编造数据。\n"
-        "- 调用工具时，每一轮请只调用一次。\n"
-        "\n参考章节要点：\n"
-        f"{reference_text}\n"
-        "如参考信息不足，可在作答中说明需要补充的材料。"
-    )
+    return "".join((_PROMPT_HEAD, reference_text, _PROMPT_TAIL))
 
 
 def build_user_prompt(question: str, is_expansion: bool) -> str:
@@ -182,11 +314,26 @@ def build_user_prompt(question: str, is_expansion: bool) -> str:
     return question
 
 
+def _compact_tool_schema(spec: Dict[str, Any]) -> str:
+    """将 function 规格压缩为“工具说明 + 每个参数一行”的文本"""
+    function = spec.get("function", spec)
+    parameters = function.get("parameters", {})
+    required = set(parameters.get("required", []))
+
+    lines = [f"工具 {function.get('name')}：{function.get('description', '')}", "参数："]
+    for name, prop in parameters.get("properties", {}).items():
+        flags = [prop.get("type", "any"), "必填" if name in required else "可选"]
+        if "default" in prop:
+            flags.append(f"默认 {json.dumps(prop['default'])}")
+        lines.append(f"- {name} ({', '.join(flags)}): {prop.get('description', '')}")
+    return "\n".join(lines)
+
+
 def build_deepseek_reasoner_enhanced_prompt(original_system_prompt: str, tools_schema: List[Dict[str, Any]]) -> str:
     """为 DeepSeek Reasoner 构建增强的系统提示词，在原有基础上追加格式指导"""
     
-    # 将 tools schema 转为 JSON 字符串用于展示
-    tools_json = json.dumps(tools_schema, ensure_ascii=False, indent=2)
+    # 以紧凑的参数清单代替完整 JSON 规格，减少每轮重复发送的提示词长度
+    tools_json = "\n\n".join(_compact_tool_schema(spec) for spec in tools_schema)
     
     reasoner_addition = f"""
 
@@ -213,7 +360,17 @@ TOOL_CALL:
     "expand_after": 0
 }}
 ```
-请注意，如本轮需要调用工具则只返回TOOL_CALL，并且只填写本轮需要的参数，未使用的字段不要出现，也不要为了凑格式填写 null 或默认值。
+请注意，如本轮需要调用工具则只返回TOOL_CALL（或下方的TOOL_CALLS），不要同时给出FINAL_ANSWER，并且只填写本轮需要的参数，未使用的字段不要出现，也不要为了凑格式填写 null 或默认值。
+
+#### 格式A2：同时发起多个相互独立的工具调用
+```
+TOOL_CALLS:
+[
+    {{"fund_code": "基金代码", "search_info": "检索信息一"}},
+    {{"fund_code": "基金代码", "search_info": "检索信息二"}}
+]
+```
+当本轮需要的多次检索互不依赖（例如同时检索多个章节）时，可使用 TOOL_CALLS 一次给出，系统会并行执行并按顺序返回全部结果；存在先后依赖的检索仍需分轮使用 TOOL_CALL。
 
 #### 格式B：给出最终答案
 ```
@@ -222,7 +379,7 @@ FINAL_ANSWER:
 ```
 
 ### 工具调用规则
-可用工具的完整规格如下：
+可用工具及参数说明如下：
 {tools_json}
 
 ### 参数使用指导
@@ -239,7 +396,7 @@ FINAL_ANSWER:
 ### 执行要求
 - 严格按照上述格式输出，否则系统无法解析
 - TOOL_CALL 中仅填写本轮真正需要的参数
-- 每轮只调用一次工具
+- 每轮只输出一个 TOOL_CALL 或一个 TOOL_CALLS，互不依赖的检索可合并到 TOOL_CALLS 中
 - JSON格式必须正确，不要添加注释
 
 现在开始分析用户问题并逐步检索相关信息："""
@@ -247,6 +404,62 @@ FINAL_ANSWER:
     return original_system_prompt + reasoner_addition
 
 
+def _prompt_cache_key(qa_file: Path, tools_schema: List[Dict[str, Any]]) -> Tuple[Any, ...] | None:
+    """以 QA 文件修改时间、脚本修改时间与工具规格摘要作为提示词缓存键"""
+    try:
+        qa_mtime_ns = qa_file.stat().st_mtime_ns
+        script_mtime_ns = Path(__file__).stat().st_mtime_ns
+    except OSError:
+        return None
+    schema_digest = hashlib.sha1(
+        json.dumps(tools_schema, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return (str(qa_file.resolve()), qa_mtime_ns, script_mtime_ns, schema_digest)
+
+
+def _load_cached_prompt(qa_file: Path, tools_schema: List[Dict[str, Any]]) -> str | None:
+    """读取磁盘缓存的增强系统提示词，键不匹配或缓存损坏时返回 None"""
+    key = _prompt_cache_key(qa_file, tools_schema)
+    if key is None or not PROMPT_CACHE_FILE.exists():
+        return None
+    try:
+        cached = _DECODER.decode(PROMPT_CACHE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):  # 缓存损坏时直接重建
+        return None
+    # JSON 中的键为列表，与元组键逐项比较
+    if isinstance(cached, dict) and cached.get("key") == list(key):
+        return cached.get("prompt")
+    return None
+
+
+def _store_cached_prompt(qa_file: Path, tools_schema: List[Dict[str, Any]], prompt: str) -> None:
+    """将增强系统提示词写入磁盘缓存，失败时忽略"""
+    key = _prompt_cache_key(qa_file, tools_schema)
+    if key is None:
+        return
+    try:
+        _ensure_dir(PROMPT_CACHE_FILE.parent)
+        PROMPT_CACHE_FILE.write_text(_json_dumps({"key": key, "prompt": prompt}), encoding="utf-8")
+    except OSError:
+        pass
+
+
+def build_cached_enhanced_prompt(qa_file: Path, logger: logging.Logger) -> str:
+    """获取 DeepSeek Reasoner 增强系统提示词，命中磁盘缓存时跳过 QA 解析与提示词拼装"""
+    tools_schema = [PROSPECTUS_SEARCH_TOOL_SPEC]
+    cached_prompt = _load_cached_prompt(qa_file, tools_schema)
+    if cached_prompt is not None:
+        logger.info("命中系统提示词缓存: %s", PROMPT_CACHE_FILE)
+        return cached_prompt
+
+    qas = load_reference_qas(qa_file, logger)
+    reference_text = format_reference_text(qas)
+    system_prompt = build_system_prompt(reference_text)
+    enhanced_prompt = build_deepseek_reasoner_enhanced_prompt(system_prompt, tools_schema)
+    _store_cached_prompt(qa_file, tools_schema, enhanced_prompt)
+    return enhanced_prompt
+
+
 def _stringify_content(content: Any) -> str:
     """将 OpenAI 返回的 content 转为字符串"""
     if content is None:
@@ -261,49 +474,29 @@ def _stringify_content(content: Any) -> str:
     return str(content)
 
 
-def _extract_reasoning_chunks(message: Any) -> List[str]:
-    """从模型返回的消息中提取思考/推理文本"""
-    chunks: List[str] = []
-
-    for attr in ("reasoning_content", "reasoning"):
-        value = getattr(message, attr, None)
-        if value:
-            chunks.append(_stringify_content(value))
-
-    content = getattr(message, "content", None)
-    if isinstance(content, list):
-        for item in content:
-            if isinstance(item, dict):
-                item_type = item.get("type")
-                if item_type in {"reasoning", "thought", "thinking"}:
-                    text = item.get("text")
-                    if text:
-                        chunks.append(text)
-
-    return [chunk for chunk in chunks if chunk]
+_REASONING_ATTRS = ("reasoning_content", "reasoning", "thoughts", "thinking")
+_REASONING_ITEM_TYPES = frozenset({"reasoning", "thought", "thinking"})
 
 
-def _extract_reasoning_chunks_enhanced(message: Any, choice: Any = None, response: Any = None) -> List[str]:
-    """增强版推理内容提取，从消息、choice 和 response 多个层级查找"""
+def _extract_reasoning_chunks(*objects: Any) -> List[str]:
+    """从消息、choice、response 等多个层级一次性提取思考/推理文本，None 会被跳过"""
     chunks: List[str] = []
-
-    # 从消息层级提取
-    chunks.extend(_extract_reasoning_chunks(message))
-    
-    # 从 choice 层级提取
-    if choice:
-        for attr in ("reasoning_content", "reasoning", "thoughts", "thinking"):
-            value = getattr(choice, attr, None)
-            if value:
-                chunks.append(_stringify_content(value))
-    
-    # 从 response 层级提取
-    if response:
-        for attr in ("reasoning_content", "reasoning", "thoughts", "thinking"):
-            value = getattr(response, attr, None)
+    for obj in objects:
+        if obj is None:
+            continue
+        for attr in _REASONING_ATTRS:
+            value = getattr(obj, attr, None)
             if value:
                 chunks.append(_stringify_content(value))
 
+        content = getattr(obj, "content", None)
+        if isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict) and item.get("type") in _REASONING_ITEM_TYPES:
+                    text = item.get("text")
+                    if text:
+                        chunks.append(text)
+
     return [chunk for chunk in chunks if chunk]
 
 
@@ -320,64 +513,165 @@ def _sanitize_assistant_content(raw_content: Any) -> Any:
 
 
 
+def _json_start_after_marker(content: str, marker: str, open_char: str) -> int | None:
+    """返回紧跟 marker 的 JSON 起始下标：两者之间只允许空白或冒号，否则返回 None"""
+    marker_index = content.find(marker)
+    if marker_index == -1:
+        return None
+    start = marker_index + len(marker)
+    length = len(content)
+    while start < length and (content[start].isspace() or content[start] == ":"):
+        start += 1
+    if start == length or content[start] != open_char:
+        return None
+    return start
+
+
+def _scan_balanced_json(content: str, marker: str, open_char: str, close_char: str) -> str | None:
+    """定位紧跟 marker 的完整 JSON 片段，按括号深度线性扫描，忽略字符串内的括号
+
+    仅用于流式输出时判断 JSON 是否已闭合；解析统一走 _decode_after_marker。
+    """
+    start = _json_start_after_marker(content, marker, open_char)
+    if start is None:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(content)):
+        char = content[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == open_char:
+            depth += 1
+        elif char == close_char:
+            depth -= 1
+            if depth == 0:
+                return content[start:index + 1]
+    return None
+
+
+def _extract_tool_call_json(content: str) -> str | None:
+    """定位 TOOL_CALL: 之后第一个完整的 JSON 对象"""
+    return _scan_balanced_json(content, "TOOL_CALL:", "{", "}")
+
+
+def _extract_tool_calls_json(content: str) -> str | None:
+    """定位 TOOL_CALLS: 之后第一个完整的 JSON 数组"""
+    return _scan_balanced_json(content, "TOOL_CALLS:", "[", "]")
+
+
+def _decode_after_marker(content: str, marker: str, open_char: str) -> Tuple[Any, str] | None:
+    """解析紧跟 marker 的 JSON 值（中间只允许空白或冒号），返回 (对象, 原始文本)
+
+    未出现 marker、或 marker 后首个非空白字符不是 open_char 时返回 None；
+    JSON 不合法时抛出 json.JSONDecodeError。
+    """
+    start = _json_start_after_marker(content, marker, open_char)
+    if start is None:
+        return None
+    obj, end = _DECODER.raw_decode(content, start)
+    return obj, content[start:end]
+
+
+def _extract_tool_calls_array(tool_calls: Any) -> List[Dict[str, Any]]:
+    """校验 TOOL_CALLS 数组，要求每个元素都是对象"""
+    if not isinstance(tool_calls, list) or not all(isinstance(item, dict) for item in tool_calls):
+        raise ValueError("TOOL_CALLS 必须是由 JSON 对象组成的数组")
+    return tool_calls
+
+
 def _parse_reasoner_output(content: str, reasoning_content: str, logger: logging.Logger) -> Dict[str, Any]:
     """解析 DeepSeek Reasoner 的输出内容和推理过程"""
     result = {
-        "type": None,  # "tool_call", "final_answer", "format_error", "error"
+        "type": None,  # "tool_call", "tool_calls", "final_answer", "format_error", "error"
         "analysis": "",
         "tool_call": None,
+        "tool_calls": None,
         "final_answer": None,
         "reasoning": reasoning_content,
         "errors": []
     }
     
     # 1. 提取分析部分
-    analysis_patterns = [
-        r'本轮分析[：:]\s*(.*?)(?=TOOL_CALL:|FINAL_ANSWER:|$)',
-        r'最终分析[：:]\s*(.*?)(?=FINAL_ANSWER:|$)'
-    ]
-    
-    for pattern in analysis_patterns:
-        match = re.search(pattern, content, re.DOTALL)
+    for pattern in _ANALYSIS_RES:
+        match = pattern.search(content)
         if match:
             result["analysis"] = match.group(1).strip()
             break
     
-    # 2. 检查工具调用
-    tool_call_pattern = r'TOOL_CALL:\s*(\{.*?\})'
-    tool_match = re.search(tool_call_pattern, content, re.DOTALL)
-    
-    if tool_match:
-        try:
-            tool_call_json = tool_match.group(1)
-            logger.debug("解析工具调用 JSON: %s", tool_call_json)
-            tool_call = json.loads(tool_call_json)
-            
-            # 验证必填参数
-            required_params = ["fund_code", "search_info"]
-            missing_params = [p for p in required_params if p not in tool_call or tool_call[p] is None]
+    # 2. 检查并行工具调用
+    try:
+        decoded_calls = _decode_after_marker(content, "TOOL_CALLS:", "[")
+        if decoded_calls is not None:
+            tool_calls, tool_calls_json = decoded_calls
+            logger.debug("解析并行工具调用 JSON: %s", tool_calls_json)
+            tool_calls = _extract_tool_calls_array(tool_calls)
+    except (json.JSONDecodeError, ValueError) as e:
+        result["errors"].append(f"TOOL_CALLS 解析失败: {e}")
+        result["type"] = "error"
+        logger.error("并行工具调用 JSON 解析失败: %s, 原始内容: %s", e, content[:_LOG_PREVIEW_CHARS])
+        return result
+
+    if decoded_calls is not None:
+        if not tool_calls:
+            result["errors"].append("TOOL_CALLS 不能为空数组")
+            result["type"] = "error"
+            logger.warning("并行工具调用为空数组")
+            return result
+
+        for position, tool_call in enumerate(tool_calls, start=1):
+            missing_params = [p for p in _REQUIRED_TOOL_PARAMS if tool_call.get(p) is None]
             if missing_params:
-                result["errors"].append(f"缺少必填参数: {missing_params}")
-                result["type"] = "error"
-                logger.warning("工具调用缺少必填参数: %s", missing_params)
-                return result
-            
-            # 保留模型填写的参数原样传递，避免额外填充默认值
-            
-            result["type"] = "tool_call"
-            result["tool_call"] = tool_call
-            logger.info("成功解析工具调用: %s", json.dumps(tool_call, ensure_ascii=False))
+                result["errors"].append(f"第 {position} 个调用缺少必填参数: {missing_params}")
+        if result["errors"]:
+            result["type"] = "error"
+            logger.warning("并行工具调用缺少必填参数: %s", result["errors"])
             return result
-            
-        except json.JSONDecodeError as e:
-            result["errors"].append(f"JSON解析失败: {e}")
+
+        result["type"] = "tool_calls"
+        result["tool_calls"] = tool_calls
+        logger.info("成功解析 %d 个并行工具调用", len(tool_calls))
+        return result
+
+    # 3. 检查工具调用
+    try:
+        decoded_call = _decode_after_marker(content, "TOOL_CALL:", "{")
+    except json.JSONDecodeError as e:
+        result["errors"].append(f"JSON解析失败: {e}")
+        result["type"] = "error"
+        logger.error("工具调用 JSON 解析失败: %s, 原始内容: %s", e, content[:_LOG_PREVIEW_CHARS])
+        return result
+
+    if decoded_call is not None:
+        tool_call, tool_call_json = decoded_call
+        logger.debug("解析工具调用 JSON: %s", tool_call_json)
+
+        # 验证必填参数
+        missing_params = [p for p in _REQUIRED_TOOL_PARAMS if p not in tool_call or tool_call[p] is None]
+        if missing_params:
+            result["errors"].append(f"缺少必填参数: {missing_params}")
             result["type"] = "error"
-            logger.error("工具调用 JSON 解析失败: %s, 原始内容: %s", e, tool_match.group(1))
+            logger.warning("工具调用缺少必填参数: %s", missing_params)
             return result
-    
-    # 3. 检查最终答案
-    final_pattern = r'FINAL_ANSWER:\s*(.*)\s*$'
-    final_match = re.search(final_pattern, content, re.DOTALL)
+
+        # 保留模型填写的参数原样传递，避免额外填充默认值
+
+        result["type"] = "tool_call"
+        result["tool_call"] = tool_call
+        logger.info("成功解析工具调用: %s", _json_dumps(tool_call))
+        return result
+
+    # 4. 检查最终答案
+    final_match = _FINAL_RE.search(content)
     
     if final_match:
         final_answer = final_match.group(1).strip()
@@ -391,27 +685,283 @@ def _parse_reasoner_output(content: str, reasoning_content: str, logger: logging
             logger.info("解析到最终答案")
         return result
     
-    # 4. 格式错误处理
+    # 5. 格式错误处理
     result["type"] = "format_error"
     result["errors"].append("未找到有效的TOOL_CALL或FINAL_ANSWER格式")
     logger.warning("输出格式错误，未找到TOOL_CALL或FINAL_ANSWER")
     return result
 
 
+def _stream_reasoner_response(
+    client: OpenAI,
+    model_name: str,
+    messages: List[Dict[str, Any]],
+) -> Tuple[str, str]:
+    """流式调用模型，累积推理与回复文本；一旦出现完整的 TOOL_CALL/TOOL_CALLS JSON 即提前关闭流"""
+    stream = client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        stream=True,
+    )
+    reasoning_parts: List[str] = []
+    content_parts: List[str] = []
+    content_buf = ""
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            reasoning_parts.extend(_extract_reasoning_chunks(delta))
+            content_piece = getattr(delta, "content", None)
+            if not content_piece:
+                continue
+            content_parts.append(content_piece)
+            # 只有出现右括号时 JSON 才可能闭合，避免每个片段都重新扫描
+            if "}" in content_piece or "]" in content_piece:
+                content_buf = "".join(content_parts)
+                if "TOOL_CALLS:" in content_buf:
+                    if _extract_tool_calls_json(content_buf) is not None:
+                        break
+                elif _extract_tool_call_json(content_buf) is not None:
+                    break
+    finally:
+        stream.close()
+    # FINAL_ANSWER 可能包含多段文本，需读到流结束，不在空行处截断
+    return "".join(reasoning_parts), "".join(content_parts)
+
+
+def _run_tool_call(tool_fn: Any, tool_call: Dict[str, Any]) -> Tuple[bool, Any]:
+    """执行单个工具调用，异常时返回错误信息而非抛出，便于并行收集结果"""
+    try:
+        return True, tool_fn(tool_call)
+    except Exception as e:  # noqa: BLE001
+        return False, str(e)
+
+
+def _run_tool_calls_parallel(tool_fn: Any, tool_calls: List[Dict[str, Any]]) -> List[Tuple[bool, Any]]:
+    """并行执行同一轮内相互独立的工具调用，结果保持与输入相同的顺序"""
+    max_workers = min(MAX_PARALLEL_TOOL_CALLS, len(tool_calls))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda call: _run_tool_call(tool_fn, call), tool_calls))
+
+
+_TOOL_FEEDBACK_MARKER = "工具调用已执行完成"
+_TOOL_RESULT_PREFIX = "结果如下：\n\n"
+
+
+def _summarize_tool_payload(payload: Dict[str, Any]) -> Tuple[int, List[str]]:
+    """从工具返回的 JSON 中提取结果条数与 chunk 范围"""
+    if "results" in payload:
+        items = payload.get("results") or []
+        count = payload.get("retrieved_count", len(items))
+    else:
+        items = [payload] if payload.get("success") else []
+        count = len(items)
+    chunk_ranges = []
+    for item in items:
+        start_chunk_id = item.get("start_chunk_id")
+        end_chunk_id = item.get("end_chunk_id")
+        if start_chunk_id is None:
+            continue
+        if end_chunk_id is None or end_chunk_id == start_chunk_id:
+            chunk_ranges.append(str(start_chunk_id))
+        else:
+            chunk_ranges.append(f"{start_chunk_id}-{end_chunk_id}")
+    return count, chunk_ranges
+
+
+def _summarize_tool_feedback(content: str, round_number: int) -> str:
+    """将完整的工具反馈压缩为一行摘要，无法解析时退回为截断说明"""
+    total_count = 0
+    chunk_ranges: List[str] = []
+    parsed_any = False
+    search_from = 0
+    while True:
+        prefix_index = content.find(_TOOL_RESULT_PREFIX, search_from)
+        if prefix_index == -1:
+            break
+        payload_start = prefix_index + len(_TOOL_RESULT_PREFIX)
+        search_from = payload_start
+        try:
+            payload, _ = _DECODER.raw_decode(content, payload_start)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(payload, dict):
+            continue
+        count, ranges = _summarize_tool_payload(payload)
+        total_count += count
+        chunk_ranges.extend(ranges)
+        parsed_any = True
+
+    if not parsed_any:
+        return f"工具第{round_number}轮返回: 结果已省略"
+    return f"工具第{round_number}轮返回: {total_count}条结果, chunk_ids=[{', '.join(chunk_ranges)}]"
+
+
+def _tool_result_items(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """统一内容检索（results 列表）与标题检索（单条 content）两种返回结构"""
+    if "results" in payload:
+        return payload.get("results") or []
+    if payload.get("success") and payload.get("content"):
+        return [{**payload, "text": payload.get("content")}]
+    return []
+
+
+def _summarize_tool_response(tool_response: str, round_number: int, preview_chars: int) -> str:
+    """将工具返回压缩为条数、chunk 范围与每条正文预览；无法解析时原样返回"""
+    try:
+        payload = _DECODER.decode(tool_response)
+    except (json.JSONDecodeError, TypeError):
+        return tool_response
+    if not isinstance(payload, dict) or not payload.get("success"):
+        return tool_response
+
+    items = _tool_result_items(payload)
+    _, chunk_ranges = _summarize_tool_payload(payload)
+    lines = [f"工具第{round_number}轮: retrieved_count={len(items)}, chunks=[{', '.join(chunk_ranges)}]"]
+    for item in items:
+        text = item.get("text") or ""
+        preview = text[:preview_chars] + ("……" if len(text) > preview_chars else "")
+        lines.append(
+            f"[chunk {item.get('start_chunk_id')}-{item.get('end_chunk_id')}，"
+            f"页 {item.get('start_page')}-{item.get('end_page')}] {preview}"
+        )
+    lines.append("若需全文请在TOOL_CALL中通过chunk_id范围再次检索")
+    return "\n".join(lines)
+
+
+class ToolResponseStore:
+    """单次对话内的工具结果存档，模型按 chunk_id 范围或相同参数再次检索时直接返回全文"""
+
+    def __init__(self) -> None:
+        self._by_arguments: Dict[str, str] = {}
+        self._by_chunk_range: Dict[Tuple[str, bool, Any, Any], Tuple[Any, Dict[str, Any]]] = {}
+
+    @staticmethod
+    def _range_scope(tool_call: Dict[str, Any]) -> Tuple[str, bool]:
+        """chunk 范围只在同一基金、同一类招募说明书内有意义"""
+        return str(tool_call.get("fund_code") or "").strip(), bool(tool_call.get("is_expansion"))
+
+    def remember(self, tool_call: Dict[str, Any], tool_response: str) -> None:
+        self._by_arguments[ProspectusCache.make_key(tool_call)] = tool_response
+        try:
+            payload = _DECODER.decode(tool_response)
+        except (json.JSONDecodeError, TypeError):
+            return
+        if not isinstance(payload, dict):
+            return
+        scope = self._range_scope(tool_call)
+        for item in _tool_result_items(payload):
+            start_chunk_id = item.get("start_chunk_id")
+            if start_chunk_id is not None:
+                self._by_chunk_range[(*scope, start_chunk_id, item.get("end_chunk_id"))] = (
+                    payload.get("source_file"),
+                    item,
+                )
+
+    def lookup(self, tool_call: Dict[str, Any]) -> str | None:
+        stored = self._by_arguments.get(ProspectusCache.make_key(tool_call))
+        if stored is not None:
+            return stored
+        # 仅处理不带检索词、不扩展上下文的 chunk 范围请求
+        if (tool_call.get("search_info") or "").strip():
+            return None
+        if tool_call.get("expand_before") or tool_call.get("expand_after"):
+            return None
+        hit = self._by_chunk_range.get(
+            (*self._range_scope(tool_call), tool_call.get("start_chunk_id"), tool_call.get("end_chunk_id"))
+        )
+        if hit is None:
+            return None
+        source_file, item = hit
+        result = {
+            "success": True,
+            "source_file": source_file,
+            "error": None,
+            "retrieved_count": 1,
+            "retrieved_summary": "共检索到 1 个文本信息",
+            "results": [
+                {key: item.get(key) for key in ("text", "start_page", "end_page", "start_chunk_id", "end_chunk_id")}
+            ],
+        }
+        return _json_dumps(result)
+
+
+def _prefix_hash(messages: List[Dict[str, Any]]) -> str:
+    """计算系统提示与初始问题（messages[:2]）的摘要"""
+    digest = hashlib.sha1()
+    for message in messages[:2]:
+        digest.update(message["role"].encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(str(message["content"]).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _check_prefix_stable(messages: List[Dict[str, Any]], expected_hash: str, logger: logging.Logger) -> bool:
+    """校验请求前缀未被改动；服务端前缀缓存要求 messages[:2] 每轮逐字节一致"""
+    if _prefix_hash(messages) == expected_hash:
+        return True
+    logger.warning("对话前缀（系统提示/初始问题）已被修改，服务端前缀缓存将失效")
+    return False
+
+
+def _compact_messages(messages: List[Dict[str, Any]], keep_tail: int, logger: logging.Logger) -> None:
+    """滑动窗口压缩对话历史：保留系统提示、初始问题与最近 keep_tail 轮，较早的工具反馈替换为摘要
+
+    只改写 messages[2:] 中的工具反馈，前两条消息保持逐字节不变以命中服务端前缀缓存。
+    """
+    # messages 结构为 [system, user, (assistant, user) * 轮数]，每轮固定追加两条
+    compact_end = len(messages) - 2 * keep_tail
+    compacted = 0
+    for index in range(2, max(compact_end, 2)):
+        message = messages[index]
+        content = message.get("content")
+        if message.get("role") != "user" or not isinstance(content, str):
+            continue
+        if _TOOL_FEEDBACK_MARKER not in content[:32]:
+            continue
+        message["content"] = _summarize_tool_feedback(content, (index - 1) // 2)
+        compacted += 1
+    if compacted:
+        logger.debug("已压缩 %d 条历史工具反馈", compacted)
+
+
 def _chat_with_deepseek_reasoner(
     client: OpenAI,
     model_name: str,
     user_question: str,
-    original_system_prompt: str,
+    enhanced_system_prompt: str,
     tool_registry: Dict[str, Any],
     logger: logging.Logger,
-    max_rounds: int = 20
+    max_rounds: int = 20,
+    compact_keep_tail: int | None = None,
+    feedback_preview_chars: int | None = None
 ) -> Dict[str, Any]:
-    """DeepSeek Reasoner 专用的对话流程"""
-    
-    # 构建增强的系统提示词
-    tools_schema = [PROSPECTUS_SEARCH_TOOL_SPEC]
-    enhanced_system_prompt = build_deepseek_reasoner_enhanced_prompt(original_system_prompt, tools_schema)
+    """DeepSeek Reasoner 专用的对话流程
+
+    compact_keep_tail 不为 None 时按滑动窗口压缩历史工具反馈；
+    feedback_preview_chars 不为 None 时工具结果只反馈摘要与预览，重复检索直接返回存档全文。
+    """
+    response_store = ToolResponseStore() if feedback_preview_chars is not None else None
+
+    def _dispatch_tool(tool_call: Dict[str, Any]) -> Tuple[str, bool]:
+        """执行工具调用，返回 (工具结果, 是否来自本次对话存档)"""
+        if response_store is not None:
+            stored = response_store.lookup(tool_call)
+            if stored is not None:
+                logger.info("本次对话已检索过该内容，直接返回存档全文")
+                return stored, True
+        tool_response = tool_registry[TOOL_NAME](tool_call)
+        if response_store is not None:
+            response_store.remember(tool_call, tool_response)
+        return tool_response, False
+
+    def _feedback_body(tool_response: str, replayed: bool) -> str:
+        """首次检索的结果在精简模式下只反馈摘要；模型再次请求的存档内容反馈全文"""
+        if feedback_preview_chars is None or replayed:
+            return tool_response
+        return _summarize_tool_response(tool_response, round_index, feedback_preview_chars)
     
     # 初始化对话
     messages = [
@@ -419,6 +969,8 @@ def _chat_with_deepseek_reasoner(
         {"role": "user", "content": user_question}
     ]
     
+    prefix_hash = _prefix_hash(messages)
+    
     # 结果记录
     conversation_rounds = []
     all_reasoning = []
@@ -426,13 +978,11 @@ def _chat_with_deepseek_reasoner(
     
     for round_index in range(1, max_rounds + 1):
         logger.info(f"=== 第 {round_index} 轮 DeepSeek Reasoner 对话 ===")
+        _check_prefix_stable(messages, prefix_hash, logger)
         
-        # 调用模型（不传递 tools 参数以获取推理过程）
+        # 流式调用模型（不传递 tools 参数以获取推理过程）
         try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages
-            )
+            reasoning_content, content = _stream_reasoner_response(client, model_name, messages)
         except Exception as e:
             logger.error(f"第 {round_index} 轮调用模型失败: {e}")
             return {
@@ -445,13 +995,6 @@ def _chat_with_deepseek_reasoner(
                 "total_rounds": round_index - 1
             }
         
-        choice = response.choices[0]
-        message = choice.message
-        
-        # 提取推理内容和回复内容
-        reasoning_content = getattr(message, 'reasoning_content', '') or ''
-        content = getattr(message, 'content', '') or ''
-        
         if reasoning_content:
             logger.info(f"第 {round_index} 轮推理过程:\n{reasoning_content}")
             all_reasoning.append(f"=== 第 {round_index} 轮推理 ===\n{reasoning_content}")
@@ -468,10 +1011,10 @@ def _chat_with_deepseek_reasoner(
             "response_content": content,
             "parsed_analysis": parsed["analysis"],
             "parsed_type": parsed["type"],
-            "tool_call_params": parsed.get("tool_call"),
+            "tool_call_params": parsed.get("tool_call") or parsed.get("tool_calls"),
             "final_answer": parsed.get("final_answer"),
             "errors": parsed["errors"],
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "timestamp_ns": time.time_ns()
         }
         conversation_rounds.append(round_data)
         
@@ -482,11 +1025,11 @@ def _chat_with_deepseek_reasoner(
         if parsed["type"] == "tool_call":
             # 执行工具调用
             tool_call = parsed["tool_call"]
-            logger.info(f"执行工具调用: {json.dumps(tool_call, ensure_ascii=False)}")
+            logger.info(f"执行工具调用: {_json_dumps(tool_call)}")
             
             try:
                 # 执行工具
-                tool_response = tool_registry[TOOL_NAME](tool_call)
+                tool_response, replayed = _dispatch_tool(tool_call)
                 tool_call_record = {
                     "round": round_index,
                     "params": tool_call,
@@ -500,8 +1043,10 @@ def _chat_with_deepseek_reasoner(
                 conversation_rounds[-1]["tool_success"] = True
                 
                 # 将工具结果返回给模型
-                tool_feedback = f"工具调用已执行完成，结果如下：\n\n{tool_response}\n\n请基于此结果继续分析或给出最终答案。记住要按照指定格式输出。"
+                tool_feedback = f"工具调用已执行完成，结果如下：\n\n{_feedback_body(tool_response, replayed)}\n\n请基于此结果继续分析或给出最终答案。记住要按照指定格式输出。"
                 messages.append({"role": "user", "content": tool_feedback})
+                if compact_keep_tail is not None:
+                    _compact_messages(messages, compact_keep_tail, logger)
                 
                 logger.info("工具调用成功，已将结果反馈给模型")
                 
@@ -524,6 +1069,47 @@ def _chat_with_deepseek_reasoner(
                 retry_feedback = f"{error_msg}\n\n请检查参数并重试，或采用其他检索策略。记住要按照指定格式输出。"
                 messages.append({"role": "user", "content": retry_feedback})
         
+        elif parsed["type"] == "tool_calls":
+            # 并行执行本轮全部工具调用
+            tool_calls = parsed["tool_calls"]
+            logger.info(f"并行执行 {len(tool_calls)} 个工具调用: {_json_dumps(tool_calls)}")
+            outcomes = _run_tool_calls_parallel(_dispatch_tool, tool_calls)
+
+            feedback_sections = []
+            execution_results = []
+            for position, (tool_call, (success, payload)) in enumerate(zip(tool_calls, outcomes), start=1):
+                tool_response = payload[0] if success else None
+                tool_call_record = {
+                    "round": round_index,
+                    "params": tool_call,
+                    "result": tool_response,
+                    "success": success
+                }
+                if success:
+                    feedback_sections.append(f"【调用 {position}】结果如下：\n\n{_feedback_body(*payload)}")
+                    execution_results.append(tool_response)
+                else:
+                    error_msg = f"工具调用失败: {payload}"
+                    logger.error(f"第 {position} 个并行调用失败: {payload}")
+                    tool_call_record["error"] = payload
+                    feedback_sections.append(f"【调用 {position}】{error_msg}")
+                    execution_results.append(error_msg)
+                tool_calls_made.append(tool_call_record)
+
+            all_success = all(success for success, _ in outcomes)
+            conversation_rounds[-1]["tool_execution_result"] = execution_results
+            conversation_rounds[-1]["tool_success"] = all_success
+
+            tool_feedback = (
+                f"{len(tool_calls)} 个工具调用已执行完成，结果按调用顺序如下：\n\n"
+                + "\n\n".join(feedback_sections)
+                + "\n\n请基于这些结果继续分析或给出最终答案。记住要按照指定格式输出。"
+            )
+            messages.append({"role": "user", "content": tool_feedback})
+            if compact_keep_tail is not None:
+                _compact_messages(messages, compact_keep_tail, logger)
+            logger.info("并行工具调用完成，已将结果反馈给模型")
+
         elif parsed["type"] == "final_answer":
             # 获得最终答案，结束对话
             logger.info("获得最终答案，对话成功结束")
@@ -546,6 +1132,9 @@ def _chat_with_deepseek_reasoner(
                 "1. 如需调用工具，使用格式：\n"
                 "TOOL_CALL:\n"
                 "{ 仅填写本轮需要的参数 }\n\n"
+                "   如需同时发起多个互不依赖的检索，使用格式：\n"
+                "TOOL_CALLS:\n"
+                "[{ 检索一的参数 }, { 检索二的参数 }]\n\n"
                 "2. 如给出最终答案，使用格式：\n"
                 "FINAL_ANSWER:\n"
                 "具体答案内容"
@@ -567,22 +1156,267 @@ def _chat_with_deepseek_reasoner(
     }
 
 
-def _invoke_tool_with_logging(arguments: Dict[str, Any], logger: logging.Logger) -> str:
-    """调用工具并记录日志，默认返回 JSON 字符串"""
+class ProspectusCache:
+    """基于 SQLite 的工具结果缓存，按规范化入参去重，超出容量时淘汰最久未访问的记录"""
+
+    def __init__(self, cache_dir: Path, max_entries: int = 2000) -> None:
+        _ensure_dir(cache_dir)
+        self.path = cache_dir / "prospectus_tool_cache.sqlite3"
+        self.max_entries = max_entries
+        # 并行工具调用会跨线程访问同一连接，统一由锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache(k TEXT PRIMARY KEY, v TEXT, ts REAL)")
+        self._conn.commit()
+
+    # 与工具默认值相同的参数不参与缓存键，缺省与显式传默认值视为同一次调用
+    _ARGUMENT_DEFAULTS: Dict[str, Any] = {"search_info": "", "is_expansion": False, "expand_before": 0, "expand_after": 0}
+
+    @staticmethod
+    def make_key(arguments: Dict[str, Any]) -> str:
+        """对入参做规范化（去除空值与默认值、检索信息压缩空白）后取摘要作为键"""
+        normalized = {key: value for key, value in arguments.items() if value is not None}
+        search_info = normalized.get("search_info")
+        if isinstance(search_info, str):
+            normalized["search_info"] = " ".join(search_info.split())
+        is_expansion = normalized.get("is_expansion")
+        if isinstance(is_expansion, str):
+            normalized["is_expansion"] = is_expansion.strip().lower() in ("true", "1", "yes", "是")
+        fund_code = normalized.get("fund_code")
+        if fund_code is not None:
+            normalized["fund_code"] = str(fund_code).strip()
+        for key, default in ProspectusCache._ARGUMENT_DEFAULTS.items():
+            if key in normalized and normalized[key] == default:
+                del normalized[key]
+        canonical = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT v FROM cache WHERE k = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE cache SET ts = ? WHERE k = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache(k, v, ts) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM cache WHERE k IN (SELECT k FROM cache ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _invoke_tool_with_logging(
+    arguments: Dict[str, Any],
+    logger: logging.Logger,
+    cache: ProspectusCache | None = None,
+) -> str:
+    """调用工具并记录日志，默认返回 JSON 字符串；启用缓存时优先返回缓存结果"""
     logger.info(
         "调用工具 %s，入参: %s",
         TOOL_NAME,
-        json.dumps(arguments, ensure_ascii=False, sort_keys=True),
+        _json_dumps(arguments, sort_keys=LOG_CANONICAL),
     )
+    cache_key = ProspectusCache.make_key(arguments) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("工具缓存命中: %s", cache_key)
+            logger.info("工具返回: %s", cached)
+            return cached
+        logger.info("工具缓存未命中: %s", cache_key)
+
     result = call_prospectus_search(arguments, return_json=True)
     logger.info("工具返回: %s", result)
+    # 仅缓存成功结果：ES/MySQL/LLM 临时故障导致的失败不能永久写入缓存
+    if cache is not None and _is_successful_result(result):
+        cache.put(cache_key, result)
     return result
 
 
+def _is_successful_result(result: str) -> bool:
+    """工具返回的 JSON 中 success 为 true 时返回 True"""
+    try:
+        payload = _DECODER.decode(result)
+    except (json.JSONDecodeError, TypeError):
+        return False
+    return isinstance(payload, dict) and payload.get("success") is True
+
+
+def _format_timestamp_ns(timestamp_ns: int | None) -> str | None:
+    """将轮次记录的纳秒时间戳格式化为本地时间字符串，仅在输出时调用"""
+    if timestamp_ns is None:
+        return None
+    return datetime.fromtimestamp(timestamp_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _build_rounds_payload(reasoner_result: Dict[str, Any] | None) -> List[Dict[str, Any]]:
+    """将对话轮次记录整理为输出 JSON 中的 rounds 列表"""
+    rounds_payload: List[Dict[str, Any]] = []
+    if not reasoner_result:
+        return rounds_payload
+
+    for round_entry in reasoner_result.get("conversation_rounds", []):
+        tool_params = round_entry.get("tool_call_params")
+        tool_call_payload = None
+        if tool_params:
+            tool_call_payload = {
+                "name": TOOL_NAME,
+                "arguments": tool_params,
+            }
+
+        tool_exec_result = round_entry.get("tool_execution_result")
+        tool_response_payload = None
+        if tool_exec_result is not None:
+            tool_response_payload = {
+                "raw": tool_exec_result,
+                "success": round_entry.get("tool_success"),
+            }
+
+        rounds_payload.append(
+            {
+                "round": round_entry.get("round_number"),
+                "timestamp": _format_timestamp_ns(round_entry.get("timestamp_ns")),
+                "think": round_entry.get("reasoning_content") or None,
+                "assistant_reply": round_entry.get("response_content") or None,
+                "tool_call": tool_call_payload,
+                "tool_response": tool_response_payload,
+            }
+        )
+    return rounds_payload
+
+
+def _relative_log_path(log_path: Path | None) -> str | None:
+    """日志文件相对脚本目录的路径，不在脚本目录下时返回绝对路径"""
+    if log_path is None:
+        return None
+    try:
+        return str(log_path.relative_to(Path(__file__).resolve().parent))
+    except ValueError:
+        return str(log_path)
+
+
+def load_batch_questions(path: Path) -> List[str]:
+    """读取批量问题文件（JSONL），每行为问题字符串或包含 question 字段的对象"""
+    questions: List[str] = []
+    with path.open("r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            question = item.get("question") if isinstance(item, dict) else item
+            if isinstance(question, str) and question.strip():
+                questions.append(question.strip())
+    return questions
+
+
+def _run_question_batch(
+    args: argparse.Namespace,
+    client: OpenAI,
+    model_name: str,
+    system_prompt: str,
+    tool_registry: Dict[str, Any],
+    logger: logging.Logger,
+    log_path: Path,
+) -> None:
+    """在同一进程内并发处理多个问题，共享系统提示词、模型客户端与工具实例，结果写入一个合并 JSON"""
+    questions = load_batch_questions(args.questions_file)
+    logger.info("批量评测：共 %d 个问题，并发数 %d", len(questions), args.concurrency)
+    run_started_at = datetime.now().isoformat()
+
+    def _run_one(question: str) -> Dict[str, Any]:
+        try:
+            return _chat_with_deepseek_reasoner(
+                client,
+                model_name,
+                build_user_prompt(question, args.is_expansion),
+                system_prompt,
+                tool_registry,
+                logger,
+                max_rounds=args.max_rounds,
+                compact_keep_tail=args.keep_tail if args.compact_history else None,
+                feedback_preview_chars=args.feedback_preview_chars if args.compact_tool_feedback else None,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("问题处理失败: %s", question)
+            return {"success": False, "error": str(exc), "final_answer": "", "conversation_rounds": []}
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        results = list(executor.map(_run_one, questions))
+
+    entries = []
+    for question, reasoner_result in zip(questions, results):
+        entries.append(
+            {
+                "question": question,
+                "rounds": _build_rounds_payload(reasoner_result),
+                "final_answer": reasoner_result.get("final_answer", "") or "",
+                "success": bool(reasoner_result.get("success")),
+                "error": reasoner_result.get("error"),
+            }
+        )
+    success_count = sum(1 for entry in entries if entry["success"])
+    logger.info("批量评测完成：成功 %d / %d", success_count, len(entries))
+
+    output_payload = {
+        "run_id": log_path.stem,
+        "run_started_at": run_started_at,
+        "run_finished_at": datetime.now().isoformat(),
+        "questions_file": str(args.questions_file),
+        "success_count": success_count,
+        "results": entries,
+        "log_file": _relative_log_path(log_path),
+    }
+    _persist_output(OUTPUT_DIR / f"{log_path.stem}_batch.json", output_payload, logger)
+
+
 def main() -> None:
     args = _parse_arguments()
     logger, log_path = setup_logging()
 
+    system_prompt = build_cached_enhanced_prompt(args.qa_file, logger)
+    logger.debug("系统提示词:\n%s", system_prompt)
+
+    model_cfg = _extract_model_config(args.provider, args.model)
+    http_client = _build_http_client()
+    client = OpenAI(api_key=model_cfg.api_key, base_url=model_cfg.base_url, http_client=http_client)
+
+    tool_cache = ProspectusCache(args.cache_dir) if args.cache_dir is not None else None
+    if tool_cache is not None:
+        logger.info("已启用工具结果缓存: %s", tool_cache.path)
+
+    tool_registry = {
+        TOOL_NAME: lambda tool_args: _invoke_tool_with_logging(tool_args, logger, tool_cache),
+    }
+
+    if args.questions_file is not None:
+        try:
+            if args.provider.lower() != "deepseek" or "reasoner" not in model_cfg.model.lower():
+                raise SystemExit(
+                    f"当前脚本仅支持 DeepSeek Reasoner 模型，实际配置: provider={args.provider}, "
+                    f"model={model_cfg.model}"
+                )
+            _run_question_batch(args, client, model_cfg.model, system_prompt, tool_registry, logger, log_path)
+        finally:
+            if tool_cache is not None:
+                tool_cache.close()
+            http_client.close()
+            shutdown_tool()
+            logger.info("已关闭工具相关连接")
+        return
+
     question = args.question if args.question is not None else DEFAULT_TEST_QUESTION
     if args.question is None:
         logger.info("未通过命令行提供问题，使用 DEFAULT_TEST_QUESTION: %s", question)
@@ -595,33 +1429,21 @@ def main() -> None:
         args.model,
     )
 
-    qas = load_reference_qas(args.qa_file, logger)
-    reference_text = format_reference_text(qas)
-    system_prompt = build_system_prompt(reference_text)
     user_prompt = build_user_prompt(question, args.is_expansion)
-
-    logger.debug("系统提示词:\n%s", system_prompt)
     logger.info("用户初始消息:\n%s", user_prompt)
 
-    model_cfg = _extract_model_config(args.provider, args.model)
-    client = OpenAI(api_key=model_cfg["api_key"], base_url=model_cfg["base_url"])
-
-    tool_registry = {
-        TOOL_NAME: lambda tool_args: _invoke_tool_with_logging(tool_args, logger),
-    }
-
     run_started_at = datetime.now().isoformat()
     reasoner_result: Dict[str, Any] | None = None
     error_message: str | None = None
 
     try:
         provider_lower = args.provider.lower()
-        model_lower = model_cfg["model"].lower()
+        model_lower = model_cfg.model.lower()
 
         if provider_lower != "deepseek" or "reasoner" not in model_lower:
             msg = (
                 f"当前脚本仅支持 DeepSeek Reasoner 模型，实际配置: provider={args.provider}, "
-                f"model={model_cfg['model']}"
+                f"model={model_cfg.model}"
             )
             reasoner_result = {
                 "success": False,
@@ -637,12 +1459,14 @@ def main() -> None:
 
         reasoner_result = _chat_with_deepseek_reasoner(
             client,
-            model_cfg["model"],
+            model_cfg.model,
             user_prompt,
             system_prompt,
             tool_registry,
             logger,
             max_rounds=args.max_rounds,
+            compact_keep_tail=args.keep_tail if args.compact_history else None,
+            feedback_preview_chars=args.feedback_preview_chars if args.compact_tool_feedback else None,
         )
     except Exception as exc:  # noqa: BLE001
         error_message = str(exc)
@@ -684,35 +1508,7 @@ def main() -> None:
     finally:
         run_finished_at = datetime.now().isoformat()
 
-        rounds_payload: List[Dict[str, Any]] = []
-        if reasoner_result:
-            for round_entry in reasoner_result.get("conversation_rounds", []):
-                tool_params = round_entry.get("tool_call_params")
-                tool_call_payload = None
-                if tool_params:
-                    tool_call_payload = {
-                        "name": TOOL_NAME,
-                        "arguments": tool_params,
-                    }
-
-                tool_exec_result = round_entry.get("tool_execution_result")
-                tool_response_payload = None
-                if tool_exec_result is not None:
-                    tool_response_payload = {
-                        "raw": tool_exec_result,
-                        "success": round_entry.get("tool_success"),
-                    }
-
-                rounds_payload.append(
-                    {
-                        "round": round_entry.get("round_number"),
-                        "timestamp": round_entry.get("timestamp"),
-                        "think": round_entry.get("reasoning_content") or None,
-                        "assistant_reply": round_entry.get("response_content") or None,
-                        "tool_call": tool_call_payload,
-                        "tool_response": tool_response_payload,
-                    }
-                )
+        rounds_payload = _build_rounds_payload(reasoner_result)
 
         if reasoner_result:
             final_answer = reasoner_result.get("final_answer", "") or ""
@@ -723,13 +1519,7 @@ def main() -> None:
             success_flag = False
             error_text = error_message
 
-        base_dir = Path(__file__).resolve().parent
-        log_rel_path = None
-        if log_path is not None:
-            try:
-                log_rel_path = str(log_path.relative_to(base_dir))
-            except ValueError:
-                log_rel_path = str(log_path)
+        log_rel_path = _relative_log_path(log_path)
 
         output_payload = {
             "question": question,
@@ -743,21 +1533,24 @@ def main() -> None:
             "log_file": log_rel_path,
         }
 
-        try:
-            OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-            if log_path is not None:
-                output_filename = f"{log_path.stem}.json"
-            else:
-                output_filename = f"prospectus_tool_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            output_path = OUTPUT_DIR / output_filename
-            with output_path.open("w", encoding="utf-8") as output_file:
-                json.dump(output_payload, output_file, ensure_ascii=False, indent=2)
-            logger.info("会话记录已保存至: %s", output_path)
-        except Exception as json_exc:  # noqa: BLE001
-            logger.exception("保存会话 JSON 失败: %s", json_exc)
+        if log_path is not None:
+            output_filename = f"{log_path.stem}.json"
+        else:
+            output_filename = f"prospectus_tool_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        # 会话记录写盘与连接关闭互不依赖，放到后台线程并行进行
+        persist_thread = threading.Thread(
+            target=_persist_output,
+            args=(OUTPUT_DIR / output_filename, output_payload, logger),
+            name="persist-output",
+        )
+        persist_thread.start()
 
+        if tool_cache is not None:
+            tool_cache.close()
+        http_client.close()
         shutdown_tool()
         logger.info("已关闭工具相关连接")
+        persist_thread.join()
 
 
 if __name__ == "__main__":
@@ -22,6 +22,7 @@
 版本：1.0.0
 """
 
+from .utils.log_utils import enable_queue_logging
 from .prospectus_search_tool import ProspectusSearchTool
 from .tool_entry import (
     PROSPECTUS_SEARCH_TOOL_SPEC,
@@ -30,6 +31,9 @@ from .tool_entry import (
     shutdown_tool
 )
 
+# 包日志经后台线程写出到 stdout；如需交由应用自身的日志配置处理，调用 utils.disable_queue_logging()
+enable_queue_logging()
+
 __version__ = "1.0.0"
 __author__ = "Your Name"
 __email__ = "your.email@example.com"
@@ -5,34 +5,41 @@
 负责招募说明书目录内容的检索和识别
 """
 
-import sys
 import os
-from typing import List, Dict, Any, Optional
-from elasticsearch import Elasticsearch
+import json
+import logging
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
 
-# 设置路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
+from .es_client import get_es_client
+from ..utils.llm_utils import LLMUtils
+from ..utils.page_utils import PageUtils
 
-from db_config import get_elasticsearch_config
-from utils.llm_utils import LLMUtils
-from utils.page_utils import PageUtils
+logger = logging.getLogger(__name__)
+
+# 目录语块位置缓存文件路径，未配置时缓存仅保存在内存中
+DIRECTORY_CACHE_PATH = os.environ.get('DIRECTORY_CACHE_PATH') or None
+
+
+def _is_directory_candidate(text: str) -> bool:
+    """文本同时包含"目"和"录"即为候选目录块
+    
+    先查"录"：招募说明书中"目"随"项目"等词大量出现，"录"则少得多，
+    绝大多数非候选块只需一次子串扫描即可排除
+    """
+    return "录" in text and "目" in text
 
 
 class DirectorySearcher:
     """目录检索类"""
     
-    def __init__(self, llm_client, llm_model):
-        """初始化目录检索器"""
-        # ES连接配置
-        self.es_config = get_elasticsearch_config()
-        self.es = Elasticsearch(
-            [f"{self.es_config['scheme']}://{self.es_config['host']}:{self.es_config['port']}"],
-            basic_auth=(self.es_config['username'], self.es_config['password']),
-            verify_certs=False,
-            ssl_show_warn=False
-        )
+    def __init__(self, llm_client, llm_model, cache_path: Optional[str] = DIRECTORY_CACHE_PATH):
+        """初始化目录检索器，cache_path 为目录位置缓存文件路径，为 None 时只在内存中缓存"""
+        # 共享ES客户端（压缩+长连接），由 ProspectusSearchTool.close_connections 统一关闭
+        self.es = get_es_client()
         
         # LLM客户端
         self.llm_client = llm_client
@@ -42,132 +49,457 @@ class DirectorySearcher:
         self.es_index = "reits_announcements"
         self.chunks_before = 0  # 目录块向前扩展
         self.chunks_after = 7   # 目录块向后扩展
+        self.candidate_size = 50  # ES端候选目录语块上限
+        self.llm_check_workers = 4  # 并发进行LLM目录判断的候选数
+        self.batch_snippet_chars = 800  # 批量目录判断时每个候选片段的字符上限
+        
+        # 目录语块位置缓存：(fund_code, source_file, 索引版本) -> 目录chunk_id
+        self._dir_cache_path = Path(cache_path) if cache_path else None
+        self._dir_cache = self._load_directory_cache()
+        self._dir_cache_lock = threading.Lock()
+        self._index_version: Optional[str] = None
         
-        print("[DirectorySearcher] 目录检索器初始化完成")
+        logger.debug("目录检索器初始化完成")
     
     def get_directory_content(self, fund_code: str, source_file: str) -> Dict[str, Any]:
         """获取目录内容"""
+        return self._get_directory_content(fund_code, source_file)
+    
+    def get_directory_content_many(self, files: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """批量获取多个 (fund_code, source_file) 的目录内容，结果与输入顺序一致
         
-        print(f"[DirectorySearcher] 开始获取目录内容...")
+        未命中目录位置缓存的文件，其候选目录语块查询合并为一次msearch
+        """
+        uncached = [
+            (fund_code, source_file) for fund_code, source_file in files
+            if self._directory_cache_key(fund_code, source_file) not in self._dir_cache
+        ]
+        prefetched = self._get_directory_candidates_many(uncached) if uncached else {}
+        return [
+            self._get_directory_content(fund_code, source_file, prefetched.get((fund_code, source_file)))
+            for fund_code, source_file in files
+        ]
+    
+    def _get_directory_content(
+        self,
+        fund_code: str,
+        source_file: str,
+        prefetched: Optional[Tuple[List, Optional[str]]] = None
+    ) -> Dict[str, Any]:
+        """获取目录内容，prefetched 为批量查询预取的 (候选语块, 文件名字段)"""
+        
+        logger.info("开始获取目录内容...")
         
         try:
-            # 1. 从ES获取该文件的所有语块，按chunk_id升序
-            hits = self._get_file_chunks_from_es(fund_code, source_file)
-            if not hits:
-                return self._create_error_result("ES中未找到该文件的语块数据")
-            
-            print(f"[DirectorySearcher] 从ES获取到 {len(hits)} 个语块")
-            
-            # 2. 确保按chunk_id升序排序
-            hits.sort(key=lambda h: h['_source']['chunk_id'])
-            
-            # 3. 构建chunk_id到text的映射，便于后续扩展
-            id2text = {h['_source']['chunk_id']: h['_source']['text'] for h in hits}
+            # 0. 命中目录位置缓存时直接扩展，跳过候选筛选与LLM判断
+            cache_key = self._directory_cache_key(fund_code, source_file)
+            cached_chunk_id = self._dir_cache.get(cache_key)
+            if cached_chunk_id is not None:
+                logger.info("命中目录位置缓存: chunk %s", cached_chunk_id)
+                hits = self._get_expansion_chunks_from_es(fund_code, source_file, cached_chunk_id)
+                id2hit = {h['_source']['chunk_id']: h for h in hits}
+                if cached_chunk_id in id2hit:
+                    return self._build_directory_result(source_file, cached_chunk_id, id2hit)
+                logger.warning("缓存的目录语块已不存在，重新识别")
             
-            # 4. 筛选包含"目"和"录"的候选语块
-            candidates = [h for h in hits if ("目" in h['_source']['text'] and "录" in h['_source']['text'])]
-            
-            print(f"[DirectorySearcher] 关键词筛选后候选语块 {len(candidates)} 个")
-            
-            if not candidates:
-                return self._create_error_result("未找到包含目录关键词的语块")
-            
-            # 5. 使用LLM逐个判断哪个是真正的目录语块
+            # 1. 优先由ES直接筛选包含"目录"的候选语块，仅再取候选块附近的语块
+            if prefetched is not None:
+                candidates, source_field = prefetched
+            else:
+                candidates, source_field = self._get_directory_candidates_from_es(fund_code, source_file)
+            hits = []
             directory_chunk = None
             llm_check_times = 0
+            if candidates:
+                needed_ids = {
+                    chunk_id
+                    for h in candidates
+                    for chunk_id in range(
+                        h['_source']['chunk_id'] - self.chunks_before,
+                        h['_source']['chunk_id'] + self.chunks_after + 1
+                    )
+                }
+                hits = self._get_chunks_by_ids_from_es(fund_code, source_file, source_field, needed_ids)
             
-            for chunk in candidates:
-                llm_check_times += 1
-                chunk_id = chunk['_source']['chunk_id']
-                preview = chunk['_source']['text'][:200].replace("\n", " ")
-                print(f"[DirectorySearcher] 检查候选chunk {chunk_id}: {preview}...")
+            if hits:
+                logger.info("从ES获取到 %d 个语块", len(hits))
                 
-                # 扩展当前语块+后2块用于LLM判断
-                combined_text = (
-                    chunk['_source']['text'] + 
-                    id2text.get(chunk_id + 1, "") + 
-                    id2text.get(chunk_id + 2, "")
-                )
+                # 2. ES查询均按chunk_id升序返回，无需本地再排序
+                # 3. 构建chunk_id到语块/text的映射，便于后续判断与扩展
+                id2hit = {h['_source']['chunk_id']: h for h in hits}
+                id2text = {chunk_id: h['_source']['text'] for chunk_id, h in id2hit.items()}
                 
-                if self._is_directory_chunk_by_llm(combined_text):
-                    directory_chunk = chunk
-                    print(f"[DirectorySearcher] 确定目录语块: chunk {chunk_id}")
-                    break
-            
-            print(f"[DirectorySearcher] 共进行 {llm_check_times} 次LLM目录判断")
+                logger.info("关键词筛选后候选语块 %d 个", len(candidates))
+                
+                # 4. 使用LLM判断哪个是真正的目录语块（按顺序取第一个判定为目录的候选）
+                directory_chunk, llm_check_times = self._find_directory_chunk(candidates, id2text)
             
             if directory_chunk is None:
-                return self._create_error_result("LLM未能识别出目录语块")
-            
-            # 6. 扩展目录语块获取完整目录内容
-            dir_chunk_id = directory_chunk['_source']['chunk_id']
-            start_chunk_id = dir_chunk_id - self.chunks_before  # 向前扩展0块
-            end_chunk_id = dir_chunk_id + self.chunks_after     # 向后扩展7块
-            
-            # 筛选扩展范围内的语块
-            expanded_chunks = [h for h in hits if start_chunk_id <= h['_source']['chunk_id'] <= end_chunk_id]
-            
-            if not expanded_chunks:
-                return self._create_error_result("扩展目录语块失败")
+                # 回退：ES端未命中或候选均被LLM否定（如"详见目录"的引用）时，分页顺序扫描全部语块，
+                # 在本地按"目"/"录"筛选并边扫描边判断，已判断过的ES候选不再重复判断
+                checked_ids = {h['_source']['chunk_id'] for h in candidates} if hits else set()
+                hits, directory_chunk, candidate_count, scan_check_times = self._scan_file_for_directory(
+                    fund_code, source_file, checked_ids
+                )
+                llm_check_times += scan_check_times
+                if not hits:
+                    return self._create_error_result("ES中未找到该文件的语块数据")
+                logger.info("分页扫描获取到 %d 个语块，候选语块 %s 个", len(hits), candidate_count)
+                if not candidate_count and not checked_ids:
+                    return self._create_error_result("未找到包含目录关键词的语块")
+                id2hit = {h['_source']['chunk_id']: h for h in hits}
             
-            # 7. 拼接完整目录文本
-            directory_text = "".join(h['_source']['text'] for h in expanded_chunks)
+            if directory_chunk is not None:
+                logger.info("确定目录语块: chunk %s", directory_chunk['_source']['chunk_id'])
             
-            # 8. 计算页码信息
-            start_page, end_page = PageUtils.calculate_page_range(expanded_chunks)
-            actual_start_chunk_id = expanded_chunks[0]['_source']['chunk_id']
-            actual_end_chunk_id = expanded_chunks[-1]['_source']['chunk_id']
+            logger.info("共进行 %s 次LLM目录判断", llm_check_times)
             
-            print(f"[DirectorySearcher] 目录内容获取成功，文本长度: {len(directory_text)}")
-            print(f"[DirectorySearcher] 页码范围: {start_page}-{end_page}, chunk范围: {actual_start_chunk_id}-{actual_end_chunk_id}")
+            if directory_chunk is None:
+                return self._create_error_result("LLM未能识别出目录语块")
             
-            return self._create_success_result(
-                source_file=source_file,
-                content=directory_text,
-                start_page=start_page,
-                end_page=end_page,
-                start_chunk_id=actual_start_chunk_id,
-                end_chunk_id=actual_end_chunk_id
-            )
+            dir_chunk_id = directory_chunk['_source']['chunk_id']
+            self._store_directory_cache(cache_key, dir_chunk_id)
+            return self._build_directory_result(source_file, dir_chunk_id, id2hit)
             
         except Exception as e:
             error_msg = f"获取目录内容时发生异常: {str(e)}"
-            print(f"[DirectorySearcher] {error_msg}")
+            logger.error(error_msg)
             return self._create_error_result(error_msg)
     
-    def _get_file_chunks_from_es(self, fund_code: str, source_file: str) -> List:
-        """从ES获取指定文件的所有语块"""
+    def _find_directory_chunk(self, candidates: List, id2text: Dict[int, str]) -> Tuple[Optional[Dict[str, Any]], int]:
+        """进行LLM目录判断，返回按chunk_id顺序第一个判定为目录的候选及判断次数
+        
+        多个候选时先用一次批量调用判断；批量响应无法解析时再并发逐个判断：
+        同时最多 llm_check_workers 个请求在途，一旦某候选为目录且其之前的候选均已判定为否，
+        即取消尚未开始的判断并返回
+        """
+        def _combined_text(chunk: Dict[str, Any]) -> str:
+            # 扩展当前语块+后2块用于LLM判断
+            chunk_id = chunk['_source']['chunk_id']
+            return (
+                chunk['_source']['text'] + 
+                id2text.get(chunk_id + 1, "") + 
+                id2text.get(chunk_id + 2, "")
+            )
+        
+        def _check(chunk: Dict[str, Any]) -> bool:
+            chunk_id = chunk['_source']['chunk_id']
+            preview = chunk['_source']['text'][:200].replace("\n", " ")
+            logger.debug("检查候选chunk %s: %s...", chunk_id, preview)
+            return self._is_directory_chunk_by_llm(_combined_text(chunk))
+        
+        if len(candidates) == 1:
+            return (candidates[0] if _check(candidates[0]) else None), 1
+        
+        snippets = [_combined_text(chunk)[:self.batch_snippet_chars] for chunk in candidates]
+        batch_index = self._find_directory_index_by_llm_batch(snippets)
+        if batch_index is not None:
+            return (candidates[batch_index] if batch_index >= 0 else None), 1
+        logger.warning("批量目录判断结果无法解析，回退为逐个判断")
+        
+        results: Dict[int, bool] = {}
+        pending: Dict[Any, int] = {}
+        next_index = 0
+        resolved_index = 0  # 该下标之前的候选均已判定为否
+        check_times = 1  # 计入失败的批量判断
+        
+        executor = ThreadPoolExecutor(max_workers=self.llm_check_workers)
+        try:
+            while True:
+                while next_index < len(candidates) and len(pending) < self.llm_check_workers:
+                    pending[executor.submit(_check, candidates[next_index])] = next_index
+                    next_index += 1
+                if not pending:
+                    return None, check_times
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+                    check_times += 1
+                
+                while resolved_index in results:
+                    if results[resolved_index]:
+                        return candidates[resolved_index], check_times
+                    resolved_index += 1
+        finally:
+            # 已判定出结果时不再等待在途请求
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _build_directory_result(self, source_file: str, dir_chunk_id: int, id2hit: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        """以目录语块为起点扩展并拼接完整目录内容，id2hit为chunk_id到语块的映射"""
+        # 5. 扩展目录语块获取完整目录内容
+        start_chunk_id = dir_chunk_id - self.chunks_before  # 向前扩展0块
+        end_chunk_id = dir_chunk_id + self.chunks_after     # 向后扩展7块
+        
+        # 按扩展范围逐个查表，无需遍历全部语块
+        expanded_chunks = [
+            id2hit[chunk_id] for chunk_id in range(start_chunk_id, end_chunk_id + 1) if chunk_id in id2hit
+        ]
+        
+        if not expanded_chunks:
+            return self._create_error_result("扩展目录语块失败")
+        
+        # 6. 拼接完整目录文本
+        directory_text = "".join([h['_source']['text'] for h in expanded_chunks])
+        
+        # 7. 计算页码信息
+        start_page, end_page = PageUtils.calculate_page_range(expanded_chunks)
+        actual_start_chunk_id = expanded_chunks[0]['_source']['chunk_id']
+        actual_end_chunk_id = expanded_chunks[-1]['_source']['chunk_id']
+        
+        logger.info("目录内容获取成功，文本长度: %d", len(directory_text))
+        logger.info("页码范围: %s-%s, chunk范围: %s-%s", start_page, end_page, actual_start_chunk_id, actual_end_chunk_id)
+        
+        return self._create_success_result(
+            source_file=source_file,
+            content=directory_text,
+            start_page=start_page,
+            end_page=end_page,
+            start_chunk_id=actual_start_chunk_id,
+            end_chunk_id=actual_end_chunk_id
+        )
+    
+    def _directory_cache_key(self, fund_code: str, source_file: str) -> Optional[str]:
+        """目录位置缓存键，包含索引版本以便索引重建后自动失效；无法获取索引版本时返回None（不缓存）"""
+        if self._index_version is None:
+            try:
+                settings = self.es.indices.get_settings(index=self.es_index)
+                index_settings = next(iter(settings.values()))['settings']['index']
+                self._index_version = f"{index_settings.get('uuid')}:{index_settings.get('creation_date')}"
+            except Exception as e:
+                logger.error("获取索引版本失败: %s", e)
+                return None
+        return f"{fund_code}|{source_file}|{self._index_version}"
+    
+    def _load_directory_cache(self) -> Dict[str, int]:
+        """读取目录位置缓存文件，未配置、不存在或损坏时返回空字典"""
+        if self._dir_cache_path is None:
+            return {}
+        try:
+            with open(self._dir_cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def _store_directory_cache(self, cache_key: Optional[str], dir_chunk_id: int) -> None:
+        """记录目录语块位置，配置了缓存文件时先写临时文件再原子替换，避免并发写入损坏缓存"""
+        if cache_key is None:
+            return
+        with self._dir_cache_lock:
+            self._dir_cache[cache_key] = dir_chunk_id
+            if self._dir_cache_path is None:
+                return
+            try:
+                self._dir_cache_path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=str(self._dir_cache_path.parent), suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self._dir_cache, f, ensure_ascii=False)
+                os.replace(tmp_path, self._dir_cache_path)
+            except OSError as e:
+                logger.error("写入目录位置缓存失败: %s", e)
+    
+    def _get_expansion_chunks_from_es(self, fund_code: str, source_file: str, dir_chunk_id: int) -> List:
+        """获取目录语块扩展范围内的语块，keyword/普通字段两种查询合并为一次msearch"""
+        chunk_ids = set(range(dir_chunk_id - self.chunks_before, dir_chunk_id + self.chunks_after + 1))
+        hits, _ = self._msearch_file_fields(
+            lambda field: self._build_chunk_ids_query(fund_code, source_file, field, chunk_ids)
+        )
+        return hits
+    
+    def _msearch_file_fields(self, build_body) -> Tuple[List, Optional[str]]:
+        """对keyword/普通两种文件名字段各构建一条查询，合并为一次msearch
+        
+        返回第一个有结果的字段的命中及该字段；均无结果或查询失败时返回 ([], None)
+        """
+        fields = ["source_file.keyword", "source_file"]
+        searches: List[Dict[str, Any]] = []
+        for field in fields:
+            searches.append({"index": self.es_index})
+            searches.append(build_body(field))
         
-        def _build_query(field):
+        try:
+            responses = self.es.msearch(body=searches)['responses']
+        except Exception as e:
+            logger.error("ES msearch查询失败: %s", e)
+            return [], None
+        
+        for field, response in zip(fields, responses):
+            hits = response.get('hits', {}).get('hits', [])
+            if hits:
+                return hits, field
+        return [], None
+    
+    def _build_file_filter(self, fund_code: str, source_file: str, field: str) -> List[Dict[str, Any]]:
+        """构建限定基金与文件的ES过滤条件"""
+        return [
+            {"term": {"fund_code": fund_code}},
+            {"term": {field: source_file}}
+        ]
+    
+    def _build_candidates_query(self, fund_code: str, source_file: str, field: str) -> Dict[str, Any]:
+        """构建筛选同时包含"目"与"录"两字（不要求相邻）的候选语块查询体"""
+        return {
+            "size": self.candidate_size,
+            "sort": [{"chunk_id": "asc"}],
+            "_source": ["chunk_id", "text", "page_num", "global_id"],
+            "query": {
+                "bool": {
+                    "filter": self._build_file_filter(fund_code, source_file, field),
+                    "must": [{"match": {"text": {"query": "目录", "operator": "and"}}}]
+                }
+            }
+        }
+    
+    def _get_directory_candidates_from_es(self, fund_code: str, source_file: str) -> Tuple[List, Optional[str]]:
+        """由ES筛选包含"目"与"录"的候选语块，keyword/普通字段两种查询合并为一次msearch
+        
+        返回候选语块及命中的文件名字段；均未命中时返回 ([], None)
+        """
+        hits, field = self._msearch_file_fields(
+            lambda f: self._build_candidates_query(fund_code, source_file, f)
+        )
+        if hits:
+            logger.info("ES候选目录查询返回 %d 个语块", len(hits))
+        return hits, field
+    
+    def _get_directory_candidates_many(
+        self,
+        files: List[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], Tuple[List, Optional[str]]]:
+        """一次msearch获取多个文件的候选目录语块，查询失败的文件不出现在结果中"""
+        fields = ["source_file.keyword", "source_file"]
+        searches: List[Dict[str, Any]] = []
+        for fund_code, source_file in files:
+            for field in fields:
+                searches.append({"index": self.es_index})
+                searches.append(self._build_candidates_query(fund_code, source_file, field))
+        
+        try:
+            responses = self.es.msearch(body=searches)['responses']
+        except Exception as e:
+            logger.error("ES批量候选目录查询失败: %s", e)
+            return {}
+        
+        results: Dict[Tuple[str, str], Tuple[List, Optional[str]]] = {}
+        for index, key in enumerate(files):
+            results[key] = ([], None)
+            for offset, field in enumerate(fields):
+                hits = responses[index * len(fields) + offset].get('hits', {}).get('hits', [])
+                if hits:
+                    results[key] = (hits, field)
+                    break
+        logger.info("ES批量候选目录查询完成: %d 个文件", len(files))
+        return results
+    
+    def _build_chunk_ids_query(self, fund_code: str, source_file: str, field: str, chunk_ids: Set[int]) -> Dict[str, Any]:
+        """构建按chunk_id集合获取语块的查询体"""
+        return {
+            "size": len(chunk_ids),
+            "sort": [{"chunk_id": "asc"}],
+            "_source": ["chunk_id", "text", "page_num", "global_id"],
+            "query": {
+                "bool": {
+                    "filter": self._build_file_filter(fund_code, source_file, field) + [
+                        {"terms": {"chunk_id": sorted(chunk_ids)}}
+                    ]
+                }
+            }
+        }
+    
+    def _get_chunks_by_ids_from_es(self, fund_code: str, source_file: str, field: str, chunk_ids: Set[int]) -> List:
+        """按chunk_id集合获取指定文件的语块"""
+        body = self._build_chunk_ids_query(fund_code, source_file, field, chunk_ids)
+        
+        try:
+            return self.es.search(index=self.es_index, body=body)['hits']['hits']
+        except Exception as e:
+            logger.error("ES按chunk_id查询失败: %s", e)
+            return []
+    
+    def _iter_file_chunks(self, fund_code: str, source_file: str, page_size: int = 500) -> Iterator[List]:
+        """按chunk_id升序分页获取指定文件的语块（search_after），每次产出一页"""
+        
+        def _build_query(field, search_after=None):
             """构建ES查询体"""
-            return {
-                "size": 10000,
+            body = {
+                "size": page_size,
                 "sort": [{"chunk_id": "asc"}],
                 "_source": ["chunk_id", "text", "page_num", "global_id"],
                 "query": {
                     "bool": {
-                        "must": [
-                            {"term": {"fund_code": fund_code}},
-                            {"term": {field: source_file}}
-                        ]
+                        "filter": self._build_file_filter(fund_code, source_file, field)
                     }
                 }
             }
+            if search_after is not None:
+                body["search_after"] = search_after
+            return body
         
         try:
-            # 首先尝试使用keyword字段查询
-            hits = self.es.search(index=self.es_index, body=_build_query("source_file.keyword"))['hits']['hits']
+            # 首页keyword字段与普通字段的查询合并为一次msearch，后续页沿用有结果的字段
+            page, field = self._msearch_file_fields(_build_query)
             
-            # 如果没有结果，尝试使用普通字段查询
-            if not hits:
-                hits = self.es.search(index=self.es_index, body=_build_query("source_file"))['hits']['hits']
+            while page:
+                yield page
+                if len(page) < page_size:
+                    return
+                page = self.es.search(
+                    index=self.es_index,
+                    body=_build_query(field, page[-1]['sort'])
+                )['hits']['hits']
+                
+        except Exception as e:
+            logger.error("ES查询失败: %s", e)
+    
+    def _scan_file_for_directory(
+        self,
+        fund_code: str,
+        source_file: str,
+        skip_chunk_ids: Optional[Set[int]] = None
+    ) -> Tuple[List, Optional[Dict[str, Any]], int, int]:
+        """分页扫描文件语块，边扫描边判断候选目录块；确定目录块且其扩展范围已取到后即停止
+        
+        skip_chunk_ids 为已判定不是目录的语块，不再作为候选；
+        返回 (已获取语块, 目录语块或None, 候选数, LLM判断次数)
+        """
+        skip_chunk_ids = skip_chunk_ids or set()
+        hits: List = []
+        id2text: Dict[int, str] = {}
+        pending: List = []  # 尚未判断的候选（需要后2块作为判断上下文）
+        candidate_count = 0
+        check_times = 0
+        directory_chunk = None
+        
+        for page in self._iter_file_chunks(fund_code, source_file):
+            hits.extend(page)
+            for h in page:
+                src = h['_source']
+                text = src['text']
+                id2text[src['chunk_id']] = text
+                if _is_directory_candidate(text) and src['chunk_id'] not in skip_chunk_ids:
+                    pending.append(h)
+                    candidate_count += 1
+            last_chunk_id = page[-1]['_source']['chunk_id']
             
-            print(f"[DirectorySearcher] ES查询返回 {len(hits)} 个语块")
-            return hits
+            if directory_chunk is None:
+                # 候选按chunk_id升序，后2块已取到的候选必为前缀
+                ready_count = 0
+                while ready_count < len(pending) and pending[ready_count]['_source']['chunk_id'] + 2 <= last_chunk_id:
+                    ready_count += 1
+                if ready_count:
+                    directory_chunk, times = self._find_directory_chunk(pending[:ready_count], id2text)
+                    check_times += times
+                    pending = pending[ready_count:]
             
-        except Exception as e:
-            print(f"[DirectorySearcher] ES查询失败: {e}")
-            return []
+            if directory_chunk is not None and last_chunk_id >= directory_chunk['_source']['chunk_id'] + self.chunks_after:
+                break
+        
+        if directory_chunk is None and pending:
+            directory_chunk, times = self._find_directory_chunk(pending, id2text)
+            check_times += times
+        
+        return hits, directory_chunk, candidate_count, check_times
     
     def _is_directory_chunk_by_llm(self, text_snippet: str) -> bool:
         """使用LLM判断文本片段是否为目录"""
@@ -177,7 +509,7 @@ class DirectorySearcher:
         
         try:
             preview = text_snippet[:400].replace('\n', ' ')
-            print(f"[DirectorySearcher] LLM目录判断输入: {preview}...")
+            logger.debug("LLM目录判断输入: %s...", preview)
             
             response = self.llm_client.chat.completions.create(
                 model=self.llm_model,
@@ -187,7 +519,7 @@ class DirectorySearcher:
             
             raw_response = response.choices[0].message.content.strip()
             response_preview = raw_response.replace('\n', ' ')[:200]
-            print(f"[DirectorySearcher] LLM返回: {response_preview}...")
+            logger.debug("LLM返回: %s...", response_preview)
             
             # 解析LLM返回的JSON
             result = LLMUtils.parse_llm_json_response(raw_response)
@@ -200,9 +532,33 @@ class DirectorySearcher:
                 return LLMUtils.normalize_yes_value(raw_response.strip())
                 
         except Exception as e:
-            print(f"[DirectorySearcher] LLM目录判断异常: {e}")
+            logger.error("LLM目录判断异常: %s", e)
             return False
     
+    def _find_directory_index_by_llm_batch(self, snippets: List[str]) -> Optional[int]:
+        """一次LLM调用判断多个候选片段，返回目录片段索引；都不是目录返回-1，失败返回None"""
+        
+        prompt = LLMUtils.create_directory_batch_check_prompt(snippets)
+        
+        try:
+            logger.info("LLM批量目录判断: %d 个候选片段", len(snippets))
+            
+            response = self.llm_client.chat.completions.create(
+                model=self.llm_model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0
+            )
+            
+            raw_response = response.choices[0].message.content.strip()
+            response_preview = raw_response.replace('\n', ' ')[:200]
+            logger.debug("LLM批量判断返回: %s...", response_preview)
+            
+            return LLMUtils.parse_directory_batch_response(raw_response, len(snippets))
+            
+        except Exception as e:
+            logger.error("LLM批量目录判断异常: %s", e)
+            return None
+    
     def _create_error_result(self, error_msg: str) -> Dict[str, Any]:
         """创建错误结果"""
         return {
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Elasticsearch客户端模块
+进程内共享一个启用压缩与长连接池的ES客户端，避免各模块重复建立连接
+"""
+
+import logging
+import threading
+from typing import Any, Optional
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.serializer import JsonSerializer
+
+from ..db_config import get_elasticsearch_config
+from ..utils.fastjson import loads
+
+logger = logging.getLogger(__name__)
+
+
+class FastJsonSerializer(JsonSerializer):
+    """响应体解析改用 fastjson（安装 orjson 时为C实现），请求体序列化沿用默认实现"""
+    
+    def loads(self, data: bytes) -> Any:
+        try:
+            return loads(data)
+        except ValueError as e:
+            raise SerializationError(message=f"Unable to deserialize as JSON: {data!r}", errors=(e,))
+
+
+_ES_CLIENT: Optional[Elasticsearch] = None
+_ES_CLIENT_LOCK = threading.Lock()
+
+
+def get_es_client() -> Elasticsearch:
+    """获取共享的ES客户端（懒加载），开启gzip压缩并放大每节点连接池"""
+    global _ES_CLIENT
+    if _ES_CLIENT is None:
+        with _ES_CLIENT_LOCK:
+            if _ES_CLIENT is None:
+                es_config = get_elasticsearch_config()
+                _ES_CLIENT = Elasticsearch(
+                    [f"{es_config.scheme}://{es_config.host}:{es_config.port}"],
+                    basic_auth=(es_config.username, es_config.password),
+                    http_compress=True,
+                    connections_per_node=25,
+                    request_timeout=30,
+                    verify_certs=False,
+                    ssl_show_warn=False,
+                    serializer=FastJsonSerializer()
+                )
+                logger.debug("共享Elasticsearch客户端初始化完成")
+    return _ES_CLIENT
+
+
+def close_es_client() -> None:
+    """关闭共享的ES客户端，工具关闭时调用"""
+    global _ES_CLIENT
+    with _ES_CLIENT_LOCK:
+        if _ES_CLIENT is not None:
+            try:
+                _ES_CLIENT.close()
+                logger.debug("共享Elasticsearch客户端已关闭")
+            except Exception as e:
+                logger.error("关闭Elasticsearch客户端时出错: %s", e)
+            _ES_CLIENT = None
@@ -5,17 +5,48 @@
 负责文件名查询、数据库连接等功能
 """
 
-import sys
+import asyncio
+import logging
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 import pymysql
 
-# 设置路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
+try:  # DBUtils 为可选依赖，未安装时退回每次查询新建连接
+    from dbutils.pooled_db import PooledDB
+except ImportError:  # pragma: no cover
+    PooledDB = None
 
-from db_config import get_db_announcement_config
+try:  # aiomysql 为可选依赖，未安装时异步接口在线程中执行同步查询
+    import aiomysql
+except ImportError:  # pragma: no cover
+    aiomysql = None
+
+from ..db_config import get_db_announcement_config
+from ..utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 本机 MySQL 的默认 Unix 套接字，仅在 host 指向本机时使用
+_DEFAULT_UNIX_SOCKET = '/var/run/mysqld/mysqld.sock'
+_LOCAL_HOSTS = frozenset({'localhost', '127.0.0.1'})
+
+# 招募说明书文件名查询（参数化，fund_code 由驱动转义传入，LIKE 中的字面量 % 写作 %%）
+_SQL_TEMPLATE = """
+SELECT file_name 
+FROM processed_files 
+WHERE fund_code = %s 
+  AND elasticsearch_database_done = 'true'
+  AND doc_type_2 = '招募说明书'
+  AND file_name {expansion_match} '%%扩募%%'
+  AND file_name NOT LIKE '%%提示性%%'
+ORDER BY date ASC
+LIMIT 1
+"""
+_SQL_EXPANSION = _SQL_TEMPLATE.format(expansion_match="LIKE")
+_SQL_INITIAL = _SQL_TEMPLATE.format(expansion_match="NOT LIKE")
+
+# 招募说明书文件名缓存：(fund_code, is_expansion) -> file_name，进程内所有 FileManager 共享
+_PROSPECTUS_FILE_CACHE = TTLCache(maxsize=4096, ttl=3600)
 
 
 class FileManager:
@@ -24,85 +55,222 @@ class FileManager:
     def __init__(self):
         """初始化文件管理器"""
         self.db_config = get_db_announcement_config()
-        print("[FileManager] 文件管理器初始化完成")
+        self._pool = self._create_pool()
+        self._apool = None
+        self._apool_lock = asyncio.Lock()
+        logger.debug("文件管理器初始化完成")
+    
+    def _create_pool(self):
+        """创建数据库连接池，DBUtils 不可用或创建失败时返回 None"""
+        if PooledDB is None:
+            return None
+        try:
+            return PooledDB(
+                creator=pymysql,
+                mincached=2,
+                maxcached=5,
+                maxconnections=10,
+                blocking=True,
+                **self._connect_kwargs()
+            )
+        except Exception as e:
+            logger.warning("创建数据库连接池失败，改为按次连接: %s", e)
+            return None
+    
+    def close(self):
+        """关闭数据库连接池"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+            logger.debug("数据库连接池已关闭")
+    
+    def invalidate_cache(self):
+        """清空招募说明书文件名缓存，数据库中文件信息更新后调用"""
+        _PROSPECTUS_FILE_CACHE.clear()
+        logger.info("招募说明书文件名缓存已清空")
     
     def determine_prospectus_file(self, fund_code: str, is_expansion: bool) -> Optional[str]:
-        """确定目标招募说明书文件名"""
+        """确定目标招募说明书文件名，结果缓存一小时（未找到的结果不缓存）"""
+        
+        cache_key = (fund_code, bool(is_expansion))
+        cached_file = _PROSPECTUS_FILE_CACHE.get(cache_key)
+        if cached_file is not None:
+            logger.debug("命中文件名缓存: %s", cached_file)
+            return cached_file
+        
+        file_name = self._query_prospectus_file(fund_code, is_expansion)
+        if file_name:
+            _PROSPECTUS_FILE_CACHE.set(cache_key, file_name)
+        return file_name
+    
+    async def init_async_pool(self):
+        """创建 aiomysql 异步连接池，首次异步查询时自动调用"""
+        async with self._apool_lock:
+            if self._apool is not None or aiomysql is None:
+                return
+            kwargs = self._connect_kwargs()
+            kwargs["db"] = kwargs.pop("database")
+            self._apool = await aiomysql.create_pool(minsize=2, maxsize=10, autocommit=True, **kwargs)
+            logger.debug("异步数据库连接池创建完成")
+    
+    async def close_async(self):
+        """关闭异步数据库连接池"""
+        if self._apool is not None:
+            self._apool.close()
+            await self._apool.wait_closed()
+            self._apool = None
+            logger.debug("异步数据库连接池已关闭")
+    
+    async def determine_prospectus_file_async(self, fund_code: str, is_expansion: bool) -> Optional[str]:
+        """determine_prospectus_file 的异步版本，可用 asyncio.gather 并发查询多个基金
+        
+        未安装 aiomysql 时在线程中执行同步查询
+        """
+        cache_key = (fund_code, bool(is_expansion))
+        cached_file = _PROSPECTUS_FILE_CACHE.get(cache_key)
+        if cached_file is not None:
+            logger.debug("命中文件名缓存: %s", cached_file)
+            return cached_file
+        
+        if aiomysql is None:
+            return await asyncio.to_thread(self.determine_prospectus_file, fund_code, is_expansion)
+        
+        logger.debug("异步查询%s招募说明书文件名...", '扩募' if is_expansion else '首发')
+        try:
+            await self.init_async_pool()
+            async with self._apool.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await cursor.execute(_SQL_EXPANSION if is_expansion else _SQL_INITIAL, (fund_code,))
+                    row = await cursor.fetchone()
+        except Exception as e:
+            logger.error("异步查询招募说明书文件名异常: %s", e)
+            return None
+        
+        if not row:
+            logger.info("未找到基金 %s 的%s招募说明书", fund_code, '扩募' if is_expansion else '首发')
+            return None
+        file_name = row[0]
+        _PROSPECTUS_FILE_CACHE.set(cache_key, file_name)
+        logger.debug("找到%s招募说明书: %s", '扩募' if is_expansion else '首发', file_name)
+        return file_name
+    
+    def _query_prospectus_file(self, fund_code: str, is_expansion: bool) -> Optional[str]:
+        """从数据库查询目标招募说明书文件名"""
         
-        print(f"[FileManager] 查询{'扩募' if is_expansion else '首发'}招募说明书文件名...")
+        logger.debug("查询%s招募说明书文件名...", '扩募' if is_expansion else '首发')
         
+        connection = None
         try:
             # 建立数据库连接
             connection = self._get_db_connection()
             
-            # 根据是否扩募构建不同的SQL查询
-            if is_expansion:
-                # 查询扩募招募说明书
-                sql = f"""
-                SELECT file_name, date 
-                FROM processed_files 
-                WHERE fund_code = '{fund_code}' 
-                  AND elasticsearch_database_done = 'true'
-                  AND doc_type_2 = '招募说明书'
-                  AND file_name LIKE '%扩募%'
-                  AND file_name NOT LIKE '%提示性%'
-                ORDER BY date ASC
-                LIMIT 1
-                """
-            else:
-                # 查询首发招募说明书
-                sql = f"""
-                SELECT file_name, date 
-                FROM processed_files 
-                WHERE fund_code = '{fund_code}' 
-                  AND elasticsearch_database_done = 'true'
-                  AND doc_type_2 = '招募说明书'
-                  AND file_name NOT LIKE '%扩募%'
-                  AND file_name NOT LIKE '%提示性%'
-                ORDER BY date ASC
-                LIMIT 1
-                """
+            sql = _SQL_EXPANSION if is_expansion else _SQL_INITIAL
             
-            print(f"[FileManager] 执行SQL查询...")
+            logger.debug("执行SQL查询...")
             
-            # 执行查询
-            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-                cursor.execute(sql)
-                results = cursor.fetchall()
+            # 执行查询：单行单列结果使用默认元组游标
+            with connection.cursor() as cursor:
+                cursor.execute(sql, (fund_code,))
+                row = cursor.fetchone()
             
             # 处理查询结果
-            if results and len(results) > 0:
-                file_name = results[0]['file_name']
-                date = results[0]['date']
-                print(f"[FileManager] 找到{'扩募' if is_expansion else '首发'}招募说明书: {file_name} (日期: {date})")
+            if row:
+                file_name = row[0]
+                logger.debug("找到%s招募说明书: %s", '扩募' if is_expansion else '首发', file_name)
                 return file_name
             else:
-                print(f"[FileManager] 未找到基金 {fund_code} 的{'扩募' if is_expansion else '首发'}招募说明书")
+                logger.info("未找到基金 %s 的%s招募说明书", fund_code, '扩募' if is_expansion else '首发')
                 return None
                 
         except Exception as e:
-            print(f"[FileManager] 查询招募说明书文件名异常: {e}")
+            logger.error("查询招募说明书文件名异常: %s", e)
             return None
             
         finally:
-            if 'connection' in locals() and connection:
+            if connection is not None:
+                # 连接池中的连接 close() 只是归还到池中
                 connection.close()
-                print(f"[FileManager] 数据库连接已关闭")
+                logger.debug("数据库连接已释放")
+    
+    def determine_prospectus_files_bulk(self, fund_codes: List[str], is_expansion: bool) -> Dict[str, str]:
+        """一次查询批量确定多个基金的招募说明书文件名，返回 {fund_code: file_name}，未找到的基金不出现在结果中"""
+        
+        fund_codes = list(dict.fromkeys(fund_codes))
+        if not fund_codes:
+            return {}
+        
+        logger.debug("批量查询 %d 个基金的%s招募说明书文件名...", len(fund_codes), '扩募' if is_expansion else '首发')
+        
+        connection = None
+        try:
+            connection = self._get_db_connection()
+            
+            # 每个基金按日期取最早的一份，与单个查询的 ORDER BY date ASC LIMIT 1 一致
+            placeholders = ", ".join(["%s"] * len(fund_codes))
+            sql = f"""
+            SELECT fund_code, file_name, date
+            FROM (
+                SELECT fund_code, file_name, date,
+                       ROW_NUMBER() OVER (PARTITION BY fund_code ORDER BY date ASC) AS rn
+                FROM processed_files
+                WHERE fund_code IN ({placeholders})
+                  AND elasticsearch_database_done = 'true'
+                  AND doc_type_2 = '招募说明书'
+                  AND file_name {'LIKE' if is_expansion else 'NOT LIKE'} '%%扩募%%'
+                  AND file_name NOT LIKE '%%提示性%%'
+            ) t
+            WHERE rn = 1
+            """
+            
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(sql, tuple(fund_codes))
+                rows = cursor.fetchall()
+            
+            result = {row['fund_code']: row['file_name'] for row in rows}
+            for fund_code, file_name in result.items():
+                _PROSPECTUS_FILE_CACHE.set((fund_code, bool(is_expansion)), file_name)
+            logger.debug("批量查询找到 %d/%d 个基金的招募说明书", len(result), len(fund_codes))
+            return result
+            
+        except Exception as e:
+            logger.error("批量查询招募说明书文件名异常: %s", e)
+            return {}
+            
+        finally:
+            if connection is not None:
+                connection.close()
+    
+    def _connect_kwargs(self) -> Dict[str, object]:
+        """
+        构建 pymysql 连接参数，经 Unix 套接字连接可省去 TCP 握手
+        
+        显式配置的套接字始终使用；未配置时仅在 host 指向本机且默认套接字存在时使用，
+        避免 host 指向远程库时被本机 mysqld 的套接字劫持
+        """
+        config = self.db_config
+        kwargs = {
+            "host": config.host,
+            "port": config.port,
+            "user": config.user,
+            "password": config.password,
+            "database": config.database,
+            "charset": config.charset,
+            "connect_timeout": config.connect_timeout,
+        }
+        if config.unix_socket:
+            kwargs["unix_socket"] = config.unix_socket
+        elif config.host in _LOCAL_HOSTS and os.path.exists(_DEFAULT_UNIX_SOCKET):
+            kwargs["unix_socket"] = _DEFAULT_UNIX_SOCKET
+        return kwargs
     
     def _get_db_connection(self):
-        """获取数据库连接"""
+        """获取数据库连接，优先从连接池中取用"""
         try:
-            config = self.db_config
-            connection = pymysql.connect(
-                host=config["host"],
-                port=config["port"],
-                user=config["user"],
-                password=config["password"],
-                database=config["database"],
-                charset=config["charset"]
-            )
-            print(f"[FileManager] 数据库连接成功")
+            if self._pool is not None:
+                return self._pool.connection()
+            connection = pymysql.connect(**self._connect_kwargs())
+            logger.debug("数据库连接成功")
             return connection
         except Exception as e:
-            print(f"[FileManager] 数据库连接失败: {e}")
+            logger.error("数据库连接失败: %s", e)
             raise e
\ No newline at end of file
@@ -1,43 +1,96 @@
 # db_config.py
 
-def get_db_announcement_config():
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class DBAnnouncementConfig:
+    """MySQL 数据库announcement连接配置"""
+    host: str
+    port: int
+    user: str
+    password: str
+    database: str
+    charset: str
+    init_command: Optional[str] = None
+    unix_socket: Optional[str] = None
+    connect_timeout: int = 2
+
+
+@dataclass(frozen=True, slots=True)
+class VectorDBConfig:
+    """向量数据库（Milvus）连接配置"""
+    host: str
+    port: int
+    user: str
+    password: str
+    # 集合索引的度量类型："L2" 或 "IP"（IP 要求集合以归一化向量按 IP 建索引）
+    metric_type: str = "L2"
+
+
+@dataclass(frozen=True, slots=True)
+class ElasticsearchConfig:
+    """Elasticsearch 连接配置"""
+    host: str
+    port: int
+    username: str
+    password: str
+    scheme: str = 'http'
+
+
+# processed_files 表的招募说明书查询（core/file_manager.py）依赖以下覆盖索引：
+# 按 fund_code/doc_type_2/elasticsearch_database_done 等值定位后沿 date 有序取首行，
+# file_name 的 LIKE '%扩募%' / '%提示性%' 条件在索引项上过滤，无需回表与排序。
+#   CREATE INDEX idx_pf_lookup
+#       ON processed_files (fund_code, doc_type_2, elasticsearch_database_done, date, file_name);
+_DB_ANNOUNCEMENT_CONFIG = DBAnnouncementConfig(
+    host='127.0.0.1',       # 数据库主机
+    port=3306,               # 数据库端口
+    user='***',              # 数据库用户名
+    password='***',        # 数据库密码
+    database='announcement',         # 数据库名称
+    charset='utf8mb4',        # 字符集
+    init_command="SET SESSION collation_connection = 'utf8mb4_unicode_ci'",  # 设置连接排序规则
+    # 显式指定的 Unix 套接字（MYSQL_UNIX_SOCKET）；未指定时仅在 host 为本机时尝试默认套接字
+    unix_socket=os.environ.get('MYSQL_UNIX_SOCKET') or None,
+    connect_timeout=2,        # 建连超时（秒）
+    # 连接池长期持有连接：服务端 wait_timeout / interactive_timeout 应大于连接空闲时长，避免取到已被断开的连接
+)
+
+def get_db_announcement_config() -> DBAnnouncementConfig:
     """
     返回 MySQL 数据库announcement连接的配置信息。
+    返回不可变配置对象，进程内共享同一份配置。
     """
-    db_announcement_config = {
-        'host': '127.0.0.1',       # 数据库主机
-        'port': 3306,               # 数据库端口
-        'user': '***',              # 数据库用户名
-        'password': '***',        # 数据库密码
-        'database': 'announcement',         # 数据库名称
-        'charset': 'utf8mb4',        # 字符集
-        'init_command': "SET SESSION collation_connection = 'utf8mb4_unicode_ci'"  # 设置连接排序规则
-    }
-    return db_announcement_config
-
-def get_vector_db_config():
+    return _DB_ANNOUNCEMENT_CONFIG
+
+_VECTOR_DB_CONFIG = VectorDBConfig(
+    host='localhost',  # 本地 Docker 部署的 Milvus
+    port=19530,
+    user='***',
+    password='***'
+)
+
+def get_vector_db_config() -> VectorDBConfig:
     """
     返回向量数据库（Milvus）的连接配置信息。
+    返回不可变配置对象，进程内共享同一份配置。
     """
-    vector_db_config = {
-        'host': 'localhost',  # 本地 Docker 部署的 Milvus
-        'port': 19530,
-        'user': '***',
-        'password': '***'
-    }
-    return vector_db_config
-
-def get_elasticsearch_config():
+    return _VECTOR_DB_CONFIG
+
+_ELASTICSEARCH_CONFIG = ElasticsearchConfig(
+    host='127.0.0.1',          # Elasticsearch 服务主机
+    port=9200,                 # Elasticsearch 服务端口
+    username='***',        # Elasticsearch 用户名
+    password='***',    # Elasticsearch 密码
+    scheme='http'              # 明确指定连接协议为 http
+)
+
+def get_elasticsearch_config() -> ElasticsearchConfig:
     """
     返回 Elasticsearch 数据库的连接配置信息。
+    返回不可变配置对象，进程内共享同一份配置。
     """
-    elasticsearch_config = {
-        'host': '127.0.0.1',          # Elasticsearch 服务主机
-        'port': 9200,                 # Elasticsearch 服务端口
-        'username': '***',        # Elasticsearch 用户名
-        'password': '***',    # Elasticsearch 密码
-        'scheme': 'http'              # 明确指定连接协议为 http
-    }
-    return elasticsearch_config
-
-
+    return _ELASTICSEARCH_CONFIG
@@ -1,41 +1,32 @@
 # LLM模型配置
+# api_key 从环境变量 <PROVIDER>_API_KEY 读取（如 ZHIPU_API_KEY、ALI_API_KEY），首次访问时解析并缓存
+# base_url 可用环境变量 <PROVIDER>_BASE_URL 覆盖（如私有化部署或代理网关），未设置时使用内置地址
 
-MODEL_CONFIG = {
-    "zhipu": {
-        "embedding-3": {
-            "model": "embedding-3",
-            "api_key": "***",
-            "base_url": "https://open.bigmodel.cn/api/paas/v4/"
-        },
-        "glm-4.5": {
-            "model": "glm-4.5",
-            "api_key": "***",
-            "base_url": "https://open.bigmodel.cn/api/paas/v4/"
-        },
-    },
-    "ali": {
-        "deepseek-v3": {
-            "model": "deepseek-v3",
-            "api_key": "***",
-            "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1"
-        },
-         "deepseek-r1": {
-                  "model": "deepseek-r1",
-                  "api_key": "***",
-                  "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1"
-         },
-    },
-    "deepseek": {
-        "deepseek-chat": {
-            "model": "deepseek-chat",
-            "api_key": "***",
-            "base_url": "https://api.deepseek.com"
-        },
-        "deepseek-reasoner": {
-            "model": "deepseek-reasoner",
-            "api_key": "***",
-            "base_url": "https://api.deepseek.com"
-        },
-    }
+import functools
+import os
+from dataclasses import dataclass, field
+
+_BASE_URLS = {
+    "zhipu": "https://open.bigmodel.cn/api/paas/v4/",
+    "ali": "https://dashscope.aliyuncs.com/compatible-mode/v1",
+    "deepseek": "https://api.deepseek.com",
 }
 
+
+@dataclass(frozen=True, slots=True)
+class ModelSpec:
+    """单个模型的调用配置"""
+    model: str
+    api_key: str = field(repr=False)  # 避免日志中打印密钥
+    base_url: str
+
+
+@functools.cache
+def get_model_config(provider: str, name: str) -> ModelSpec:
+    """获取模型配置，未设置 api_key 环境变量或提供商无可用 base_url 时抛出 KeyError"""
+    prefix = provider.upper()
+    return ModelSpec(
+        model=name,
+        api_key=os.environ[f"{prefix}_API_KEY"],
+        base_url=os.environ.get(f"{prefix}_BASE_URL") or _BASE_URLS[provider],
+    )
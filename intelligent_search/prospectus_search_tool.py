@@ -10,28 +10,37 @@
 4. 智能文本扩展
 """
 
-import sys
-import os
-from typing import Dict, Any, List, Optional
-
-# 设置路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, current_dir)
+import functools
+import logging
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from typing import Dict, Any, List, Optional, Tuple
 
 # 导入配置文件
-from db_config import get_vector_db_config
-from model_config import MODEL_CONFIG
+from .db_config import get_vector_db_config
+from .model_config import get_model_config
 
 # 导入LLM相关库
 from openai import OpenAI
 
 # 导入重构后的模块
-from core.file_manager import FileManager
-from core.directory_searcher import DirectorySearcher
-from utils.page_utils import PageUtils
-from utils.chunk_utils import ChunkUtils
-from utils.chunk_selector import ChunkSelector
-from searchers import KeywordSearcher, VectorSearcher, HybridSearcher, SearchResult
+from .core.file_manager import FileManager
+from .core.directory_searcher import DirectorySearcher
+from .core.es_client import close_es_client
+from .utils.page_utils import PageUtils
+from .utils.chunk_utils import ChunkUtils, ChunkColumns
+from .utils.chunk_selector import ChunkSelector
+from .utils.ttl_cache import TTLCache
+from .searchers import BaseSearcher, KeywordSearcher, VectorSearcher, HybridSearcher, SearchResult
+
+
+logger = logging.getLogger(__name__)
+
+# 语块预览中替换为空格的空白字符
+_NL_TRANS = str.maketrans({'\n': ' ', '\r': ' ', '\t': ' '})
 
 
 # 默认的检索意图到检索模式的映射，可根据需要手动调整
@@ -40,6 +49,69 @@ DEFAULT_INTENT_MODE_MAP = {
     "content": "hybrid",
 }
 
+# 进程内共享的检索器（按检索模式懒加载），所有工具实例关闭后才真正释放连接
+_SEARCHER_REGISTRY: Dict[str, BaseSearcher] = {}
+_SEARCHER_LOCK = threading.Lock()
+_TOOL_REFCOUNT = 0
+
+
+def _get_shared_searcher(mode: str) -> BaseSearcher:
+    """获取共享检索器，混合检索器复用共享的关键词与向量检索器"""
+    searcher = _SEARCHER_REGISTRY.get(mode)
+    if searcher is not None:
+        return searcher
+    with _SEARCHER_LOCK:
+        searcher = _SEARCHER_REGISTRY.get(mode)
+        if searcher is None:
+            if mode == "keyword":
+                searcher = KeywordSearcher()
+            elif mode == "vector":
+                searcher = VectorSearcher()
+            else:
+                keyword_searcher = _SEARCHER_REGISTRY.get("keyword") or KeywordSearcher()
+                vector_searcher = _SEARCHER_REGISTRY.get("vector") or VectorSearcher()
+                _SEARCHER_REGISTRY.setdefault("keyword", keyword_searcher)
+                _SEARCHER_REGISTRY.setdefault("vector", vector_searcher)
+                searcher = HybridSearcher(keyword_searcher, vector_searcher)
+            _SEARCHER_REGISTRY[mode] = searcher
+    return searcher
+
+
+def _close_shared_searchers() -> None:
+    """关闭全部共享检索器（调用方需持有 _SEARCHER_LOCK）"""
+    hybrid = _SEARCHER_REGISTRY.pop("hybrid", None)
+    if hybrid is not None:
+        hybrid.close_connection()  # 同时关闭其复用的关键词与向量检索器
+    for searcher in _SEARCHER_REGISTRY.values():
+        if hybrid is None or searcher not in (hybrid.keyword_searcher, hybrid.vector_searcher):
+            searcher.close_connection()
+    _SEARCHER_REGISTRY.clear()
+
+
+# 检索信息前缀（全角/半角冒号均可）到检索意图的映射
+_INTENT_BY_PREFIX = {
+    "章节标题检索": "title",
+    "内容检索": "content",
+}
+_INTENT_PREFIX_RE = re.compile(r"(章节标题检索|内容检索)[:：]")
+
+# 合法的检索模式
+_SEARCH_MODES = frozenset({"keyword", "vector", "hybrid"})
+
+
+@functools.lru_cache(maxsize=1024)
+def _split_search_intent(search_info: str) -> Tuple[str, str]:
+    """解析检索信息为 (检索意图, 查询内容)，结果按原始字符串缓存"""
+    raw = search_info.strip()
+    if not raw:
+        return "content", ""
+
+    match = _INTENT_PREFIX_RE.match(raw)
+    if match:
+        return _INTENT_BY_PREFIX[match.group(1)], raw[match.end():].strip()
+
+    return "content", raw
+
 
 class ProspectusSearchTool:
     """
@@ -50,34 +122,31 @@ class ProspectusSearchTool:
     
     def __init__(self):
         """初始化检索工具"""
-        print("[ProspectusSearchTool] 招募说明书智能检索工具初始化开始...")
+        logger.debug("招募说明书智能检索工具初始化开始...")
         
         # 配置信息
         self.vector_config = get_vector_db_config()
         
-        # 初始化LLM客户端（使用ali的deepseek-v3）
-        llm_config = MODEL_CONFIG["ali"]["deepseek-v3"]
-        self.llm_client = OpenAI(
-            api_key=llm_config["api_key"],
-            base_url=llm_config["base_url"]
-        )
-        self.llm_model = llm_config["model"]
-        print(f"[ProspectusSearchTool] LLM客户端初始化成功，使用模型: {self.llm_model}")
-        
-        # 初始化各个功能模块
-        self.file_manager = FileManager()
-        self.directory_searcher = DirectorySearcher(self.llm_client, self.llm_model)
-        self.chunk_selector = ChunkSelector(self.llm_client, self.llm_model)
+        # LLM客户端与各功能模块（懒加载，在使用时才创建）
+        self._llm_client = None
+        self._llm_model = None
+        self._file_manager = None
+        self._directory_searcher = None
+        self._chunk_selector = None
         
-        # 初始化检索器（懒加载，在使用时才创建）
-        self._keyword_searcher = None
-        self._vector_searcher = None
-        self._hybrid_searcher = None
+        # 检索器为进程内共享实例（懒加载），此处登记引用计数
+        global _TOOL_REFCOUNT
+        with _SEARCHER_LOCK:
+            _TOOL_REFCOUNT += 1
+        self._released = False
+
+        # 文件全部语块缓存：(fund_code, source_file) -> [语块列表, 范围过滤列]
+        self._file_chunks_cache = TTLCache(maxsize=16, ttl=1800)
 
         # 检索意图到检索模式的映射，可根据业务需要在此调整
         self.intent_mode_map = DEFAULT_INTENT_MODE_MAP.copy()
 
-        print("[ProspectusSearchTool] 招募说明书智能检索工具初始化完成")
+        logger.info("招募说明书智能检索工具初始化完成")
     
     def search_prospectus(
         self,
@@ -112,7 +181,7 @@ class ProspectusSearchTool:
                 - 内容检索：返回多条正文结果列表，每条包含文本与位置信息。
         """
 
-        print(f"[ProspectusSearchTool] 开始检索: 基金={fund_code}, 内容={search_info[:50]}...")
+        logger.info("开始检索: 基金=%s, 内容=%s...", fund_code, search_info[:50])
 
         intent_for_error = self._infer_intent_for_error(search_info)
 
@@ -131,7 +200,7 @@ class ProspectusSearchTool:
                 error_msg = f"未找到基金 {fund_code} 的{'扩募' if is_expansion else '首发'}招募说明书"
                 return self._create_error_result(error_msg, intent=intent_for_error)
 
-            print(f"[ProspectusSearchTool] 确定目标文件: {source_file}")
+            logger.info("确定目标文件: %s", source_file)
 
             # 第二步：根据检索信息类型进行处理
             if search_info == "目录":
@@ -153,7 +222,7 @@ class ProspectusSearchTool:
 
         except Exception as e:
             error_msg = f"检索过程中发生错误: {str(e)}"
-            print(f"[ProspectusSearchTool] {error_msg}")
+            logger.error(error_msg)
             return self._create_error_result(error_msg, intent=intent_for_error)
     
     def _validate_parameters(
@@ -211,7 +280,7 @@ class ProspectusSearchTool:
     ) -> Dict[str, Any]:
         """执行一般内容检索"""
 
-        print("[ProspectusSearchTool] 执行一般内容检索")
+        logger.info("执行一般内容检索")
 
         intent = "content"
 
@@ -219,49 +288,60 @@ class ProspectusSearchTool:
             parsed_intent = self._parse_search_intent(search_info)
             intent = parsed_intent['intent']
             normalized_query = parsed_intent['query']
-            print(
-                f"[ProspectusSearchTool] 检索意图: {intent}, 归一化查询: {normalized_query[:80]}"
-            )
+            logger.info("检索意图: %s, 归一化查询: %s", intent, normalized_query[:80])
 
             search_mode = self._resolve_search_mode(intent)
-            print(f"[ProspectusSearchTool] 根据意图选择检索模式: {search_mode}")
+            logger.info("根据意图选择检索模式: %s", search_mode)
+
+            # 检索信息为空且只限定chunk_id范围时，结果由范围唯一确定：
+            # 文件语块已缓存则直接二分切片，否则由ES按范围获取，均无需检索
+            if (
+                not normalized_query.strip()
+                and start_page is None and end_page is None
+                and (start_chunk_id is not None or end_chunk_id is not None)
+            ):
+                range_chunks = self._get_chunk_id_range_chunks(
+                    fund_code, source_file, start_chunk_id, end_chunk_id
+                )
+                if not range_chunks:
+                    return self._create_error_result("指定范围内无内容", intent=intent)
+                return self._get_range_content(range_chunks, source_file=source_file)
 
             # 1. 获取文件所有语块（用于范围限制和语块扩展）
             all_chunks = self._get_all_file_chunks(fund_code, source_file)
             if not all_chunks:
                 return self._create_error_result("未能获取文件语块数据", intent=intent)
 
-            print(f"[ProspectusSearchTool] 获取文件语块 {len(all_chunks)} 个")
+            logger.info("获取文件语块 %d 个", len(all_chunks))
 
             # 2. 根据范围参数计算候选区间
             chunk_range_limits = None
             if any(value is not None for value in [start_page, end_page, start_chunk_id, end_chunk_id]):
+                range_columns = self._get_file_range_columns(fund_code, source_file, all_chunks)
                 range_chunks = ChunkUtils.apply_range_limitations(
                     all_chunks,
                     start_page,
                     end_page,
                     start_chunk_id,
-                    end_chunk_id
+                    end_chunk_id,
+                    columns=range_columns,
+                    sorted_by_chunk_id=True
                 )
 
                 if not range_chunks:
                     return self._create_error_result("指定范围内无内容", intent=intent)
 
-                chunk_range_limits = ChunkUtils.get_chunk_id_range_from_chunks(range_chunks)
-                print(
-                    f"[ProspectusSearchTool] 检索范围限定 chunk_id: {chunk_range_limits[0]}-{chunk_range_limits[1]}"
-                )
+                # range_chunks 保持 chunk_id 升序，首尾即为范围
+                chunk_range_limits = (range_chunks[0].chunk_id, range_chunks[-1].chunk_id)
+                logger.info("检索范围限定 chunk_id: %s-%s", chunk_range_limits[0], chunk_range_limits[1])
 
             # 3. 如果检索信息为空，直接返回范围内文本
             if not normalized_query.strip():
-                print("[ProspectusSearchTool] 检索信息为空，直接按范围获取文本内容")
+                logger.info("检索信息为空，直接按范围获取文本内容")
+                # 步骤2已完成范围过滤，不再传入范围参数，避免重复过滤
                 return self._get_range_content(
-                    all_chunks,
-                    start_page,
-                    end_page,
-                    start_chunk_id,
-                    end_chunk_id,
-                    source_file
+                    range_chunks if chunk_range_limits is not None else all_chunks,
+                    source_file=source_file
                 )
 
             # 4. 执行检索获取候选语块
@@ -277,7 +357,7 @@ class ProspectusSearchTool:
             if not candidate_results:
                 return self._create_error_result("未找到匹配的内容", intent=intent)
 
-            print(f"[ProspectusSearchTool] 获得候选语块 {len(candidate_results)} 个")
+            logger.info("获得候选语块 %d 个", len(candidate_results))
             self._log_candidate_chunks(
                 label=f"{search_mode}检索候选（初始）",
                 chunks=candidate_results
@@ -289,7 +369,7 @@ class ProspectusSearchTool:
                     candidate_results, start_page, end_page,
                     start_chunk_id, end_chunk_id
                 )
-                print(f"[ProspectusSearchTool] 范围限制后保留 {len(candidate_results)} 个候选语块")
+                logger.info("范围限制后保留 %d 个候选语块", len(candidate_results))
                 self._log_candidate_chunks(
                     label="范围限制后的候选",
                     chunks=candidate_results
@@ -298,40 +378,49 @@ class ProspectusSearchTool:
             if not candidate_results:
                 return self._create_error_result("应用范围限制后无匹配结果", intent=intent)
 
+            # 扩展语块时复用缓存的chunk_id列定位扩展区间
+            sorted_chunk_ids = None
+            if expand_before > 0 or expand_after > 0:
+                sorted_chunk_ids = self._get_file_range_columns(fund_code, source_file, all_chunks).chunk_ids
+
             if intent == "title":
+                # 缓存键包含候选chunk_id，指定范围检索时同样可复用LLM选择结果
                 best_chunk = self.chunk_selector.select_best_chunk(
                     search_info=search_info,
                     candidate_results=candidate_results,
                     all_chunks=all_chunks,
                     expand_context=True,
-                    intent=intent
+                    intent=intent,
+                    cache_key=(fund_code, source_file)
                 )
 
                 if best_chunk is None:
                     note = getattr(self.chunk_selector, "last_selection_note", None)
                     message = note or "未检索到目标标题所在文本块"
-                    print(f"[ProspectusSearchTool] LLM未选出标题语块: {message}")
+                    logger.info("LLM未选出标题语块: %s", message)
                     return self._create_error_result(message, intent=intent)
 
-                print(f"[ProspectusSearchTool] LLM选择最佳语块: chunk_id={best_chunk.chunk_id}")
+                logger.info("LLM选择最佳语块: chunk_id=%s", best_chunk.chunk_id)
                 expanded_results = self._prepare_expanded_results(
                     [best_chunk],
                     all_chunks,
                     expand_before,
-                    expand_after
+                    expand_after,
+                    sorted_chunk_ids=sorted_chunk_ids
                 )
             else:
                 expanded_results = self._prepare_expanded_results(
                     candidate_results,
                     all_chunks,
                     expand_before,
-                    expand_after
+                    expand_after,
+                    sorted_chunk_ids=sorted_chunk_ids
                 )
 
             if not expanded_results:
                 return self._create_error_result("语块扩展后无有效内容", intent=intent)
 
-            print(f"[ProspectusSearchTool] 一般内容检索成功，返回 {len(expanded_results)} 条结果")
+            logger.info("一般内容检索成功，返回 %d 条结果", len(expanded_results))
 
             if intent == "title":
                 return self._create_title_success_result(
@@ -345,19 +434,59 @@ class ProspectusSearchTool:
 
         except Exception as e:
             error_msg = f"一般内容检索失败: {str(e)}"
-            print(f"[ProspectusSearchTool] {error_msg}")
+            logger.error(error_msg)
             return self._create_error_result(error_msg, intent=intent)
 
     def _get_all_file_chunks(self, fund_code: str, source_file: str) -> List[SearchResult]:
-        """获取文件的所有语块"""
+        """获取文件的所有语块，结果按 (fund_code, source_file) 缓存"""
+        entry = self._file_chunks_cache.get((fund_code, source_file))
+        if entry is not None:
+            logger.debug("命中文件语块缓存: %s", source_file)
+            return entry[0]
         try:
             # 使用关键词检索器获取所有语块
             searcher = self._get_keyword_searcher()
             chunks = searcher.get_file_chunks(fund_code, source_file, sort_by_chunk_id=True)
-            return chunks
         except Exception as e:
-            print(f"[ProspectusSearchTool] 获取文件语块失败: {e}")
+            logger.error("获取文件语块失败: %s", e)
             return []
+        if chunks:
+            self._file_chunks_cache.set((fund_code, source_file), [chunks, None])
+        return chunks
+    
+    def _get_chunk_id_range_chunks(
+        self,
+        fund_code: str,
+        source_file: str,
+        start_chunk_id: Optional[int],
+        end_chunk_id: Optional[int]
+    ) -> List[SearchResult]:
+        """获取chunk_id范围内的语块（按chunk_id升序）"""
+        entry = self._file_chunks_cache.get((fund_code, source_file))
+        if entry is not None:
+            all_chunks = entry[0]
+            chunk_id_key = attrgetter('chunk_id')
+            lo = 0 if start_chunk_id is None else bisect_left(all_chunks, start_chunk_id, key=chunk_id_key)
+            hi = len(all_chunks) if end_chunk_id is None else bisect_right(all_chunks, end_chunk_id, key=chunk_id_key)
+            logger.info("检索信息为空，从缓存语块中直接截取chunk_id范围")
+            return all_chunks[lo:hi]
+        
+        logger.info("检索信息为空，按chunk_id范围直接获取文本内容")
+        return self._get_keyword_searcher().get_file_chunks(
+            fund_code,
+            source_file,
+            sort_by_chunk_id=True,
+            chunk_id_range=(start_chunk_id, end_chunk_id)
+        )
+    
+    def _get_file_range_columns(self, fund_code: str, source_file: str, all_chunks: List[SearchResult]) -> ChunkColumns:
+        """获取文件语块的范围过滤列，随语块缓存复用"""
+        entry = self._file_chunks_cache.get((fund_code, source_file))
+        if entry is None or entry[0] is not all_chunks:
+            return ChunkUtils.build_range_columns(all_chunks)
+        if entry[1] is None:
+            entry[1] = ChunkUtils.build_range_columns(all_chunks)
+        return entry[1]
     
     def _execute_search(
         self, 
@@ -401,10 +530,10 @@ class ProspectusSearchTool:
                     intent=intent
                 )
             else:
-                print(f"[ProspectusSearchTool] 未知的检索模式: {search_mode}")
+                logger.warning("未知的检索模式: %s", search_mode)
                 return []
         except Exception as e:
-            print(f"[ProspectusSearchTool] 执行检索失败: {e}")
+            logger.error("执行检索失败: %s", e)
             return []
     
     def _apply_range_filter(
@@ -422,7 +551,7 @@ class ProspectusSearchTool:
                 start_chunk_id, end_chunk_id
             )
         except Exception as e:
-            print(f"[ProspectusSearchTool] 应用范围过滤失败: {e}")
+            logger.error("应用范围过滤失败: %s", e)
             return candidate_results
     
     def _prepare_expanded_results(
@@ -430,19 +559,25 @@ class ProspectusSearchTool:
         candidate_results: List[SearchResult],
         all_chunks: List[SearchResult],
         expand_before: int,
-        expand_after: int
+        expand_after: int,
+        sorted_chunk_ids: Optional[Any] = None
     ) -> List[Dict[str, Any]]:
-        """按候选逐条扩展并生成结果列表"""
+        """按候选逐条扩展并生成结果列表（all_chunks 已按 chunk_id 升序，sorted_chunk_ids 为其chunk_id列）"""
         expanded_results: List[Dict[str, Any]] = []
+        need_expand = expand_before > 0 or expand_after > 0
+        if need_expand and sorted_chunk_ids is None:
+            sorted_chunk_ids = [chunk.chunk_id for chunk in all_chunks]
 
         for order, candidate in enumerate(candidate_results, start=1):
-            try:
-                expanded_chunks = ChunkUtils.expand_chunks(
-                    [candidate], all_chunks, expand_before, expand_after
-                )
-            except Exception as exc:
-                print(f"[ProspectusSearchTool] 扩展语块失败: {exc}")
-                expanded_chunks = []
+            expanded_chunks = []
+            if need_expand:
+                try:
+                    lo, hi = ChunkUtils.expand_chunk_slice(
+                        sorted_chunk_ids, candidate.chunk_id, expand_before, expand_after
+                    )
+                    expanded_chunks = all_chunks[lo:hi]
+                except Exception as exc:
+                    logger.warning("扩展语块失败: %s", exc)
 
             if not expanded_chunks:
                 expanded_chunks = [candidate]
@@ -450,32 +585,58 @@ class ProspectusSearchTool:
             result_entry = self._build_expanded_entry(
                 expanded_chunks=expanded_chunks,
                 base_chunk=candidate,
-                order=order
+                order=order,
+                presorted=True
             )
             expanded_results.append(result_entry)
 
         return expanded_results
 
+    @staticmethod
+    def _reduce_chunks(sorted_chunks: List[SearchResult]) -> tuple:
+        """单次遍历已排序语块，返回 (合并文本, 最小页码, 最大页码, int64 chunk_id数组)"""
+        text_parts = []
+        chunk_ids = array('q')
+        min_page = None
+        max_page = None
+        extract_pages = PageUtils.extract_page_numbers_from_string
+        
+        for chunk in sorted_chunks:
+            text_parts.append(chunk.text)
+            chunk_ids.append(chunk.chunk_id)
+            for page in extract_pages(chunk.page_num):
+                if min_page is None or page < min_page:
+                    min_page = page
+                if max_page is None or page > max_page:
+                    max_page = page
+        
+        return "".join(text_parts), min_page, max_page, chunk_ids
+    
     def _build_expanded_entry(
         self,
         expanded_chunks: List[SearchResult],
         base_chunk: Optional[SearchResult],
-        order: int
+        order: int,
+        presorted: bool = False
     ) -> Dict[str, Any]:
-        """构造单条扩展后的检索结果"""
+        """构造单条扩展后的检索结果，presorted 为 True 表示语块已按 chunk_id 升序"""
         if not expanded_chunks and base_chunk is not None:
             expanded_chunks = [base_chunk]
 
         # 按 chunk_id 排序，确保范围计算准确
-        sorted_chunks = sorted(
-            expanded_chunks,
-            key=lambda chunk: getattr(chunk, 'chunk_id', 0)
-        )
+        if presorted:
+            sorted_chunks = expanded_chunks
+        else:
+            sorted_chunks = sorted(
+                expanded_chunks,
+                key=lambda chunk: getattr(chunk, 'chunk_id', 0)
+            )
 
-        merged_text = ChunkUtils.merge_chunks_text(sorted_chunks)
-        start_page, end_page = PageUtils.get_page_range_from_chunks(sorted_chunks)
-        start_chunk_id, end_chunk_id = ChunkUtils.get_chunk_id_range_from_chunks(sorted_chunks)
-        chunk_ids = [chunk.chunk_id for chunk in sorted_chunks if hasattr(chunk, 'chunk_id')]
+        merged_text, start_page, end_page, chunk_ids = self._reduce_chunks(sorted_chunks)
+        if chunk_ids:
+            start_chunk_id, end_chunk_id = chunk_ids[0], chunk_ids[-1]
+        else:
+            start_chunk_id, end_chunk_id = None, None
 
         base_chunk_id = getattr(base_chunk, 'chunk_id', None) if base_chunk else None
         base_page_num = getattr(base_chunk, 'page_num', '') if base_chunk else ''
@@ -504,13 +665,15 @@ class ProspectusSearchTool:
         end_page: Optional[int] = None,
         start_chunk_id: Optional[int] = None,
         end_chunk_id: Optional[int] = None,
-        source_file: str = ""
+        source_file: str = "",
+        columns: Optional[ChunkColumns] = None
     ) -> Dict[str, Any]:
-        """获取指定范围内的内容（当检索信息为空时）"""
+        """获取指定范围内的内容（当检索信息为空时），columns 为已提取的范围列"""
         try:
             # 应用范围限制
             range_chunks = ChunkUtils.apply_range_limitations(
-                all_chunks, start_page, end_page, start_chunk_id, end_chunk_id
+                all_chunks, start_page, end_page, start_chunk_id, end_chunk_id,
+                columns=columns, sorted_by_chunk_id=True
             )
 
             if not range_chunks:
@@ -525,7 +688,8 @@ class ProspectusSearchTool:
             expanded_entry = self._build_expanded_entry(
                 expanded_chunks=range_chunks,
                 base_chunk=range_chunks[0] if range_chunks else None,
-                order=1
+                order=1,
+                presorted=True
             )
 
             return self._create_content_success_result(
@@ -541,21 +705,8 @@ class ProspectusSearchTool:
         if search_info is None:
             return {"intent": "content", "query": ""}
 
-        raw = search_info.strip()
-        if not raw:
-            return {"intent": "content", "query": ""}
-
-        prefix_map = {
-            "title": ["章节标题检索：", "章节标题检索:"],
-            "content": ["内容检索：", "内容检索:"]
-        }
-
-        for intent_key, prefixes in prefix_map.items():
-            for prefix in prefixes:
-                if raw.startswith(prefix):
-                    return {"intent": intent_key, "query": raw[len(prefix):].strip()}
-
-        return {"intent": "content", "query": raw}
+        intent, query = _split_search_intent(search_info)
+        return {"intent": intent, "query": query}
 
     def _resolve_search_mode(self, intent: str) -> str:
         """根据检索意图选择检索模式"""
@@ -564,44 +715,88 @@ class ProspectusSearchTool:
         if mode is None:
             mode = self.intent_mode_map.get("content", "hybrid")
 
-        if mode not in {"keyword", "vector", "hybrid"}:
-            print(
-                f"[ProspectusSearchTool] 意图 {intent} 映射到非法模式 {mode}，改用默认 hybrid"
-            )
+        if mode not in _SEARCH_MODES:
+            logger.warning("意图 %s 映射到非法模式 %s，改用默认 hybrid", intent, mode)
             return "hybrid"
 
         return mode
 
+    def _init_llm_client(self):
+        """初始化LLM客户端（使用ali的deepseek-v3）"""
+        llm_config = get_model_config("ali", "deepseek-v3")
+        self._llm_client = OpenAI(
+            api_key=llm_config.api_key,
+            base_url=llm_config.base_url
+        )
+        self._llm_model = llm_config.model
+        logger.info("LLM客户端初始化成功，使用模型: %s", self._llm_model)
+    
+    @property
+    def llm_client(self) -> OpenAI:
+        """获取LLM客户端（懒加载）"""
+        if self._llm_client is None:
+            self._init_llm_client()
+        return self._llm_client
+    
+    @property
+    def llm_model(self) -> str:
+        """获取LLM模型名称（懒加载）"""
+        if self._llm_model is None:
+            self._init_llm_client()
+        return self._llm_model
+    
+    @property
+    def file_manager(self) -> FileManager:
+        """获取文件管理器（懒加载）"""
+        if self._file_manager is None:
+            self._file_manager = FileManager()
+        return self._file_manager
+    
+    @property
+    def directory_searcher(self) -> DirectorySearcher:
+        """获取目录检索器（懒加载）"""
+        if self._directory_searcher is None:
+            self._directory_searcher = DirectorySearcher(self.llm_client, self.llm_model)
+        return self._directory_searcher
+    
+    @property
+    def chunk_selector(self) -> ChunkSelector:
+        """获取语块选择器（懒加载）"""
+        if self._chunk_selector is None:
+            self._chunk_selector = ChunkSelector(self.llm_client, self.llm_model)
+        return self._chunk_selector
+    
     def _get_keyword_searcher(self) -> KeywordSearcher:
-        """获取关键词检索器（懒加载）"""
-        if self._keyword_searcher is None:
-            self._keyword_searcher = KeywordSearcher()
-        return self._keyword_searcher
+        """获取共享的关键词检索器（懒加载）"""
+        return _get_shared_searcher("keyword")
     
     def _get_vector_searcher(self) -> VectorSearcher:
-        """获取向量检索器（懒加载）"""
-        if self._vector_searcher is None:
-            self._vector_searcher = VectorSearcher()
-        return self._vector_searcher
+        """获取共享的向量检索器（懒加载）"""
+        return _get_shared_searcher("vector")
     
     def _get_hybrid_searcher(self) -> HybridSearcher:
-        """获取混合检索器（懒加载）"""
-        if self._hybrid_searcher is None:
-            self._hybrid_searcher = HybridSearcher()
-        return self._hybrid_searcher
+        """获取共享的混合检索器（懒加载）"""
+        return _get_shared_searcher("hybrid")
     
     def close_connections(self):
-        """关闭所有连接"""
+        """关闭本实例的连接；共享检索器与ES客户端在最后一个工具实例关闭时释放"""
+        global _TOOL_REFCOUNT
         try:
-            if self._keyword_searcher:
-                self._keyword_searcher.close_connection()
-            if self._vector_searcher:
-                self._vector_searcher.close_connection()
-            if self._hybrid_searcher:
-                self._hybrid_searcher.close_connection()
-            print("[ProspectusSearchTool] 所有连接已关闭")
+            if self._file_manager:
+                self._file_manager.close()
+            self._file_chunks_cache.clear()
+            with _SEARCHER_LOCK:
+                if not self._released:
+                    self._released = True
+                    _TOOL_REFCOUNT -= 1
+                if _TOOL_REFCOUNT > 0:
+                    logger.info("本实例连接已关闭，共享检索器仍被 %d 个实例使用", _TOOL_REFCOUNT)
+                    return
+                _close_shared_searchers()
+            close_es_client()
+            logger.info("所有连接已关闭")
         except Exception as e:
-            print(f"[ProspectusSearchTool] 关闭连接时出错: {e}")
+            logger.error("关闭连接时出错: %s", e)
     
     def _create_error_result(self, error_msg: str, intent: str = "content") -> Dict[str, Any]:
         """根据意图构造错误结果"""
@@ -679,12 +874,12 @@ class ProspectusSearchTool:
         max_preview: int = 400,
         limit: Optional[int] = None
     ) -> None:
-        """打印候选或范围语块的调试信息"""
+        """打印候选或范围语块的调试信息，逐块预览仅在 DEBUG 级别输出"""
 
         total = len(chunks)
-        print(f"[ProspectusSearchTool] {label}: 共 {total} 个语块")
+        logger.info("%s: 共 %d 个语块", label, total)
 
-        if total == 0:
+        if total == 0 or not logger.isEnabledFor(logging.DEBUG):
             return
 
         display_chunks = chunks if limit is None else chunks[:limit]
@@ -702,14 +897,15 @@ class ProspectusSearchTool:
                 text = source.get('text', '') or ''
                 methods = source.get('from_methods', []) or []
 
-            preview = text.replace('\n', ' ')[:max_preview]
+            preview = text[:max_preview].translate(_NL_TRANS)
             method_label = ','.join(methods) if methods else '-'
-            print(
-                f"  - [{idx}/{total}] chunk_id={chunk_id}, page_num={page_num}, 来源={method_label}, 预览={preview}"
+            logger.debug(
+                "  - [%d/%d] chunk_id=%s, page_num=%s, 来源=%s, 预览=%s",
+                idx, total, chunk_id, page_num, method_label, preview
             )
 
         if limit is not None and total > limit:
-            print(f"[ProspectusSearchTool] {label}: 仅展示前 {limit} 个语块，剩余 {total - limit} 个未展开")
+            logger.debug("%s: 仅展示前 %d 个语块，剩余 %d 个未展开", label, limit, total - limit)
 
 
 # 测试函数
@@ -760,5 +956,6 @@ def test_refactored_tool():
         traceback.print_exc()
 
 
+# 包内使用相对导入，需在项目根目录以模块方式运行：python -m intelligent_search.prospectus_search_tool
 if __name__ == "__main__":
     test_refactored_tool()
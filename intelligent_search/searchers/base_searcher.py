@@ -5,12 +5,15 @@
 定义检索工具的统一接口和通用功能
 """
 
+import logging
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Union
+from dataclasses import dataclass, field
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+@dataclass(slots=True)
 class SearchResult:
     """检索结果数据类"""
     global_id: str
@@ -22,17 +25,18 @@ class SearchResult:
     fund_code: str = ""
     date: str = ""
     short_name: str = ""
-    from_methods: List[str] = None
-    
-    def __post_init__(self):
-        if self.from_methods is None:
-            self.from_methods = []
+    from_methods: List[str] = field(default_factory=list)
+
+
+def _to_chunk_id(value: Any) -> int:
+    """统一 chunk_id 为 int：ES 可能返回浮点数或空值（缺失记为 0）"""
+    return value if type(value) is int else int(value or 0)
 
 
 class BaseSearcher(ABC):
     """基础检索类，定义统一接口"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Any):
         """初始化检索器"""
         self.config = config
         self._connection = None
@@ -55,21 +59,24 @@ class BaseSearcher(ABC):
         """执行检索"""
         pass
     
+    @staticmethod
+    def _normalize_query(query: Union[str, List[str], None]) -> str:
+        """将查询字符串或关键词列表规范化为去除首尾空白的查询文本"""
+        if isinstance(query, str):
+            return query.strip()
+        if isinstance(query, list):
+            return " ".join(str(item) for item in query).strip()
+        return str(query).strip() if query is not None else ""
+    
     def _format_search_result(self, raw_result: Dict, score: float, method: str) -> SearchResult:
         """格式化检索结果为统一结构"""
-        source = raw_result.get('_source', raw_result)
+        get = raw_result.get('_source', raw_result).get
         
         return SearchResult(
-            global_id=source.get('global_id', ''),
-            chunk_id=source.get('chunk_id', 0),
-            source_file=source.get('source_file', ''),
-            page_num=source.get('page_num', ''),
-            text=source.get('text', ''),
-            score=score,
-            fund_code=source.get('fund_code', ''),
-            date=source.get('date', ''),
-            short_name=source.get('short_name', ''),
-            from_methods=[method]
+            get('global_id', ''), _to_chunk_id(get('chunk_id')), get('source_file', ''),
+            get('page_num', ''), get('text', ''), score,
+            get('fund_code', ''), get('date', ''), get('short_name', ''),
+            [method]
         )
     
     def _build_filters(
@@ -93,6 +100,6 @@ class BaseSearcher(ABC):
         if self._connection:
             try:
                 self._connection.close()
-                print(f"[{self.__class__.__name__}] 连接已关闭")
+                logger.info("%s 连接已关闭", self.__class__.__name__)
             except:
                 pass
\ No newline at end of file
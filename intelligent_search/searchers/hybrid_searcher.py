@@ -5,30 +5,44 @@
 结合关键词检索和向量检索，实现混合检索功能
 """
 
-import sys
-import os
-from typing import List, Dict, Any, Optional, Union
-
-# 设置路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 from .base_searcher import BaseSearcher, SearchResult
 from .keyword_searcher import KeywordSearcher
 from .vector_searcher import VectorSearcher
 
+logger = logging.getLogger(__name__)
+
+# 混合检索中向量检索只取ID与分数，正文等字段由ES补全
+_VECTOR_ID_FIELDS = ["global_id"]
+
+# RRF（倒数排名融合）平滑常数
+_RRF_K = 60
+
+# 并发向量检索线程数：检索器在各工具实例间共享，需容纳多个并行工具调用同时检索
+_MAX_VECTOR_WORKERS = 8
+
 
 class HybridSearcher(BaseSearcher):
     """混合检索器，结合关键词和向量检索"""
     
-    def __init__(self):
-        """初始化混合检索器"""
+    def __init__(
+        self,
+        keyword_searcher: Optional[KeywordSearcher] = None,
+        vector_searcher: Optional[VectorSearcher] = None
+    ):
+        """初始化混合检索器，可传入已有的子检索器以复用其连接"""
         # 初始化两个子检索器
-        self.keyword_searcher = KeywordSearcher()
-        self.vector_searcher = VectorSearcher()
+        self.keyword_searcher = keyword_searcher or KeywordSearcher()
+        self.vector_searcher = vector_searcher or VectorSearcher()
         
-        print("[HybridSearcher] 混合检索器初始化完成")
+        # 向量检索（embedding + Milvus）与关键词检索（ES）并发执行
+        self._executor = ThreadPoolExecutor(max_workers=_MAX_VECTOR_WORKERS, thread_name_prefix="hybrid-vector")
+        
+        logger.debug("混合检索器初始化完成")
     
     def _initialize_connection(self):
         """初始化连接（由子检索器处理）"""
@@ -42,8 +56,9 @@ class HybridSearcher(BaseSearcher):
         top_k: int = 10,
         chunk_range: Optional[tuple] = None,
         intent: str = "content",
+        return_stats: bool = False,
         **kwargs
-    ) -> List[SearchResult]:
+    ) -> Union[List[SearchResult], Tuple[List[SearchResult], Dict[str, Any]]]:
         """
         执行混合检索
         
@@ -52,126 +67,174 @@ class HybridSearcher(BaseSearcher):
             fund_code: 基金代码过滤
             source_file: 源文件过滤
             top_k: 每种检索器的候选数量上限，合并后可能多于该值
+            return_stats: 为 True 时同时返回两路检索的统计信息
             
         Returns:
-            List[SearchResult]: 混合检索结果列表
+            List[SearchResult]: 混合检索结果列表；return_stats 为 True 时返回 (结果列表, 统计信息)
         """
         
-        print(f"[HybridSearcher] 开始混合检索: {query}, 意图={intent}")
+        logger.debug("开始混合检索: %s, 意图=%s", query, intent)
         
         try:
-            # 处理查询字符串
-            if isinstance(query, list):
-                query_text = " ".join(str(item) for item in query)
-            else:
-                query_text = str(query) if query is not None else ""
+            # 处理查询字符串（只规范化一次，关键词检索直接使用规范化后的文本）
+            query_text = self._normalize_query(query)
 
-            query_text = query_text.strip()
-
-            if intent == "title":
-                keyword_query = query_text
-            else:
-                if isinstance(query, list):
-                    keyword_query = [str(item) for item in query]
-                else:
-                    keyword_query = [token for token in query_text.split() if token]
-
-            # 1. 执行向量检索
-            print("[HybridSearcher] 执行向量检索...")
-            vector_results = self.vector_searcher.search(
-                query=query_text,
+            # 1. 在后台线程执行向量检索（多个关键词时批量检索）
+            logger.debug("执行向量检索...")
+            vector_search = self.vector_searcher.search
+            vector_query: Union[str, List[str]] = query_text
+            if isinstance(query, list):
+                batch_queries = list(dict.fromkeys(
+                    [query_text] + [str(item).strip() for item in query if str(item).strip()]
+                ))
+                if len(batch_queries) > 1:
+                    vector_search = self._batch_vector_search
+                    vector_query = batch_queries
+            vector_future = self._executor.submit(
+                vector_search,
+                query=vector_query,
                 fund_code=fund_code,
                 source_file=source_file,
                 top_k=top_k,
                 chunk_range=chunk_range,
-                intent=intent
+                intent=intent,
+                output_fields=_VECTOR_ID_FIELDS
             )
             
-            # 2. 执行关键词检索
-            print("[HybridSearcher] 执行关键词检索...")
+            # 2. 同时在当前线程执行关键词检索
+            logger.debug("执行关键词检索...")
             keyword_results = self.keyword_searcher.search(
-                query=keyword_query,
+                query=query_text,
                 fund_code=fund_code,
                 source_file=source_file,
                 top_k=top_k,
                 chunk_range=chunk_range,
                 intent=intent
             )
+            vector_results = vector_future.result()
+            
+            # 统计信息需在合并改写分数之前计算
+            stats = self._build_statistics(vector_results, keyword_results) if return_stats else None
+            vector_results = self._hydrate_vector_results(vector_results, keyword_results)
             
             # 3. 合并去重（最多保留两路检索的全部不重复结果）
-            merged_results = self._merge_and_deduplicate(vector_results, keyword_results)
+            merged_results = self._merge_and_deduplicate(vector_results, keyword_results, intent)
 
             final_results = merged_results
-            print(f"[HybridSearcher] 混合检索完成，返回 {len(final_results)} 条结果")
-            return final_results
+            logger.debug("混合检索完成，返回 %d 条结果", len(final_results))
+            return (final_results, stats) if return_stats else final_results
             
         except Exception as e:
-            print(f"[HybridSearcher] 混合检索失败: {e}")
-            return []
+            logger.error("混合检索失败: %s", e)
+            return ([], self._build_statistics([], [])) if return_stats else []
     
-    def _merge_and_deduplicate(
+    def _batch_vector_search(
+        self,
+        query: List[str],
+        top_k: int = 10,
+        **kwargs
+    ) -> List[SearchResult]:
+        """批量向量检索多个查询，按 global_id 合并并保留最高分"""
+        
+        best: Dict[str, SearchResult] = {}
+        for results in self.vector_searcher.search_batch(query, top_k=top_k, **kwargs):
+            for result in results:
+                existing = best.get(result.global_id)
+                if existing is None or result.score > existing.score:
+                    best[result.global_id] = result
+        
+        return sorted(best.values(), key=lambda x: -x.score)[:top_k]
+    
+    def _hydrate_vector_results(
         self,
         vector_results: List[SearchResult],
         keyword_results: List[SearchResult]
     ) -> List[SearchResult]:
-        """合并两种检索结果并去重"""
+        """
+        为仅含ID与分数的向量检索结果补全字段：优先取关键词结果，其余一次ES查询获取，
+        ES未能补全（查询失败或缺失）的再按ID回查Milvus
+        """
+        
+        keyword_by_id = {result.global_id: result for result in keyword_results}
+        missing_ids = [r.global_id for r in vector_results if r.global_id not in keyword_by_id]
+        if missing_ids:
+            keyword_by_id.update(self.keyword_searcher.get_chunks_by_ids(missing_ids))
+            missing_ids = [global_id for global_id in missing_ids if global_id not in keyword_by_id]
+        if missing_ids:
+            logger.debug("ES未能补全 %d 条向量检索结果，回查Milvus", len(missing_ids))
+            keyword_by_id.update(self.vector_searcher.get_chunks_by_ids(missing_ids))
         
-        print(f"[HybridSearcher] 开始合并去重...")
-        print(f"  - 向量检索结果: {len(vector_results)} 条")
-        print(f"  - 关键词检索结果: {len(keyword_results)} 条")
+        hydrated = []
+        for result in vector_results:
+            source = keyword_by_id.get(result.global_id)
+            if source is None:
+                logger.warning("未能补全向量检索结果，已跳过: %s", result.global_id)
+                continue
+            hydrated.append(replace(source, score=result.score, from_methods=list(result.from_methods)))
         
-        all_results = []
-        seen_ids = set()
+        return hydrated
+    
+    def _merge_and_deduplicate(
+        self,
+        vector_results: List[SearchResult],
+        keyword_results: List[SearchResult],
+        intent: str = "content"
+    ) -> List[SearchResult]:
+        """合并两种检索结果并去重，按RRF（倒数排名融合）分数排序"""
+        
+        logger.debug("开始合并去重: 向量检索结果 %d 条, 关键词检索结果 %d 条",
+                     len(vector_results), len(keyword_results))
+        
+        by_id: Dict[str, SearchResult] = {}
+        rrf_scores: Dict[str, float] = {}
         duplicate_count = 0
         
         # 统计各种来源的结果数量
-        vector_only = []
-        keyword_only = []
-        both_methods = []
+        vector_only = keyword_only = both_methods = 0
         
-        # 1. 先添加向量检索结果（优先级高）
-        for result in vector_results:
-            if result.global_id not in seen_ids:
+        # 1. 先添加向量检索结果（各路结果已按分数降序，排名从1开始）
+        for rank, result in enumerate(vector_results, 1):
+            if result.global_id not in by_id:
                 result.from_methods = ["vector"]
-                all_results.append(result)
-                seen_ids.add(result.global_id)
-                vector_only.append(result)
+                by_id[result.global_id] = result
+                rrf_scores[result.global_id] = 1.0 / (_RRF_K + rank)
+                vector_only += 1
             else:
                 duplicate_count += 1
         
         # 2. 再添加关键词检索结果
-        for result in keyword_results:
-            if result.global_id not in seen_ids:
+        for rank, result in enumerate(keyword_results, 1):
+            existing = by_id.get(result.global_id)
+            if existing is None:
                 result.from_methods = ["keyword"]
-                all_results.append(result)
-                seen_ids.add(result.global_id)
-                keyword_only.append(result)
+                by_id[result.global_id] = result
+                rrf_scores[result.global_id] = 1.0 / (_RRF_K + rank)
+                keyword_only += 1
             else:
                 # 标记为两种方法都命中的结果
                 duplicate_count += 1
-                for existing in all_results:
-                    if existing.global_id == result.global_id:
-                        if "keyword" not in existing.from_methods:
-                            existing.from_methods.append("keyword")
-                            both_methods.append(existing)
-                        break
+                if "keyword" not in existing.from_methods:
+                    existing.from_methods.append("keyword")
+                    rrf_scores[result.global_id] += 1.0 / (_RRF_K + rank)
+                    vector_only -= 1
+                    both_methods += 1
+        
+        all_results = list(by_id.values())
+        for result in all_results:
+            result.score = rrf_scores[result.global_id]
         
         # 输出详细统计信息
-        print(f"[HybridSearcher] 去重统计:")
-        print(f"  - 去重前总数: {len(vector_results) + len(keyword_results)} 条")
-        print(f"  - 去重后总数: {len(all_results)} 条")
-        print(f"  - 重复项数量: {duplicate_count} 条")
-        
-        print(f"[HybridSearcher] 结果来源分布:")
-        print(f"  - 仅向量检索: {len(vector_only)} 条")
-        print(f"  - 仅关键词检索: {len(keyword_only)} 条")
-        print(f"  - 两种方法都命中: {len(both_methods)} 条")
-        
-        # 按分数排序（向量检索结果在前，相同来源内按分数降序）
-        all_results.sort(key=lambda x: (
-            0 if "vector" in x.from_methods else 1,  # 向量结果优先
-            -x.score  # 分数降序
-        ))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("去重统计: 去重前 %d 条, 去重后 %d 条, 重复项 %d 条",
+                         len(vector_results) + len(keyword_results), len(all_results), duplicate_count)
+            logger.debug("结果来源分布: 仅向量检索 %d 条, 仅关键词检索 %d 条, 两种方法都命中 %d 条",
+                         vector_only, keyword_only, both_methods)
+        
+        # 按RRF分数降序；标题检索以短语匹配为准，关键词命中的结果优先
+        if intent == "title":
+            all_results.sort(key=lambda x: (0 if "keyword" in x.from_methods else 1, -x.score))
+        else:
+            all_results.sort(key=lambda x: -x.score)
         
         return all_results
     
@@ -183,42 +246,24 @@ class HybridSearcher(BaseSearcher):
         top_k: int = 10,
         intent: str = "content"
     ) -> Dict[str, Any]:
-        """获取检索统计信息（用于分析和调试）"""
+        """获取检索统计信息（用于分析和调试）；需要结果时应直接调用 search(..., return_stats=True)"""
         
-        # 处理查询字符串
-        if isinstance(query, list):
-            query_text = " ".join(str(item) for item in query)
-        else:
-            query_text = str(query) if query is not None else ""
-
-        query_text = query_text.strip()
-
-        if intent == "title":
-            keyword_query = query_text
-        else:
-            if isinstance(query, list):
-                keyword_query = [str(item) for item in query]
-            else:
-                keyword_query = [token for token in query_text.split() if token]
-        
-        # 分别执行两种检索
-        vector_results = self.vector_searcher.search(
-            query=query_text,
-            fund_code=fund_code,
-            source_file=source_file,
-            top_k=top_k,
-            intent=intent
-        )
-        
-        keyword_results = self.keyword_searcher.search(
-            query=keyword_query,
+        return self.search(
+            query,
             fund_code=fund_code,
             source_file=source_file,
             top_k=top_k,
-            intent=intent
-        )
+            intent=intent,
+            return_stats=True
+        )[1]
+    
+    @staticmethod
+    def _build_statistics(
+        vector_results: List[SearchResult],
+        keyword_results: List[SearchResult]
+    ) -> Dict[str, Any]:
+        """分析两路检索结果的重叠情况"""
         
-        # 分析重叠情况
         vector_ids = {r.global_id for r in vector_results}
         keyword_ids = {r.global_id for r in keyword_results}
         overlap_ids = vector_ids & keyword_ids
@@ -239,6 +284,7 @@ class HybridSearcher(BaseSearcher):
         try:
             self.keyword_searcher.close_connection()
             self.vector_searcher.close_connection()
-            print("[HybridSearcher] 所有连接已关闭")
+            self._executor.shutdown(wait=False)
+            logger.info("所有连接已关闭")
         except Exception as e:
-            print(f"[HybridSearcher] 关闭连接时出错: {e}")
\ No newline at end of file
+            logger.error("关闭连接时出错: %s", e)
\ No newline at end of file
@@ -5,19 +5,22 @@
 基于Elasticsearch实现关键词检索功能
 """
 
+import logging
 import sys
-import os
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
 
-# 设置路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
-
-from db_config import get_elasticsearch_config
+from ..core.es_client import FastJsonSerializer
+from ..db_config import get_elasticsearch_config
 from .base_searcher import BaseSearcher, SearchResult
 
+logger = logging.getLogger(__name__)
+
+# 响应裁剪：只返回检索结果用到的字段，省去 _index/_id/_shards 等元数据的传输与解析
+_SEARCH_FILTER_PATH = ["hits.hits._source", "hits.hits._score"]
+_CHUNKS_FILTER_PATH = ["hits.hits._source", "hits.hits.sort"]
+
 
 class KeywordSearcher(BaseSearcher):
     """关键词检索器，基于Elasticsearch"""
@@ -27,20 +30,26 @@ class KeywordSearcher(BaseSearcher):
         self.es_config = get_elasticsearch_config()
         super().__init__(self.es_config)
         self.index_name = "reits_announcements"
-        print("[KeywordSearcher] 关键词检索器初始化完成")
+        logger.debug("关键词检索器初始化完成")
     
     def _initialize_connection(self):
         """初始化ES连接"""
         try:
             self._connection = Elasticsearch(
-                [f"{self.es_config['scheme']}://{self.es_config['host']}:{self.es_config['port']}"],
-                basic_auth=(self.es_config['username'], self.es_config['password']),
+                [f"{self.es_config.scheme}://{self.es_config.host}:{self.es_config.port}"],
+                basic_auth=(self.es_config.username, self.es_config.password),
+                http_compress=True,
+                connections_per_node=16,
+                request_timeout=10,
+                max_retries=2,
+                retry_on_timeout=True,
                 verify_certs=False,
-                ssl_show_warn=False
+                ssl_show_warn=False,
+                serializer=FastJsonSerializer()
             )
-            print("[KeywordSearcher] Elasticsearch连接成功")
+            logger.info("Elasticsearch连接成功")
         except Exception as e:
-            print(f"[KeywordSearcher] Elasticsearch连接失败: {e}")
+            logger.error("Elasticsearch连接失败: %s", e)
             raise e
     
     def search(
@@ -66,7 +75,7 @@ class KeywordSearcher(BaseSearcher):
             List[SearchResult]: 检索结果列表
         """
         
-        print(f"[KeywordSearcher] 开始关键词检索: {query}, 意图={intent}")
+        logger.debug("开始关键词检索: %s, 意图=%s", query, intent)
         
         try:
             # 构建查询
@@ -77,17 +86,18 @@ class KeywordSearcher(BaseSearcher):
             # 执行搜索
             response = self._connection.search(
                 index=self.index_name,
-                body=search_body
+                body=search_body,
+                filter_path=_SEARCH_FILTER_PATH
             )
             
             # 处理结果
             results = self._process_search_results(response)
             
-            print(f"[KeywordSearcher] 关键词检索完成，返回 {len(results)} 条结果")
+            logger.debug("关键词检索完成，返回 %d 条结果", len(results))
             return results
             
         except Exception as e:
-            print(f"[KeywordSearcher] 关键词检索失败: {e}")
+            logger.error("关键词检索失败: %s", e)
             return []
     
     def _build_search_query(
@@ -101,13 +111,8 @@ class KeywordSearcher(BaseSearcher):
     ) -> Dict[str, Any]:
         """构建ES查询体"""
         
-        # 处理查询字符串
-        if isinstance(query, list):
-            query_text = " ".join(str(item) for item in query)
-        else:
-            query_text = str(query) if query is not None else ""
-
-        query_text = query_text.strip()
+        # 处理查询字符串（已规范化的字符串仅做 strip）
+        query_text = self._normalize_query(query)
 
         if intent == "title":
             base_query = {
@@ -120,12 +125,14 @@ class KeywordSearcher(BaseSearcher):
                 "multi_match": {
                     "query": query_text,
                     "fields": ["text"],
-                    "type": "best_fields",
-                    "fuzziness": "AUTO"
+                    "type": "best_fields"
                 }
             }
+            # 仅当存在长度>=3的ASCII词时启用模糊匹配；中文及短词下 AUTO 等价于精确匹配，徒增ES开销
+            if any(len(token) >= 3 and token.isascii() for token in query_text.split()):
+                base_query["multi_match"]["fuzziness"] = "AUTO"
         
-        print(f"[KeywordSearcher] 使用intent={intent}, 查询文本预览: {query_text[:80]}")
+        logger.debug("使用intent=%s, 查询文本预览: %.80s", intent, query_text)
 
         # 构建过滤条件
         must_filters = []
@@ -174,9 +181,7 @@ class KeywordSearcher(BaseSearcher):
                 "global_id", "chunk_id", "source_file", "page_num", 
                 "text", "fund_code", "date", "short_name"
             ],
-            "sort": [
-                {"_score": {"order": "desc"}}
-            ]
+            "track_total_hits": False
         }
         
         return search_body
@@ -184,29 +189,28 @@ class KeywordSearcher(BaseSearcher):
     def _process_search_results(self, response: Dict) -> List[SearchResult]:
         """处理ES检索结果"""
         
-        results = []
-        hits = response.get('hits', {}).get('hits', [])
-        
-        for hit in hits:
-            score = hit.get('_score', 0.0)
-            search_result = self._format_search_result(hit, score, 'keyword')
-            results.append(search_result)
-        
-        return results
+        fmt = self._format_search_result
+        return [fmt(hit, hit.get('_score', 0.0), 'keyword') for hit in response.get('hits', {}).get('hits', [])]
     
     def get_file_chunks(
         self,
         fund_code: str,
         source_file: str,
-        sort_by_chunk_id: bool = True
+        sort_by_chunk_id: bool = True,
+        chunk_id_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+        page_size: int = 1000
     ) -> List[SearchResult]:
-        """获取指定文件的所有语块"""
+        """
+        获取指定文件的所有语块
+        
+        chunk_id_range 为 (起始, 结束) chunk_id 时仅获取该范围内的语块（由ES过滤）；
+        按chunk_id排序时使用 search_after 分页获取，否则使用 scroll 扫描，每页 page_size 条
+        """
         
-        print(f"[KeywordSearcher] 获取文件语块: {source_file}")
+        logger.debug("获取文件语块: %s, chunk_id范围: %s", source_file, chunk_id_range)
         
         try:
             search_body = {
-                "size": 10000,  # 获取所有语块
                 "query": {
                     "bool": {
                         "must": [
@@ -225,27 +229,104 @@ class KeywordSearcher(BaseSearcher):
                 "_source": [
                     "global_id", "chunk_id", "source_file", "page_num", 
                     "text", "fund_code", "date", "short_name"
-                ]
+                ],
+                "track_total_hits": False
             }
             
-            if sort_by_chunk_id:
-                search_body["sort"] = [{"chunk_id": {"order": "asc"}}]
+            if chunk_id_range and any(value is not None for value in chunk_id_range):
+                start_chunk, end_chunk = chunk_id_range
+                id_range = {}
+                if start_chunk is not None:
+                    id_range["gte"] = start_chunk
+                if end_chunk is not None:
+                    id_range["lte"] = end_chunk
+                search_body["query"]["bool"]["filter"] = [{"range": {"chunk_id": id_range}}]
             
-            response = self._connection.search(
-                index=self.index_name,
-                body=search_body
-            )
+            if not sort_by_chunk_id:
+                # 不排序时以 scroll 扫描全部语块，不受 10000 条窗口限制
+                results = [
+                    self._format_search_result(hit, 1.0, 'keyword')
+                    for hit in scan(self._connection, query=search_body, index=self.index_name, size=page_size)
+                ]
+                logger.debug("获取到 %d 个语块", len(results))
+                return self._share_file_fields(results, fund_code, source_file)
             
+            search_body["size"] = page_size
+            search_body["sort"] = [{"chunk_id": {"order": "asc"}}]
+            
+            fmt = self._format_search_result
             results = []
-            hits = response.get('hits', {}).get('hits', [])
+            while True:
+                response = self._connection.search(
+                    index=self.index_name,
+                    body=search_body,
+                    filter_path=_CHUNKS_FILTER_PATH
+                )
+                hits = response.get('hits', {}).get('hits', [])
+                
+                results.extend([fmt(hit, 1.0, 'keyword') for hit in hits])
+                
+                if len(hits) < page_size:
+                    break
+                search_body["search_after"] = hits[-1]['sort']
             
-            for hit in hits:
-                search_result = self._format_search_result(hit, 1.0, 'keyword')
-                results.append(search_result)
+            logger.debug("获取到 %d 个语块", len(results))
+            return self._share_file_fields(results, fund_code, source_file)
             
-            print(f"[KeywordSearcher] 获取到 {len(results)} 个语块")
+        except Exception as e:
+            logger.error("获取文件语块失败: %s", e)
+            return []
+    
+    @staticmethod
+    def _share_file_fields(results: List[SearchResult], fund_code: str, source_file: str) -> List[SearchResult]:
+        """整个文件的语块共用同一份驻留后的 fund_code / source_file 字符串，每批只驻留一次"""
+        if not (results and isinstance(fund_code, str) and isinstance(source_file, str)):
             return results
+        fund_code = sys.intern(fund_code)
+        source_file = sys.intern(source_file)
+        for result in results:
+            if result.fund_code == fund_code:
+                result.fund_code = fund_code
+            if result.source_file == source_file:
+                result.source_file = source_file
+        return results
+    
+    def get_chunks_by_ids(self, global_ids: List[str]) -> Dict[str, SearchResult]:
+        """按 global_id 批量获取语块，返回 global_id -> SearchResult"""
+        
+        if not global_ids:
+            return {}
+        
+        try:
+            search_body = {
+                "size": len(global_ids),
+                "query": {
+                    "bool": {
+                        "should": [
+                            {"terms": {"global_id.keyword": global_ids}},
+                            {"terms": {"global_id": global_ids}}
+                        ]
+                    }
+                },
+                "_source": [
+                    "global_id", "chunk_id", "source_file", "page_num", 
+                    "text", "fund_code", "date", "short_name"
+                ],
+                "track_total_hits": False
+            }
+            
+            response = self._connection.search(
+                index=self.index_name,
+                body=search_body,
+                filter_path=_SEARCH_FILTER_PATH
+            )
+            
+            chunks = {}
+            for hit in response.get('hits', {}).get('hits', []):
+                search_result = self._format_search_result(hit, 1.0, 'keyword')
+                chunks[search_result.global_id] = search_result
+            return chunks
             
         except Exception as e:
-            print(f"[KeywordSearcher] 获取文件语块失败: {e}")
-            return []
\ No newline at end of file
+            logger.error("按ID获取语块失败: %s", e)
+            return {}
\ No newline at end of file
@@ -5,20 +5,67 @@
 基于Milvus向量数据库实现语义检索功能
 """
 
-import sys
-import os
+import functools
+import hashlib
+import logging
+import math
 from typing import List, Dict, Any, Optional
 from pymilvus import connections, Collection
 from openai import OpenAI
 
-# 设置路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
+from ..db_config import get_vector_db_config
+from ..model_config import get_model_config
+from ..utils.ttl_cache import TTLCache
+from .base_searcher import BaseSearcher, SearchResult, _to_chunk_id
 
-from db_config import get_vector_db_config
-from model_config import MODEL_CONFIG
-from .base_searcher import BaseSearcher, SearchResult
+try:  # numpy 为可选依赖（pymilvus 已依赖），未安装时查询向量以列表传递
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+# 查询向量缓存：(模型, 文本sha256) -> 向量元组，重复查询免去 embedding 调用
+_EMBEDDING_CACHE = TTLCache(maxsize=4096, ttl=3600)
+
+# Milvus检索返回的字段
+_OUTPUT_FIELDS = [
+    "global_id", "chunk_id", "source_file", "page_num",
+    "text", "fund_code", "date", "short_name"
+]
+
+# Milvus表达式字符串字面量转义
+_EXPR_ESCAPE = str.maketrans({'"': '\\"', "\\": "\\\\"})
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_filter_expression(
+    fund_code: Optional[str],
+    source_file: Optional[str],
+    chunk_range: Optional[tuple]
+) -> Optional[str]:
+    """构建并缓存Milvus过滤表达式，同一过滤条件重复检索时直接复用"""
+
+    conditions = []
+
+    if fund_code:
+        conditions.append(f'fund_code == "{fund_code.translate(_EXPR_ESCAPE)}"')
+
+    if source_file:
+        conditions.append(f'source_file == "{source_file.translate(_EXPR_ESCAPE)}"')
+
+    if chunk_range and any(value is not None for value in chunk_range):
+        start_chunk, end_chunk = chunk_range
+        if start_chunk is not None:
+            conditions.append(f'chunk_id >= {int(start_chunk)}')
+        if end_chunk is not None:
+            conditions.append(f'chunk_id <= {int(end_chunk)}')
+
+    if conditions:
+        return " and ".join(conditions)
+    else:
+        return None
 
 
 class VectorSearcher(BaseSearcher):
@@ -28,27 +75,33 @@ class VectorSearcher(BaseSearcher):
         """初始化向量检索器"""
         self.vector_config = get_vector_db_config()
         
+        # 向量缓存命中统计
+        self.embedding_cache_hits = 0
+        self.embedding_cache_misses = 0
+        
         # 初始化embedding模型客户端
         self._init_embedding_client()
         
         # Milvus配置 - 在调用super().__init__之前设置
         self.collection_name = "reits_announcement"  
         self.alias_name = "intelligent_search_connection"
+        self._index_type: Optional[str] = None
+        self._partition_names: frozenset = frozenset()
         
         # 调用父类初始化（会调用_initialize_connection）
         super().__init__(self.vector_config)
         
-        print("[VectorSearcher] 向量检索器初始化完成")
+        logger.debug("向量检索器初始化完成")
     
     def _initialize_connection(self):
         """初始化Milvus连接"""
         try:
             connections.connect(
                 alias=self.alias_name,
-                host=self.vector_config['host'],
-                port=self.vector_config['port'],
-                user=self.vector_config['user'],
-                password=self.vector_config['password']
+                host=self.vector_config.host,
+                port=self.vector_config.port,
+                user=self.vector_config.user,
+                password=self.vector_config.password
             )
             
             # 初始化Collection
@@ -56,27 +109,44 @@ class VectorSearcher(BaseSearcher):
                 name=self.collection_name,
                 using=self.alias_name
             )
+            self._index_type = self._detect_index_type()
+            self._partition_names = frozenset(partition.name for partition in self._connection.partitions)
+            
+            # 预先加载集合到内存，避免首次检索时冷加载分段
+            self._connection.load()
             
-            print("[VectorSearcher] Milvus连接成功")
+            logger.info("Milvus连接成功")
             
         except Exception as e:
-            print(f"[VectorSearcher] Milvus连接失败: {e}")
+            logger.error("Milvus连接失败: %s", e)
             raise e
     
+    def _detect_index_type(self) -> Optional[str]:
+        """读取集合向量字段的索引类型，用于选择对应的检索参数"""
+        try:
+            for index in self._connection.indexes:
+                if index.field_name == "embedding":
+                    index_type = index.params.get("index_type")
+                    logger.debug("向量索引类型: %s", index_type)
+                    return index_type
+        except Exception as e:
+            logger.warning("无法读取向量索引类型，使用默认检索参数: %s", e)
+        return None
+    
     def _init_embedding_client(self):
         """初始化embedding模型客户端"""
         try:
             # 使用智谱AI的embedding模型
-            embedding_config = MODEL_CONFIG["zhipu"]["embedding-3"]
+            embedding_config = get_model_config("zhipu", "embedding-3")
             self.embedding_client = OpenAI(
-                api_key=embedding_config["api_key"],
-                base_url=embedding_config["base_url"]
+                api_key=embedding_config.api_key,
+                base_url=embedding_config.base_url
             )
-            self.embedding_model = embedding_config["model"]
-            print("[VectorSearcher] Embedding客户端初始化成功")
+            self.embedding_model = embedding_config.model
+            logger.debug("Embedding客户端初始化成功")
             
         except Exception as e:
-            print(f"[VectorSearcher] Embedding客户端初始化失败: {e}")
+            logger.error("Embedding客户端初始化失败: %s", e)
             raise e
     
     def search(
@@ -87,6 +157,7 @@ class VectorSearcher(BaseSearcher):
         top_k: int = 10,
         chunk_range: Optional[tuple] = None,
         intent: str = "content",
+        output_fields: Optional[List[str]] = None,
         **kwargs
     ) -> List[SearchResult]:
         """
@@ -97,27 +168,29 @@ class VectorSearcher(BaseSearcher):
             fund_code: 基金代码过滤
             source_file: 源文件过滤
             top_k: 返回结果数量
+            output_fields: Milvus返回字段，默认返回全部字段；仅需ID与分数时可传 ["global_id"]
             
         Returns:
             List[SearchResult]: 检索结果列表
         """
         
         query = "" if query is None else str(query).strip()
-        print(f"[VectorSearcher] 开始向量检索: {query[:50]}..., 意图={intent}")
+        logger.debug("开始向量检索: %.50s..., 意图=%s", query, intent)
         
         try:
             # 1. 生成查询向量
             query_vector = self._generate_embedding(query)
             if not query_vector:
-                print("[VectorSearcher] 查询向量生成失败")
+                logger.error("查询向量生成失败")
                 return []
             
             # 2. 构建搜索参数
-            search_params = self._build_search_params()
+            search_params = self._build_search_params(top_k, **kwargs)
             
-            # 3. 构建过滤表达式
+            # 3. 构建过滤表达式（基金已按分区存储时改为分区检索，不再按 fund_code 过滤）
+            partition_names = self._fund_partitions(fund_code)
             expr = self._build_filter_expression(
-                fund_code=fund_code,
+                fund_code=None if partition_names else fund_code,
                 source_file=source_file,
                 chunk_range=chunk_range,
                 intent=intent
@@ -125,27 +198,81 @@ class VectorSearcher(BaseSearcher):
             
             # 4. 执行向量搜索
             results = self._connection.search(
-                data=[query_vector],
+                data=self._to_query_data([query_vector]),
                 anns_field="embedding",
                 param=search_params,
                 limit=top_k,
                 expr=expr,
-                output_fields=[
-                    "global_id", "chunk_id", "source_file", "page_num",
-                    "text", "fund_code", "date", "short_name"
-                ]
+                output_fields=output_fields or _OUTPUT_FIELDS,
+                partition_names=partition_names
             )
             
             # 5. 处理搜索结果
             formatted_results = self._process_search_results(results)
             
-            print(f"[VectorSearcher] 向量检索完成，返回 {len(formatted_results)} 条结果")
+            logger.debug("向量检索完成，返回 %d 条结果", len(formatted_results))
             return formatted_results
             
         except Exception as e:
-            print(f"[VectorSearcher] 向量检索失败: {e}")
+            logger.error("向量检索失败: %s", e)
             return []
     
+    def search_batch(
+        self,
+        queries: List[str],
+        fund_code: Optional[str] = None,
+        source_file: Optional[str] = None,
+        top_k: int = 10,
+        chunk_range: Optional[tuple] = None,
+        intent: str = "content",
+        output_fields: Optional[List[str]] = None,
+        **kwargs
+    ) -> List[List[SearchResult]]:
+        """
+        批量向量检索：一次embedding调用生成全部查询向量，一次Milvus请求完成检索
+        
+        Returns:
+            List[List[SearchResult]]: 与 queries 一一对应的检索结果列表
+        """
+        
+        queries = ["" if query is None else str(query).strip() for query in queries]
+        logger.debug("开始批量向量检索: %d 个查询, 意图=%s", len(queries), intent)
+        if not queries:
+            return []
+        
+        try:
+            query_vectors = self._generate_embeddings_batch(queries)
+            if not query_vectors:
+                logger.error("批量查询向量生成失败")
+                return [[] for _ in queries]
+            
+            partition_names = self._fund_partitions(fund_code)
+            expr = self._build_filter_expression(
+                fund_code=None if partition_names else fund_code,
+                source_file=source_file,
+                chunk_range=chunk_range,
+                intent=intent
+            )
+            
+            results = self._connection.search(
+                data=self._to_query_data(query_vectors),
+                anns_field="embedding",
+                param=self._build_search_params(top_k, **kwargs),
+                limit=top_k,
+                expr=expr,
+                output_fields=output_fields or _OUTPUT_FIELDS,
+                partition_names=partition_names
+            )
+            
+            batch_results = [self._process_hits(hits) for hits in results]
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("批量向量检索完成，共返回 %d 条结果", sum(len(r) for r in batch_results))
+            return batch_results
+            
+        except Exception as e:
+            logger.error("批量向量检索失败: %s", e)
+            return [[] for _ in queries]
+    
     def _generate_embedding(self, text: str) -> Optional[List[float]]:
         """生成文本的向量表示"""
         
@@ -154,28 +281,110 @@ class VectorSearcher(BaseSearcher):
             if len(text) > 8000:
                 text = text[:8000]
             
+            cache_key = (self.embedding_model, hashlib.sha256(text.encode("utf-8")).digest())
+            cached = _EMBEDDING_CACHE.get(cache_key)
+            if cached is not None:
+                self.embedding_cache_hits += 1
+                logger.debug("命中向量缓存（命中 %d / 未命中 %d）", self.embedding_cache_hits, self.embedding_cache_misses)
+                return list(cached)
+            self.embedding_cache_misses += 1
+            
             response = self.embedding_client.embeddings.create(
                 input=text,
                 model=self.embedding_model
             )
             
-            embedding = response.data[0].embedding
-            print(f"[VectorSearcher] 向量生成成功，维度: {len(embedding)}")
+            embedding = self._normalize(response.data[0].embedding)
+            _EMBEDDING_CACHE.set(cache_key, tuple(embedding))
+            logger.debug("向量生成成功，维度: %d", len(embedding))
             return embedding
             
         except Exception as e:
-            print(f"[VectorSearcher] 向量生成失败: {e}")
+            logger.error("向量生成失败: %s", e)
             return None
     
-    def _build_search_params(self) -> Dict[str, Any]:
-        """构建向量搜索参数"""
+    def _generate_embeddings_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """批量生成文本向量，已缓存的文本不再请求，其余一次调用生成"""
+        
+        try:
+            texts = [text[:8000] for text in texts]
+            keys = [
+                (self.embedding_model, hashlib.sha256(text.encode("utf-8")).digest())
+                for text in texts
+            ]
+            embeddings: List[Optional[List[float]]] = []
+            missing: List[int] = []
+            for index, key in enumerate(keys):
+                cached = _EMBEDDING_CACHE.get(key)
+                embeddings.append(None if cached is None else list(cached))
+                if cached is None:
+                    missing.append(index)
+            
+            self.embedding_cache_hits += len(texts) - len(missing)
+            self.embedding_cache_misses += len(missing)
+            
+            if missing:
+                response = self.embedding_client.embeddings.create(
+                    input=[texts[index] for index in missing],
+                    model=self.embedding_model
+                )
+                for index, item in zip(missing, sorted(response.data, key=lambda d: d.index)):
+                    embeddings[index] = self._normalize(item.embedding)
+                    _EMBEDDING_CACHE.set(keys[index], tuple(embeddings[index]))
+            
+            logger.debug("批量向量生成成功: %d 个文本，其中 %d 个调用接口生成", len(texts), len(missing))
+            return embeddings
+            
+        except Exception as e:
+            logger.error("批量向量生成失败: %s", e)
+            return None
+    
+    @staticmethod
+    def _to_query_data(vectors: List[List[float]]) -> List[Any]:
+        """将查询向量转为 float32 数组，pymilvus 可直接序列化而无需逐元素转换"""
+        if np is None:
+            return vectors
+        return [np.asarray(vector, dtype=np.float32) for vector in vectors]
+    
+    def _normalize(self, embedding: List[float]) -> List[float]:
+        """IP度量下将向量归一化为单位长度，使内积等价于余弦相似度"""
+        if self.vector_config.metric_type != "IP":
+            return embedding
+        norm = math.hypot(*embedding)
+        if norm == 0.0:
+            return embedding
+        return [value / norm for value in embedding]
+    
+    def clear_embedding_cache(self) -> None:
+        """清空查询向量缓存并重置命中统计"""
+        _EMBEDDING_CACHE.clear()
+        self.embedding_cache_hits = 0
+        self.embedding_cache_misses = 0
+    
+    def _build_search_params(self, top_k: int = 10, **kwargs) -> Dict[str, Any]:
+        """按索引类型构建向量搜索参数，可通过 ef / nprobe / search_list 覆盖默认值"""
+        index_type = self._index_type or ""
+        if index_type == "HNSW":
+            params = {"ef": kwargs.get("ef", max(64, top_k * 4))}
+        elif index_type.startswith("IVF"):
+            params = {"nprobe": kwargs.get("nprobe", 32)}
+        elif index_type == "DISKANN":
+            params = {"search_list": kwargs.get("search_list", max(100, top_k * 8))}
+        else:
+            params = {"nprobe": kwargs.get("nprobe", 16)}  # 索引类型未知时沿用原参数
+        
         return {
-            "metric_type": "L2",  # 使用L2距离
-            "params": {
-                "nprobe": 16  # 平衡检索速度和精度
-            }
+            "metric_type": self.vector_config.metric_type,  # 与集合索引的度量类型一致
+            "params": params
         }
     
+    def _fund_partitions(self, fund_code: Optional[str]) -> Optional[List[str]]:
+        """基金存在独立分区（命名为 fund_<基金代码>）时返回分区列表，否则返回 None"""
+        if not fund_code:
+            return None
+        partition_name = f"fund_{fund_code}"
+        return [partition_name] if partition_name in self._partition_names else None
+    
     def _build_filter_expression(
         self,
         fund_code: Optional[str] = None,
@@ -185,63 +394,68 @@ class VectorSearcher(BaseSearcher):
     ) -> Optional[str]:
         """构建Milvus过滤表达式"""
 
-        conditions = []
-
         _ = intent  # 保留参数，便于根据意图调整过滤策略
-
-        if fund_code:
-            conditions.append(f'fund_code == "{fund_code}"')
-
-        if source_file:
-            conditions.append(f'source_file == "{source_file}"')
-
-        if chunk_range and any(value is not None for value in chunk_range):
-            start_chunk, end_chunk = chunk_range
-            if start_chunk is not None:
-                conditions.append(f'chunk_id >= {start_chunk}')
-            if end_chunk is not None:
-                conditions.append(f'chunk_id <= {end_chunk}')
-
-        if conditions:
-            return " and ".join(conditions)
-        else:
-            return None
+        return _compile_filter_expression(
+            fund_code or None,
+            source_file or None,
+            tuple(chunk_range) if chunk_range else None
+        )
 
     def _process_search_results(self, milvus_results) -> List[SearchResult]:
         """处理Milvus检索结果"""
         
-        results = []
-        
-        for hits in milvus_results:
-            for hit in hits:
-                # 转换L2距离为相似度分数
-                distance = hit.distance
-                score = 1.0 / (1.0 + distance)  # 距离越小，分数越高
-                
-                # 构建结果数据
-                result_data = {
-                    '_source': {
-                        'global_id': hit.entity.get('global_id', ''),
-                        'chunk_id': hit.entity.get('chunk_id', 0),
-                        'source_file': hit.entity.get('source_file', ''),
-                        'page_num': hit.entity.get('page_num', ''),
-                        'text': hit.entity.get('text', ''),
-                        'fund_code': hit.entity.get('fund_code', ''),
-                        'date': hit.entity.get('date', ''),
-                        'short_name': hit.entity.get('short_name', '')
-                    }
-                }
-                
-                search_result = self._format_search_result(result_data, score, 'vector')
-                results.append(search_result)
-        
-        return results
+        process = self._process_hits
+        return [result for hits in milvus_results for result in process(hits)]
+    
+    def _process_hits(self, hits) -> List[SearchResult]:
+        """处理单个查询向量的Milvus命中结果"""
+        
+        fmt = self._format_search_result_from_entity
+        if self.vector_config.metric_type == "IP":
+            # IP度量下 distance 即为余弦相似度，直接作为分数
+            return [fmt(hit.entity, float(hit.distance), 'vector') for hit in hits]
+        
+        # 转换L2距离为相似度分数，距离越小，分数越高
+        return [fmt(hit.entity, 1.0 / (1.0 + hit.distance), 'vector') for hit in hits]
+    
+    def get_chunks_by_ids(self, global_ids: List[str]) -> Dict[str, SearchResult]:
+        """按 global_id 从Milvus批量获取语块（不做向量检索），返回 global_id -> SearchResult"""
+        
+        if not global_ids:
+            return {}
+        
+        try:
+            id_list = ", ".join(f'"{str(global_id).translate(_EXPR_ESCAPE)}"' for global_id in global_ids)
+            entities = self._connection.query(
+                expr=f"global_id in [{id_list}]",
+                output_fields=_OUTPUT_FIELDS
+            )
+            chunks = {}
+            for entity in entities:
+                search_result = self._format_search_result_from_entity(entity, 1.0, "vector")
+                chunks[search_result.global_id] = search_result
+            return chunks
+            
+        except Exception as e:
+            logger.error("按ID获取Milvus语块失败: %s", e)
+            return {}
+    
+    @staticmethod
+    def _format_search_result_from_entity(entity, score: float, method: str) -> SearchResult:
+        """直接由Milvus命中实体构建检索结果，省去 _source 字典包装"""
+        get = entity.get
+        return SearchResult(
+            get('global_id', ''), _to_chunk_id(get('chunk_id')), get('source_file', ''),
+            get('page_num', ''), get('text', ''), score,
+            get('fund_code', ''), get('date', ''), get('short_name', ''),
+            [method]
+        )
     
     def close_connection(self):
         """关闭Milvus连接"""
         try:
             if hasattr(connections, 'disconnect'):
                 connections.disconnect(alias=self.alias_name)
-                print("[VectorSearcher] Milvus连接已关闭")
+                logger.info("Milvus连接已关闭")
         except Exception as e:
-            print(f"[VectorSearcher] 关闭连接时出错: {e}")
+            logger.error("关闭连接时出错: %s", e)
@@ -1,16 +1,21 @@
 """面向 LLM 的招募说明书检索工具封装"""
 from __future__ import annotations
 
-import json
+import threading
 from typing import Any, Dict, Optional
 
 from .prospectus_search_tool import ProspectusSearchTool
+from .utils.fastjson import dumps
 
 # 单例缓存，避免重复初始化造成的资源浪费
 _TOOL_INSTANCE: Optional[ProspectusSearchTool] = None
+_TOOL_LOCK = threading.Lock()
 
 TOOL_NAME = "prospectus_search"
 
+# 章节标题检索前缀（全角/半角冒号）
+_TITLE_PREFIXES = ("章节标题检索：", "章节标题检索:")
+
 PROSPECTUS_SEARCH_TOOL_SPEC = {
     "type": "function",
     "function": {
@@ -85,13 +90,10 @@ def _guess_intent(search_info: Any) -> str:
     if not isinstance(search_info, str):
         return "content"
     stripped = search_info.strip()
-    if not stripped:
-        return "content"
     if stripped == "目录":
         return "catalog"
-    for prefix in ("章节标题检索：", "章节标题检索:"):
-        if stripped.startswith(prefix):
-            return "title"
+    if stripped.startswith(_TITLE_PREFIXES):
+        return "title"
     return "content"
 
 
@@ -122,9 +124,14 @@ def _build_wrapper_error(intent: str, message: str) -> Dict[str, Any]:
 def _get_tool_instance() -> ProspectusSearchTool:
     """获取单例工具实例"""
     global _TOOL_INSTANCE
-    if _TOOL_INSTANCE is None:
-        _TOOL_INSTANCE = ProspectusSearchTool()
-    return _TOOL_INSTANCE
+    instance = _TOOL_INSTANCE
+    if instance is not None:
+        return instance
+    # 双重检查加锁：并发首次调用时只构建一个实例，初始化后读取无需加锁
+    with _TOOL_LOCK:
+        if _TOOL_INSTANCE is None:
+            _TOOL_INSTANCE = ProspectusSearchTool()
+        return _TOOL_INSTANCE
 
 
 def _parse_optional_int(value: Any, label: str) -> Optional[int]:
@@ -172,14 +179,18 @@ def _normalize_arguments(arguments: Dict[str, Any]) -> Dict[str, Any]:
     if "fund_code" not in arguments or "search_info" not in arguments:
         raise ValueError("缺少必要字段 fund_code 或 search_info")
 
-    normalized["fund_code"] = str(arguments["fund_code"]).strip()
-    normalized["search_info"] = (
-        str(arguments["search_info"]) if arguments["search_info"] is not None else ""
-    )
+    # LLM 工具调用解码后通常已是字符串/布尔值，直接使用，只在其他类型时转换
+    fund_code = arguments["fund_code"]
+    normalized["fund_code"] = (fund_code if type(fund_code) is str else str(fund_code)).strip()
+    search_info = arguments["search_info"]
+    if type(search_info) is str:
+        normalized["search_info"] = search_info
+    else:
+        normalized["search_info"] = str(search_info) if search_info is not None else ""
 
     is_expansion = arguments.get("is_expansion", False)
     normalized["is_expansion"] = (
-        _parse_bool(is_expansion) if not isinstance(is_expansion, bool) else is_expansion
+        is_expansion if is_expansion is True or is_expansion is False else _parse_bool(is_expansion)
     )
 
     normalized["start_page"] = _parse_optional_int(arguments.get("start_page"), "start_page")
@@ -215,13 +226,16 @@ def call_prospectus_search(arguments: Dict[str, Any], *, return_json: bool = Tru
             result = _build_wrapper_error(intent, f"tool_execution_error: {exc}")
 
     if return_json:
-        return json.dumps(result, ensure_ascii=False)
+        return dumps(result)
     return result
 
 
 def shutdown_tool() -> None:
     """释放缓存的工具实例及相关资源"""
     global _TOOL_INSTANCE
-    if _TOOL_INSTANCE is not None:
-        _TOOL_INSTANCE.close_connections()
-        _TOOL_INSTANCE = None
+    if _TOOL_INSTANCE is None:
+        return
+    with _TOOL_LOCK:
+        instance, _TOOL_INSTANCE = _TOOL_INSTANCE, None
+    if instance is not None:
+        instance.close_connections()
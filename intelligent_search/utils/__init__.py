@@ -1,12 +1,17 @@
 # utils/__init__.py
 """
 工具函数模块
-包含页码处理、语块处理、LLM相关工具、语块选择器
+包含页码处理、语块处理、LLM相关工具、语块选择器、TTL缓存、队列日志
 """
 
-from .page_utils import PageUtils
-from .chunk_utils import ChunkUtils
+from .page_utils import PageUtils, PageIndex
+from .chunk_utils import ChunkUtils, ChunkColumns
 from .llm_utils import LLMUtils
 from .chunk_selector import ChunkSelector
+from .ttl_cache import TTLCache
+from .log_utils import enable_queue_logging, disable_queue_logging
 
-__all__ = ['PageUtils', 'ChunkUtils', 'LLMUtils', 'ChunkSelector']
\ No newline at end of file
+__all__ = [
+    'PageUtils', 'PageIndex', 'ChunkUtils', 'ChunkColumns', 'LLMUtils', 'ChunkSelector', 'TTLCache',
+    'enable_queue_logging', 'disable_queue_logging'
+]
\ No newline at end of file
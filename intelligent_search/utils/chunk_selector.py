@@ -5,17 +5,44 @@
 使用LLM从候选语块中选择最相关的内容
 """
 
-import sys
-import os
-from typing import List, Dict, Any, Optional, Tuple
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Hashable, Optional, Tuple
 
-# 设置路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
+from openai import BadRequestError
 
-from searchers.base_searcher import SearchResult
-from utils.llm_utils import LLMUtils
+from ..searchers.base_searcher import SearchResult
+from .llm_utils import LLMUtils
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+# LLM选择结果缓存：键为 (cache_key, 意图, 检索需求, 候选chunk_id)，值为选中的chunk_id，-1 表示无匹配
+_SELECTION_CACHE = TTLCache(maxsize=1024, ttl=3600)
+
+# 批量选择时并发LLM请求数上限
+_MAX_SELECTION_WORKERS = 8
+
+# 选择prompt中各列的字符上限：前文取末尾、后文取开头，合计与原单条1000字符上限一致
+_PREV_TEXT_LIMIT = 200
+_BODY_TEXT_LIMIT = 600
+_NEXT_TEXT_LIMIT = 200
+
+# 列式prompt中单元格内的换行与分隔符替换
+_CELL_TRANS = str.maketrans({"\n": " ", "\r": " ", "|": "｜"})
+
+
+@dataclass(slots=True)
+class ExpandedCandidate:
+    """带相邻上下文的候选语块"""
+    index: int
+    chunk_id: int
+    original_text: str
+    prev_text: str
+    next_text: str
+    page_num: str
 
 
 class ChunkSelector:
@@ -26,7 +53,9 @@ class ChunkSelector:
         self.llm_client = llm_client
         self.llm_model = llm_model
         self._last_selection_note: Optional[str] = None
-        print("[ChunkSelector] 语块选择器初始化完成")
+        # 模型服务不支持 JSON mode 时自动关闭，后续请求不再携带 response_format
+        self._json_mode = True
+        logger.debug("语块选择器初始化完成")
     
     def select_best_chunk(
         self,
@@ -34,7 +63,8 @@ class ChunkSelector:
         candidate_results: List[SearchResult],
         all_chunks: List[SearchResult],
         expand_context: bool = True,
-        intent: str = "content"
+        intent: str = "content",
+        cache_key: Optional[Hashable] = None
     ) -> Optional[SearchResult]:
         """
         从候选语块中选择最佳语块
@@ -44,28 +74,67 @@ class ChunkSelector:
             candidate_results: 候选语块列表
             all_chunks: 该文件的所有语块（用于扩展上下文）
             expand_context: 是否扩展上下文
+            cache_key: 缓存命名空间（如 (fund_code, source_file)），为 None 时不缓存LLM选择结果
             
         Returns:
             Optional[SearchResult]: 最佳语块，如果选择失败则返回None
         """
         
+        best_chunk, self._last_selection_note = self._select_best_chunk(
+            search_info, candidate_results, all_chunks, expand_context, intent, cache_key
+        )
+        return best_chunk
+    
+    def _select_best_chunk(
+        self,
+        search_info: str,
+        candidate_results: List[SearchResult],
+        all_chunks: List[SearchResult],
+        expand_context: bool = True,
+        intent: str = "content",
+        cache_key: Optional[Hashable] = None
+    ) -> Tuple[Optional[SearchResult], Optional[str]]:
+        """选择最佳语块，返回 (最佳语块, 选择提示信息)；不写 last_selection_note，可在多线程中并发调用"""
+        
         if not candidate_results:
-            print("[ChunkSelector] 候选语块为空")
-            self._last_selection_note = "未提供候选语块" if intent == "title" else None
-            return None
+            logger.debug("候选语块为空")
+            return None, "未提供候选语块" if intent == "title" else None
         
         if len(candidate_results) == 1:
-            print("[ChunkSelector] 只有一个候选语块，直接返回")
-            self._last_selection_note = None
-            return candidate_results[0]
+            logger.debug("只有一个候选语块，直接返回")
+            return candidate_results[0], None
         
         if intent != "title":
-            print("[ChunkSelector] 非标题意图无需LLM筛选，返回排序首个候选语块")
-            self._last_selection_note = None
-            return candidate_results[0]
+            logger.debug("非标题意图无需LLM筛选，返回排序首个候选语块")
+            return candidate_results[0], None
+        
+        # 混合检索可能返回相同chunk_id的重复候选，按排序去重，避免重复渲染浪费prompt
+        seen_ids = set()
+        candidate_results = [
+            result for result in candidate_results
+            if not (result.chunk_id in seen_ids or seen_ids.add(result.chunk_id))
+        ]
+        if len(candidate_results) == 1:
+            logger.debug("去重后只剩一个候选语块，直接返回")
+            return candidate_results[0], None
         
-        print(f"[ChunkSelector] 开始选择最佳语块，候选数量: {len(candidate_results)}，意图={intent}")
-        self._last_selection_note = None
+        logger.debug("开始选择最佳语块，候选数量: %d，意图=%s", len(candidate_results), intent)
+        selection_key = None
+        if cache_key is not None:
+            selection_key = (
+                cache_key,
+                intent,
+                " ".join((search_info or "").split()),
+                tuple(result.chunk_id for result in candidate_results),
+            )
+            cached_chunk_id = _SELECTION_CACHE.get(selection_key)
+            if cached_chunk_id is not None:
+                logger.debug("命中选择缓存: chunk_id=%s", cached_chunk_id)
+                if cached_chunk_id == -1:
+                    return None, "未检索到目标标题所在文本块"
+                for result in candidate_results:
+                    if result.chunk_id == cached_chunk_id:
+                        return result, None
         
         try:
             expanded_candidates = self._expand_candidates(
@@ -87,109 +156,85 @@ class ChunkSelector:
             )
             
             if no_match:
-                self._last_selection_note = "未检索到目标标题所在文本块"
-                return None
+                if selection_key is not None:
+                    _SELECTION_CACHE.set(selection_key, -1)
+                return None, "未检索到目标标题所在文本块"
             
             if selected_index is not None:
                 selected_chunk = candidate_results[selected_index]
-                self._last_selection_note = None
-                print(f"[ChunkSelector] 选择了第{selected_index+1}个语块: chunk_id={selected_chunk.chunk_id}")
-                return selected_chunk
+                if selection_key is not None:
+                    _SELECTION_CACHE.set(selection_key, selected_chunk.chunk_id)
+                logger.debug("选择了第%s个语块: chunk_id=%s", selected_index+1, selected_chunk.chunk_id)
+                return selected_chunk, None
             
-            print("[ChunkSelector] LLM选择失败，返回第一个候选语块")
-            return candidate_results[0]
+            logger.warning("LLM选择失败，返回第一个候选语块")
+            return candidate_results[0], None
                 
         except Exception as e:
-            print(f"[ChunkSelector] 语块选择过程中出错: {e}")
-            self._last_selection_note = None
-            return candidate_results[0]  # 出错时返回第一个
+            logger.error("语块选择过程中出错: %s", e)
+            return candidate_results[0], None  # 出错时返回第一个
     
     def _expand_candidates(
         self,
         candidate_results: List[SearchResult],
         all_chunks: List[SearchResult],
         expand_context: bool
-    ) -> List[Dict[str, Any]]:
+    ) -> List[ExpandedCandidate]:
         """扩展候选语块，提供更多上下文"""
         
         if not expand_context:
             # 不扩展，直接使用原始文本
             return [
-                {
-                    'index': i,
-                    'chunk_id': result.chunk_id,
-                    'original_text': result.text,
-                    'expanded_text': result.text,
-                    'page_num': result.page_num
-                }
+                ExpandedCandidate(i, result.chunk_id, result.text, "", "", result.page_num)
                 for i, result in enumerate(candidate_results)
             ]
         
-        # 创建chunk_id到SearchResult的映射
-        chunk_map = {chunk.chunk_id: chunk for chunk in all_chunks}
-        
-        expanded_candidates = []
+        # 只为候选的相邻chunk_id建立映射，避免为整个文件构建字典
+        neighbor_ids = set()
+        for candidate in candidate_results:
+            neighbor_ids.add(candidate.chunk_id - 1)
+            neighbor_ids.add(candidate.chunk_id + 1)
+        chunk_map = {chunk.chunk_id: chunk.text for chunk in all_chunks if chunk.chunk_id in neighbor_ids}
         
-        for i, candidate in enumerate(candidate_results):
-            chunk_id = candidate.chunk_id
-            
-            # 获取前一个和后一个语块
-            prev_chunk = chunk_map.get(chunk_id - 1)
-            next_chunk = chunk_map.get(chunk_id + 1)
-            
-            # 拼接扩展文本
-            expanded_parts = []
-            
-            if prev_chunk:
-                expanded_parts.append(f"[前文]{prev_chunk.text}")
-            
-            expanded_parts.append(f"[目标]{candidate.text}")
-            
-            if next_chunk:
-                expanded_parts.append(f"[后文]{next_chunk.text}")
-            
-            expanded_text = "\n".join(expanded_parts)
-            
-            expanded_candidates.append({
-                'index': i,
-                'chunk_id': chunk_id,
-                'original_text': candidate.text,
-                'expanded_text': expanded_text,
-                'page_num': candidate.page_num
-            })
+        expanded_candidates = [
+            ExpandedCandidate(
+                i,
+                candidate.chunk_id,
+                candidate.text,
+                chunk_map.get(candidate.chunk_id - 1, ""),
+                chunk_map.get(candidate.chunk_id + 1, ""),
+                candidate.page_num
+            )
+            for i, candidate in enumerate(candidate_results)
+        ]
         
-        print(f"[ChunkSelector] 完成候选语块扩展，平均长度: {sum(len(c['expanded_text']) for c in expanded_candidates) // len(expanded_candidates)} 字符")
+        logger.debug("完成候选语块扩展，共 %d 个候选", len(expanded_candidates))
         
         return expanded_candidates
     
     def _build_selection_prompt(
         self,
         search_info: str,
-        expanded_candidates: List[Dict[str, Any]],
+        expanded_candidates: List[ExpandedCandidate],
         intent: str
     ) -> str:
         """构建LLM选择prompt"""
         
-        # 构建候选语块信息
-        candidates_info = []
+        # 构建候选语块信息：列式排布，字段说明只出现一次，每个候选一行
+        candidates_info = ["字段: 选项|chunk_id|页码|前文|正文|后文"]
         for candidate in expanded_candidates:
-            chunk_id = candidate['chunk_id']
-            page_num = candidate['page_num']
-            expanded_text = candidate['expanded_text']
-            
-            # 限制文本长度，避免超出LLM限制
-            if len(expanded_text) > 1000:
-                display_text = expanded_text[:1000] + "..."
-            else:
-                display_text = expanded_text
-            
-            candidate_info = (
-                f"选项{candidate['index']+1} (chunk_id={chunk_id}, page_num={page_num}):\n"
-                f"{display_text}"
+            # 按列限制文本长度，避免超出LLM限制
+            cells = (
+                f"选项{candidate.index+1}",
+                str(candidate.chunk_id),
+                str(candidate.page_num),
+                candidate.prev_text[-_PREV_TEXT_LIMIT:],
+                candidate.original_text[:_BODY_TEXT_LIMIT],
+                candidate.next_text[:_NEXT_TEXT_LIMIT],
             )
-            candidates_info.append(candidate_info)
+            candidates_info.append("|".join(cell.translate(_CELL_TRANS) for cell in cells))
         
-        candidates_text = "\n\n".join(candidates_info)
+        candidates_text = "\n".join(candidates_info)
         
         prompt = f"""请从以下候选章节标题语块中选择最符合检索需求的文本块。
 
@@ -198,42 +243,53 @@ class ChunkSelector:
 请你在如下文本块中找出为目标标题所在正文的文本块，请遵循：
 - 请选择包含完整章节标题的语块，且后续内容明显是该章节的正文内容；
 - 若某文本块虽然包含目标标题的字样，但是仅是对其的引用，则不考虑；
-- 如未出现满足条件的语块，请将最终回答中的“最佳选择”填写为“未检索到目标标题所在文本块”，并在理由中说明未命中的原因。
+- 如未出现满足条件的语块，请将 idx 填写为 0。
 
-候选文本块：
+候选文本块（每行一个选项，“正文”列为候选文本块本身，“前文”“后文”为相邻文本块，仅供判断上下文）：
 {candidates_text}
 
 请仔细分析每个选项，仅输出以下JSON：
-{{
-    "最佳选择": "选项X",
-    "选择理由": "详细说明为什么选择这个选项",
-    "置信度": "高/中/低"
-}}
+{{"idx": N}}
 
-其中X为选项编号（1、2、3等）。不能输出除JSON之外的任何文字；若未命中标题，也请输出上述JSON，并将“最佳选择”设为“未检索到目标标题所在文本块”。"""
+其中N为最佳选项的编号（1、2、3等），未命中标题时N为0。不能输出除JSON之外的任何文字。"""
         
         return prompt
     
     def _call_llm_for_selection(self, prompt: str) -> str:
         """调用LLM进行语块选择"""
         
+        request_kwargs = {
+            "model": self.llm_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.0,  # 确保选择的一致性
+            "max_tokens": 16,  # 只需输出 {"idx": N}
+        }
+        
         try:
-            response = self.llm_client.chat.completions.create(
-                model=self.llm_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0  # 确保选择的一致性
-            )
+            if self._json_mode:
+                try:
+                    response = self.llm_client.chat.completions.create(
+                        response_format={"type": "json_object"},
+                        **request_kwargs
+                    )
+                except BadRequestError as e:
+                    # 仅在服务端明确拒绝 response_format 时关闭；超时、限流等临时错误交由外层处理，不重试
+                    logger.warning("JSON mode不可用，改用普通模式: %s", e)
+                    self._json_mode = False
+                    response = self.llm_client.chat.completions.create(**request_kwargs)
+            else:
+                response = self.llm_client.chat.completions.create(**request_kwargs)
             
             raw_response = response.choices[0].message.content.strip()
             
             # 显示LLM响应预览
-            response_preview = raw_response.replace('\n', ' ')[:200]
-            print(f"[ChunkSelector] LLM选择响应: {response_preview}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("LLM选择响应: %.200s...", raw_response.replace('\n', ' '))
             
             return raw_response
             
         except Exception as e:
-            print(f"[ChunkSelector] LLM调用失败: {e}")
+            logger.error("LLM调用失败: %s", e)
             return ""
     
     def _parse_selection_result(
@@ -247,35 +303,31 @@ class ChunkSelector:
             result = LLMUtils.parse_llm_json_response(raw_response)
             
             if not result:
-                print("[ChunkSelector] LLM响应JSON解析失败")
+                logger.warning("LLM响应JSON解析失败")
                 return None, False
             
-            selection = (result.get("最佳选择") or "").strip()
-            reason = result.get("选择理由", "")
-            confidence = result.get("置信度", "")
+            selection = result.get("idx")
+            logger.info("LLM选择结果: idx=%s", selection)
             
-            print("[ChunkSelector] LLM选择结果:")
-            print(f"  - 选择: {selection}")
-            print(f"  - 理由: {reason}")
-            print(f"  - 置信度: {confidence}")
+            try:
+                option_num = int(selection)
+            except (TypeError, ValueError):
+                logger.warning("无法解析选项编号: %s", selection)
+                return None, False
             
-            if selection == "未检索到目标标题所在文本块":
-                print("[ChunkSelector] LLM判断未找到匹配的标题文本块")
+            if option_num == 0:
+                logger.info("LLM判断未找到匹配的标题文本块")
                 return None, True
             
-            import re
-            match = re.search(r'选项(\d+)', selection)
-            if match:
-                option_num = int(match.group(1))
-                index = option_num - 1
-                if 0 <= index < total_candidates:
-                    return index, False
+            index = option_num - 1
+            if 0 <= index < total_candidates:
+                return index, False
             
-            print(f"[ChunkSelector] 无法解析选项编号: {selection}")
+            logger.warning("无法解析选项编号: %s", selection)
             return None, False
             
         except Exception as e:
-            print(f"[ChunkSelector] 解析选择结果失败: {e}")
+            logger.error("解析选择结果失败: %s", e)
             return None, False
     
     @property
@@ -291,7 +343,7 @@ class ChunkSelector:
         intent: str = "content"
     ) -> List[Optional[SearchResult]]:
         """
-        批量选择最佳语块
+        批量选择最佳语块，标题意图下各组的LLM选择请求并发发出
         
         Args:
             search_info: 检索需求描述
@@ -302,15 +354,24 @@ class ChunkSelector:
             List[Optional[SearchResult]]: 每组的最佳语块列表
         """
         
-        results = []
-        for i, candidates in enumerate(candidate_groups):
-            print(f"[ChunkSelector] 处理第{i+1}组候选语块...")
-            best_chunk = self.select_best_chunk(
+        def select(candidates: List[SearchResult]) -> Tuple[Optional[SearchResult], Optional[str]]:
+            return self._select_best_chunk(
                 search_info=search_info,
                 candidate_results=candidates,
                 all_chunks=all_chunks,
                 intent=intent
             )
-            results.append(best_chunk)
         
-        return results
\ No newline at end of file
+        # 仅标题意图会调用LLM，其余意图直接返回首个候选，无需线程池
+        if intent != "title" or len(candidate_groups) <= 1:
+            selections = [select(candidates) for candidates in candidate_groups]
+        else:
+            logger.debug("并发处理 %d 组候选语块...", len(candidate_groups))
+            workers = min(len(candidate_groups), _MAX_SELECTION_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk-select") as executor:
+                selections = list(executor.map(select, candidate_groups))
+        
+        # 与逐组顺序调用一致，提示信息取最后一组的结果，批量完成后统一写入
+        if selections:
+            self._last_selection_note = selections[-1][1]
+        return [best_chunk for best_chunk, _ in selections]
\ No newline at end of file
@@ -5,75 +5,117 @@
 包含语块过滤、扩展、合并等功能
 """
 
-from typing import List, Optional, Dict, Any
-from .page_utils import PageUtils
+import logging
+from bisect import bisect_left, bisect_right
+from typing import List, NamedTuple, Optional, Dict, Any, Sequence, Tuple
+from .page_utils import PageUtils, _field_getter
+
+try:  # numpy 为可选依赖（pymilvus 已依赖），未安装时退回逐块比较
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+# 范围过滤中表示“不限”的上下界
+_PAGE_MIN = -(2 ** 62)
+_PAGE_MAX = 2 ** 62
+
+
+class ChunkColumns(NamedTuple):
+    """
+    语块范围过滤所需的列式视图（与语块列表按下标对齐）
+    
+    安装 numpy 时各列为 int64 数组，否则为列表；无法解析页码的语块按不限页码处理
+    """
+    chunk_ids: Any
+    min_pages: Any
+    max_pages: Any
 
 
 class ChunkUtils:
     """语块处理工具类"""
     
+    @staticmethod
+    def build_range_columns(chunks: List) -> ChunkColumns:
+        """
+        一次性提取语块的 chunk_id、最小页码、最大页码列（安装 numpy 时为 int64 数组）
+        
+        无法解析页码的语块按不限页码处理，与逐块过滤的语义一致
+        """
+        # 兼容SearchResult对象和字典格式
+        get_chunk_id = _field_getter(chunks, 'chunk_id')
+        get_page_num = _field_getter(chunks, 'page_num', '')
+        extract_pages = PageUtils.extract_page_numbers_from_string
+        
+        chunk_ids = [get_chunk_id(chunk) for chunk in chunks]
+        min_pages = []
+        max_pages = []
+        for chunk in chunks:
+            chunk_pages = extract_pages(get_page_num(chunk))
+            min_pages.append(min(chunk_pages) if chunk_pages else _PAGE_MIN)
+            max_pages.append(max(chunk_pages) if chunk_pages else _PAGE_MAX)
+        
+        if np is None:
+            return ChunkColumns(chunk_ids, min_pages, max_pages)
+        return ChunkColumns(
+            np.asarray(chunk_ids, dtype=np.int64),
+            np.asarray(min_pages, dtype=np.int64),
+            np.asarray(max_pages, dtype=np.int64),
+        )
+    
     @staticmethod
     def apply_range_limitations(
         chunks: List,
         start_page: Optional[int] = None,
         end_page: Optional[int] = None,
         start_chunk_id: Optional[int] = None,
-        end_chunk_id: Optional[int] = None
+        end_chunk_id: Optional[int] = None,
+        columns: Optional[ChunkColumns] = None,
+        sorted_by_chunk_id: bool = False
     ) -> List:
-        """应用页码和chunk_id范围限制"""
+        """
+        应用页码和chunk_id范围限制
+        
+        columns 为 build_range_columns 的结果，同一批语块多次过滤时可复用；
+        sorted_by_chunk_id 为 True 时先二分定位chunk_id区间，只对区间内语块做页码判断；
+        页码范围与语块页码有交集即保留
+        """
         
         if not chunks:
             return chunks
         
-        print(f"[ChunkUtils] 应用范围限制: 页码[{start_page}-{end_page}], chunk_id[{start_chunk_id}-{end_chunk_id}]")
-        
-        filtered_chunks = chunks
-        
-        # 应用chunk_id范围限制
-        if start_chunk_id is not None or end_chunk_id is not None:
-            chunk_filtered = []
-            for chunk in filtered_chunks:
-                # 兼容SearchResult对象和字典格式
-                if hasattr(chunk, 'chunk_id'):
-                    chunk_id = chunk.chunk_id
-                else:
-                    chunk_id = chunk['_source']['chunk_id']
-                    
-                if start_chunk_id is not None and chunk_id < start_chunk_id:
-                    continue
-                if end_chunk_id is not None and chunk_id > end_chunk_id:
-                    continue
-                chunk_filtered.append(chunk)
-            filtered_chunks = chunk_filtered
-            print(f"[ChunkUtils] chunk_id范围过滤后保留 {len(filtered_chunks)} 个语块")
-        
-        # 应用页码范围限制
-        if start_page is not None or end_page is not None:
-            page_filtered = []
-            for chunk in filtered_chunks:
-                # 兼容SearchResult对象和字典格式
-                if hasattr(chunk, 'page_num'):
-                    page_num_str = chunk.page_num
-                else:
-                    page_num_str = chunk['_source'].get('page_num', '')
-                    
-                chunk_pages = PageUtils.extract_page_numbers_from_string(page_num_str)
-                
-                # 检查该语块是否与指定页码范围有交集
-                if chunk_pages:
-                    min_page = min(chunk_pages)
-                    max_page = max(chunk_pages)
-                    
-                    # 判断是否在范围内
-                    if start_page is not None and max_page < start_page:
-                        continue
-                    if end_page is not None and min_page > end_page:
-                        continue
-                    
-                page_filtered.append(chunk)
-            filtered_chunks = page_filtered
-            print(f"[ChunkUtils] 页码范围过滤后保留 {len(filtered_chunks)} 个语块")
+        logger.debug("应用范围限制: 页码[%s-%s], chunk_id[%s-%s]", start_page, end_page, start_chunk_id, end_chunk_id)
+        
+        if all(value is None for value in (start_page, end_page, start_chunk_id, end_chunk_id)):
+            return chunks
         
+        if columns is None:
+            columns = ChunkUtils.build_range_columns(chunks)
+        chunk_ids, min_pages, max_pages = columns
+        
+        lo_id = _PAGE_MIN if start_chunk_id is None else start_chunk_id
+        hi_id = _PAGE_MAX if end_chunk_id is None else end_chunk_id
+        lo_page = _PAGE_MIN if start_page is None else start_page
+        hi_page = _PAGE_MAX if end_page is None else end_page
+        
+        if sorted_by_chunk_id and (start_chunk_id is not None or end_chunk_id is not None):
+            lo, hi = ChunkUtils._bisect_window(chunk_ids, lo_id, hi_id)
+            chunks = chunks[lo:hi]
+            chunk_ids, min_pages, max_pages = chunk_ids[lo:hi], min_pages[lo:hi], max_pages[lo:hi]
+        
+        if np is not None and isinstance(chunk_ids, np.ndarray):
+            mask = (chunk_ids >= lo_id) & (chunk_ids <= hi_id) & (max_pages >= lo_page) & (min_pages <= hi_page)
+            filtered_chunks = [chunks[i] for i in np.flatnonzero(mask)]
+        else:
+            filtered_chunks = [
+                chunk
+                for chunk, chunk_id, min_page, max_page in zip(chunks, chunk_ids, min_pages, max_pages)
+                if lo_id <= chunk_id <= hi_id and max_page >= lo_page and min_page <= hi_page
+            ]
+        
+        logger.debug("范围过滤后保留 %d 个语块", len(filtered_chunks))
         return filtered_chunks
     
     @staticmethod
@@ -81,67 +123,86 @@ class ChunkUtils:
         target_chunks: List,
         all_chunks: List, 
         expand_before: int = 0,
-        expand_after: int = 0
+        expand_after: int = 0,
+        sorted_chunk_ids: Optional[Sequence[int]] = None
     ) -> List:
-        """扩展目标语块，向前向后获取更多上下文"""
+        """
+        扩展目标语块，向前向后获取更多上下文
+        
+        sorted_chunk_ids 为 all_chunks（已按chunk_id升序）的chunk_id列时二分切片，无需全量扫描和排序
+        """
         
         if not target_chunks or (expand_before == 0 and expand_after == 0):
             return target_chunks
         
-        print(f"[ChunkUtils] 扩展语块: 向前{expand_before}块, 向后{expand_after}块")
+        logger.debug("扩展语块: 向前%s块, 向后%s块", expand_before, expand_after)
         
         # 获取目标语块的chunk_id范围
-        target_chunk_ids = set()
-        for chunk in target_chunks:
-            if hasattr(chunk, 'chunk_id'):
-                target_chunk_ids.add(chunk.chunk_id)
-            else:
-                target_chunk_ids.add(chunk['_source']['chunk_id'])
-        
-        min_chunk_id = min(target_chunk_ids)
-        max_chunk_id = max(target_chunk_ids)
+        min_chunk_id, max_chunk_id = ChunkUtils.get_chunk_id_range_from_chunks(target_chunks)
         
         # 计算扩展后的范围
         expand_start_id = min_chunk_id - expand_before
         expand_end_id = max_chunk_id + expand_after
         
         # 从全部语块中筛选扩展范围内的语块
-        expanded_chunks = []
-        for chunk in all_chunks:
-            if hasattr(chunk, 'chunk_id'):
-                chunk_id = chunk.chunk_id
-            else:
-                chunk_id = chunk['_source']['chunk_id']
-            
-            if expand_start_id <= chunk_id <= expand_end_id:
-                expanded_chunks.append(chunk)
+        if sorted_chunk_ids is not None:
+            lo, hi = ChunkUtils._bisect_window(sorted_chunk_ids, expand_start_id, expand_end_id)
+            expanded_chunks = all_chunks[lo:hi]
+            logger.debug("扩展后获得 %d 个语块", len(expanded_chunks))
+            return expanded_chunks
+        
+        get_chunk_id = _field_getter(all_chunks, 'chunk_id')
+        expanded_chunks = [
+            chunk for chunk in all_chunks if expand_start_id <= get_chunk_id(chunk) <= expand_end_id
+        ]
         
         # 按chunk_id排序
-        expanded_chunks.sort(key=lambda x: x.chunk_id if hasattr(x, 'chunk_id') else x['_source']['chunk_id'])
+        expanded_chunks.sort(key=get_chunk_id)
         
-        print(f"[ChunkUtils] 扩展后获得 {len(expanded_chunks)} 个语块")
+        logger.debug("扩展后获得 %d 个语块", len(expanded_chunks))
         return expanded_chunks
     
     @staticmethod
-    def merge_chunks_text(chunks: List) -> str:
-        """合并多个语块的文本内容"""
+    def expand_chunk_slice(
+        sorted_chunk_ids: Sequence[int],
+        target_chunk_id: int,
+        expand_before: int = 0,
+        expand_after: int = 0
+    ) -> Tuple[int, int]:
+        """
+        在按chunk_id升序的全部语块中定位扩展范围
+        
+        返回切片下标 (lo, hi)，all_chunks[lo:hi] 即为已排序的扩展语块
+        """
+        return ChunkUtils._bisect_window(
+            sorted_chunk_ids, target_chunk_id - expand_before, target_chunk_id + expand_after
+        )
+    
+    @staticmethod
+    def _bisect_window(sorted_chunk_ids: Sequence[int], lo_id: int, hi_id: int) -> Tuple[int, int]:
+        """二分定位 [lo_id, hi_id] 在升序chunk_id列中的切片下标"""
+        if np is not None and isinstance(sorted_chunk_ids, np.ndarray):
+            lo = int(np.searchsorted(sorted_chunk_ids, lo_id, side='left'))
+            hi = int(np.searchsorted(sorted_chunk_ids, hi_id, side='right'))
+            return lo, hi
+        return bisect_left(sorted_chunk_ids, lo_id), bisect_right(sorted_chunk_ids, hi_id)
+    
+    @staticmethod
+    def merge_chunks_text(chunks: List, presorted: bool = False) -> str:
+        """合并多个语块的文本内容，presorted 为 True 时跳过排序"""
         
         if not chunks:
             return ""
         
         # 按chunk_id排序确保顺序正确
-        sorted_chunks = sorted(chunks, key=lambda x: x.chunk_id if hasattr(x, 'chunk_id') else x['_source']['chunk_id'])
+        if presorted:
+            sorted_chunks = chunks
+        else:
+            sorted_chunks = sorted(chunks, key=_field_getter(chunks, 'chunk_id'))
         
         # 拼接文本
-        texts = []
-        for chunk in sorted_chunks:
-            if hasattr(chunk, 'text'):
-                texts.append(chunk.text)
-            else:
-                texts.append(chunk['_source']['text'])
-        
-        merged_text = "".join(texts)
-        return merged_text
+        get_text = _field_getter(chunks, 'text')
+        return "".join(map(get_text, sorted_chunks))
     
     @staticmethod
     def get_chunk_id_range_from_chunks(chunks: List) -> tuple:
@@ -150,28 +211,34 @@ class ChunkUtils:
         if not chunks:
             return None, None
         
-        chunk_ids = []
-        for chunk in chunks:
-            if hasattr(chunk, 'chunk_id'):
-                chunk_ids.append(chunk.chunk_id)
-            else:
-                chunk_ids.append(chunk['_source']['chunk_id'])
+        get_chunk_id = _field_getter(chunks, 'chunk_id')
+        chunk_ids = [get_chunk_id(chunk) for chunk in chunks]
         
         return min(chunk_ids), max(chunk_ids)
     
     @staticmethod
-    def filter_chunks_by_page_range(chunks: List, start_page: int, end_page: int) -> List:
-        """根据页码范围过滤语块"""
+    def filter_chunks_by_page_range(
+        chunks: List,
+        start_page: int,
+        end_page: int,
+        columns: Optional[ChunkColumns] = None
+    ) -> List:
+        """根据页码范围过滤语块（无页码的语块不保留），传入 columns 时直接比较预计算的页码列"""
+        
+        if columns is not None:
+            return [
+                chunk
+                for chunk, min_page, max_page in zip(chunks, columns.min_pages, columns.max_pages)
+                if min_page != _PAGE_MIN and max_page >= start_page and min_page <= end_page
+            ]
+        
+        # 兼容SearchResult对象和字典格式
+        get_page_num = _field_getter(chunks, 'page_num', '')
+        extract_pages = PageUtils.extract_page_numbers_from_string
         
         filtered_chunks = []
         for chunk in chunks:
-            # 兼容SearchResult对象和字典格式
-            if hasattr(chunk, 'page_num'):
-                page_num_str = chunk.page_num
-            else:
-                page_num_str = chunk['_source'].get('page_num', '')
-                
-            chunk_pages = PageUtils.extract_page_numbers_from_string(page_num_str)
+            chunk_pages = extract_pages(get_page_num(chunk))
             
             if chunk_pages:
                 min_page = min(chunk_pages)
@@ -187,15 +254,6 @@ class ChunkUtils:
     def filter_chunks_by_chunk_id_range(chunks: List, start_chunk_id: int, end_chunk_id: int) -> List:
         """根据chunk_id范围过滤语块"""
         
-        filtered_chunks = []
-        for chunk in chunks:
-            # 兼容SearchResult对象和字典格式
-            if hasattr(chunk, 'chunk_id'):
-                chunk_id = chunk.chunk_id
-            else:
-                chunk_id = chunk['_source']['chunk_id']
-                
-            if start_chunk_id <= chunk_id <= end_chunk_id:
-                filtered_chunks.append(chunk)
-        
-        return filtered_chunks
\ No newline at end of file
+        # 兼容SearchResult对象和字典格式
+        get_chunk_id = _field_getter(chunks, 'chunk_id')
+        return [chunk for chunk in chunks if start_chunk_id <= get_chunk_id(chunk) <= end_chunk_id]
\ No newline at end of file
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+JSON 序列化工具模块
+优先使用 orjson（C 实现），未安装时退回标准库 json，输出均为不转义中文的 str
+"""
+
+import json
+from typing import Any, Union
+
+try:  # orjson 为可选依赖
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(obj: Any, *, sort_keys: bool = False, indent: bool = False) -> str:
+    """序列化为 JSON 字符串，语义等同 json.dumps(obj, ensure_ascii=False, sort_keys=...)"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option, default=str).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, indent=2 if indent else None, default=str)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """解析 JSON 字符串或字节串，解析失败时抛出 json.JSONDecodeError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -5,10 +5,15 @@ LLM相关工具模块
 包含LLM调用、JSON解析、结果标准化等功能
 """
 
-from typing import Dict, Any
-import json
+from typing import Dict, Any, List, Optional
 import re
 
+from .fastjson import loads
+
+# JSON对象及选项编号提取的预编译正则
+_JSON_OBJ = re.compile(r'\{[^}]*\}')
+_OPTION_NUM = re.compile(r'选项(\d+)')
+
 
 class LLMUtils:
     """LLM相关工具类"""
@@ -20,18 +25,18 @@ class LLMUtils:
         # 清理响应文本
         text = raw_response.strip()
         # 移除可能的markdown代码块标记
-        text = re.sub(r'^```(?:json)?', '', text)
-        text = re.sub(r'```$', '', text).strip()
+        text = text.removeprefix("```json").removeprefix("```").strip()
+        text = text.removesuffix("```").strip()
         
         try:
-            return json.loads(text)
-        except:
+            return loads(text)
+        except ValueError:  # json.JSONDecodeError 为 ValueError 子类
             # 如果JSON解析失败，尝试正则提取
-            match = re.search(r'\{[^}]*\}', text)
+            match = _JSON_OBJ.search(text)
             if match:
                 try:
-                    return json.loads(match.group(0))
-                except:
+                    return loads(match.group(0))
+                except ValueError:
                     pass
             return {}
     
@@ -61,6 +66,44 @@ class LLMUtils:
         
         return prompt
     
+    @staticmethod
+    def create_directory_batch_check_prompt(snippets: List[str]) -> str:
+        """创建批量目录判断的LLM prompt，一次判断多个候选片段"""
+        
+        numbered = "\n\n".join(
+            f"【片段{i}】\n{snippet}" for i, snippet in enumerate(snippets, 1)
+        )
+        prompt = (
+            f"下面是 {len(snippets)} 段招募说明书文本片段，请判断哪一个片段包含招募说明书的'目录'部分。"
+            "请严格输出 JSON：{\"directory_index\": 片段编号}；"
+            "如果都不包含目录，请严格输出 JSON：{\"directory_index\": null}。"
+            "若有多个片段包含目录，取编号最小者。不能输出除 JSON 之外的任何文字。\n\n"
+            f"{numbered}"
+        )
+        
+        return prompt
+    
+    @staticmethod
+    def parse_directory_batch_response(raw_response: str, total_snippets: int) -> Optional[int]:
+        """解析批量目录判断响应
+        
+        返回目录片段的索引（0-based）；模型判定都不是目录时返回 -1；
+        响应无法解析或编号越界时返回 None，由调用方回退到逐个判断
+        """
+        
+        data = LLMUtils.parse_llm_json_response(raw_response)
+        if "directory_index" not in data:
+            return None
+        
+        value = data["directory_index"]
+        if value is None:
+            return -1
+        try:
+            index = int(value) - 1
+        except (TypeError, ValueError):
+            return None
+        return index if 0 <= index < total_snippets else None
+    
     @staticmethod
     def parse_chunk_selection_response(raw_response: str, total_options: int) -> int:
         """解析语块选择响应，返回选中的选项索引（0-based）"""
@@ -70,7 +113,7 @@ class LLMUtils:
             selection = data.get("最佳选择", "")
             
             # 提取数字
-            match = re.search(r'选项(\d+)', selection)
+            match = _OPTION_NUM.search(selection)
             if match:
                 option_num = int(match.group(1))
                 # 转换为0-based索引
@@ -81,6 +124,6 @@ class LLMUtils:
             # 如果解析失败，返回第一个选项
             return 0
             
-        except:
-            # 异常情况下返回第一个选项
-            return 0
+        except (ValueError, TypeError, AttributeError):
+            # 解析失败或返回结构不符（非字典/非字符串）时返回第一个选项
+            return 0
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+日志工具模块
+包内日志经 QueueHandler 入队，由后台 QueueListener 线程统一写出，检索线程不阻塞在 stdout 写入上
+"""
+
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+
+PACKAGE_LOGGER_NAME = "intelligent_search"
+
+_QUEUE_HANDLER: Optional[QueueHandler] = None
+_QUEUE_LISTENER: Optional[QueueListener] = None
+
+
+def enable_queue_logging(level: int = logging.INFO, stream: Optional[TextIO] = None) -> None:
+    """为包日志挂载队列处理器（重复调用无副作用），默认以 INFO 级别输出到 stdout"""
+    global _QUEUE_HANDLER, _QUEUE_LISTENER
+    if _QUEUE_LISTENER is not None:
+        return
+    
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("[%(module)s] %(message)s"))
+    
+    _QUEUE_HANDLER = QueueHandler(log_queue)
+    _QUEUE_LISTENER = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    
+    package_logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+    if package_logger.level == logging.NOTSET:
+        package_logger.setLevel(level)
+    package_logger.addHandler(_QUEUE_HANDLER)
+    package_logger.propagate = False
+    
+    _QUEUE_LISTENER.start()
+    atexit.register(disable_queue_logging)
+
+
+def disable_queue_logging() -> None:
+    """停止后台写出线程（写完队列中剩余日志），恢复包日志向上传播"""
+    global _QUEUE_HANDLER, _QUEUE_LISTENER
+    if _QUEUE_LISTENER is None:
+        return
+    
+    _QUEUE_LISTENER.stop()
+    package_logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+    package_logger.removeHandler(_QUEUE_HANDLER)
+    package_logger.propagate = True
+    _QUEUE_HANDLER = None
+    _QUEUE_LISTENER = None
@@ -5,134 +5,242 @@
 包含页码提取、范围计算、页码查找等功能
 """
 
-from typing import List, Optional, Dict, Any
+import functools
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from operator import attrgetter
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 import re
 
+try:  # numpy 为可选依赖（pymilvus 已依赖），未安装时退回逐块比较
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
 
-class PageUtils:
-    """页码处理工具类"""
+
+def _field_getter(chunks: Sequence, name: str, default: Any = None):
+    """
+    按首个语块的类型一次性选定字段取值函数，避免逐块 hasattr 判断
     
-    @staticmethod
-    def extract_page_numbers_from_string(page_num_str: str) -> List[int]:
-        """从page_num字符串中提取所有页码数字"""
+    同一列表内的语块同为 SearchResult 对象或同为ES字典格式
+    """
+    if chunks and hasattr(chunks[0], name):
+        return attrgetter(name)
+    if default is None:
+        return lambda chunk: chunk['_source'][name]
+    return lambda chunk: chunk['_source'].get(name, default)
+
+
+@functools.lru_cache(maxsize=100_000)
+def _parse_pages(page_num_str: str) -> Tuple[int, ...]:
+    """从page_num字符串中提取所有页码数字（结果被缓存，返回不可变元组）"""
+    
+    if not page_num_str:
+        return ()
+    
+    if type(page_num_str) is not str:
+        # ES 可能直接返回数值页码，无需转字符串再解析
+        if isinstance(page_num_str, (int, float)) or (np is not None and isinstance(page_num_str, np.integer)):
+            return (int(page_num_str),)
+        page_num_str = str(page_num_str)
+    
+    # 单页码最常见，直接转换
+    if page_num_str.isdecimal():
+        return (int(page_num_str),)
+    
+    # 按"-"分割，逐段忽略非整数部分（如 "12.0"、空段）
+    return tuple(int(part) for part in page_num_str.split('-') if part.strip().isdecimal())
+
+
+# 无页码语块的最小/最大页码取值：不与任何页码范围相交，也不影响整体页码范围
+_NO_PAGE_MIN = 2 ** 62
+_NO_PAGE_MAX = -(2 ** 62)
+
+
+class PageIndex:
+    """
+    语块页码的列式索引（各列与语块列表按下标对齐）
+    
+    构建时每个语块只解析一次 page_num，同一批语块的多次页码查询可复用该索引；
+    另存按最小页码排序的下标及其前缀最大页码，供页码区间查询二分定位，
+    排序后的 chunk_id/最大页码列在安装 numpy 时为 int64 数组，区间内比较向量化；
+    page_map 记录每个页码首次和最后出现的语块下标，按页码查找语块为 O(1)。
+    需对同一批语块多次查询时应持有该索引，直接调用实例方法
+    """
+    
+    __slots__ = (
+        "chunks", "chunk_ids", "min_pages", "max_pages", "page_sets",
+        "order", "sorted_min_pages", "prefix_max_pages", "sorted_chunk_ids", "sorted_max_pages",
+        "page_map",
+    )
+    
+    def __init__(self, chunks: List):
+        self.chunks = chunks
+        self.chunk_ids = []
+        self.min_pages = []
+        self.max_pages = []
+        self.page_sets = []
+        self.order = []
+        self.sorted_min_pages = []
+        self.prefix_max_pages = []
+        self.sorted_chunk_ids = []
+        self.sorted_max_pages = []
+        self.page_map = {}
+        if not chunks:
+            return
         
-        if not page_num_str:
-            return []
+        # 兼容SearchResult对象和字典格式
+        get_chunk_id = _field_getter(chunks, 'chunk_id')
+        get_page_num = _field_getter(chunks, 'page_num', '')
+        for chunk in chunks:
+            self._append(get_chunk_id(chunk), get_page_num(chunk))
         
-        pages = []
-        # 分割"-"获取各个页码
-        for part in str(page_num_str).split('-'):
-            try:
-                page_num = int(part.strip())
-                pages.append(page_num)
-            except:
-                continue
+        # 招股书语块通常已按页码有序，排序近似线性
+        min_pages = self.min_pages
+        max_pages = self.max_pages
+        self.order = sorted(range(len(chunks)), key=min_pages.__getitem__)
+        self.sorted_min_pages = [min_pages[i] for i in self.order]
+        self.prefix_max_pages = list(accumulate((max_pages[i] for i in self.order), max))
+        self.sorted_chunk_ids = [self.chunk_ids[i] for i in self.order]
+        self.sorted_max_pages = [max_pages[i] for i in self.order]
+        if np is not None:
+            self.sorted_chunk_ids = np.asarray(self.sorted_chunk_ids, dtype=np.int64)
+            self.sorted_max_pages = np.asarray(self.sorted_max_pages, dtype=np.int64)
         
-        return pages
+        page_map = self.page_map
+        for i, pages in enumerate(self.page_sets):
+            for page in pages:
+                span = page_map.get(page)
+                page_map[page] = (i, i) if span is None else (span[0], i)
     
-    @staticmethod
-    def calculate_page_range(chunks: List) -> tuple:
-        """计算语块列表的页码范围"""
+    def window(self, start_page: int, end_page: int) -> Tuple[int, int]:
+        """
+        返回 order 中可能与 [start_page, end_page] 相交的下标区间 [lo, hi)
         
-        all_pages = []
-        for chunk in chunks:
-            # 兼容SearchResult对象和字典格式
-            if hasattr(chunk, 'page_num'):
-                page_num_str = chunk.page_num
-            else:
-                page_num_str = chunk['_source'].get('page_num', '')
-            pages = PageUtils.extract_page_numbers_from_string(page_num_str)
-            all_pages.extend(pages)
-        
-        if all_pages:
-            return min(all_pages), max(all_pages)
-        else:
+        区间外的语块必不相交；区间内仍需逐个检查 max_page >= start_page
+        """
+        lo = bisect_left(self.prefix_max_pages, start_page)
+        hi = bisect_right(self.sorted_min_pages, end_page)
+        return lo, hi
+    
+    def page_range(self) -> tuple:
+        """返回(最小页码, 最大页码)，无页码时返回(None, None)"""
+        if not self.chunks:
             return None, None
+        min_page = min(self.min_pages)
+        if min_page == _NO_PAGE_MIN:
+            return None, None
+        return min_page, max(self.max_pages)
     
-    @staticmethod
-    def find_first_chunk_containing_page(all_chunks: List, target_page: int) -> Optional[Dict]:
-        """找到page_num中第一个包含目标页码的语块"""
-        
-        for chunk in all_chunks:
-            # 兼容SearchResult对象和字典格式
-            if hasattr(chunk, 'page_num'):
-                page_num_str = chunk.page_num
-            else:
-                page_num_str = chunk['_source'].get('page_num', '')
-            chunk_pages = PageUtils.extract_page_numbers_from_string(page_num_str)
-            
-            if target_page in chunk_pages:
-                return chunk
-        
-        return None
+    def first_containing(self, target_page: int) -> Optional[Any]:
+        """返回第一个包含目标页码的语块"""
+        span = self.page_map.get(target_page)
+        return self.chunks[span[0]] if span else None
+    
+    def last_containing(self, target_page: int) -> Optional[Any]:
+        """返回最后一个包含目标页码的语块"""
+        span = self.page_map.get(target_page)
+        return self.chunks[span[1]] if span else None
+    
+    def chunk_id_range(self, start_page: int, end_page: int) -> tuple:
+        """返回与页码范围有交集的语块的(最小chunk_id, 最大chunk_id)"""
+        # 二分定位候选区间后只检查区间内语块，O(log N + k)
+        lo, hi = self.window(start_page, end_page)
+        if lo >= hi:
+            return None, None
+        chunk_ids = self.sorted_chunk_ids[lo:hi]
+        max_pages = self.sorted_max_pages[lo:hi]
+        if np is not None:
+            hit_ids = chunk_ids[max_pages >= start_page]
+            if not hit_ids.size:
+                return None, None
+            return int(hit_ids.min()), int(hit_ids.max())
+        hit_ids = [chunk_id for chunk_id, max_page in zip(chunk_ids, max_pages) if max_page >= start_page]
+        if not hit_ids:
+            return None, None
+        return min(hit_ids), max(hit_ids)
+    
+    def _append(self, chunk_id: int, page_num_str: str) -> None:
+        pages = _parse_pages(page_num_str)
+        self.chunk_ids.append(chunk_id)
+        self.min_pages.append(min(pages) if pages else _NO_PAGE_MIN)
+        self.max_pages.append(max(pages) if pages else _NO_PAGE_MAX)
+        self.page_sets.append(frozenset(pages))
+
+
+class PageUtils:
+    """页码处理工具类"""
+    
+    # 直接暴露缓存函数，外部循环调用时不多一层转发
+    extract_page_numbers_from_string = staticmethod(_parse_pages)
     
     @staticmethod
-    def find_last_chunk_containing_page(all_chunks: List, target_page: int) -> Optional[Dict]:
-        """找到page_num中最后一个包含目标页码的语块"""
-        
-        last_chunk = None
-        for chunk in all_chunks:
-            # 兼容SearchResult对象和字典格式
-            if hasattr(chunk, 'page_num'):
-                page_num_str = chunk.page_num
-            else:
-                page_num_str = chunk['_source'].get('page_num', '')
-            chunk_pages = PageUtils.extract_page_numbers_from_string(page_num_str)
-            
-            if target_page in chunk_pages:
-                last_chunk = chunk
-        
-        return last_chunk
+    def build_index(chunks: List) -> PageIndex:
+        """构建语块页码索引，需对同一批语块多次查询时复用"""
+        return PageIndex(chunks)
     
     @staticmethod
-    def get_page_range_from_chunks(chunks: List) -> tuple:
-        """计算语块列表的页码范围，返回(最小页码, 最大页码)"""
+    def calculate_page_range(chunks: List, index: Optional[PageIndex] = None) -> tuple:
+        """计算语块列表的页码范围，传入 index 时直接使用预计算的页码列"""
+        
+        if index is not None:
+            return index.page_range()
         
-        all_pages = []
+        # 单次遍历随取随比，不汇总全部页码
+        min_page = _NO_PAGE_MIN
+        max_page = _NO_PAGE_MAX
+        # 兼容SearchResult对象和字典格式
+        get_page_num = _field_getter(chunks, 'page_num', '')
         for chunk in chunks:
-            # 兼容SearchResult对象和字典格式
-            if hasattr(chunk, 'page_num'):
-                page_num_str = chunk.page_num
-            else:
-                page_num_str = chunk['_source'].get('page_num', '')
-            pages = PageUtils.extract_page_numbers_from_string(page_num_str)
-            all_pages.extend(pages)
+            pages = _parse_pages(get_page_num(chunk))
+            if pages:
+                chunk_min = min(pages)
+                chunk_max = max(pages)
+                if chunk_min < min_page:
+                    min_page = chunk_min
+                if chunk_max > max_page:
+                    max_page = chunk_max
         
-        if all_pages:
-            return min(all_pages), max(all_pages)
-        else:
+        if min_page == _NO_PAGE_MIN:
             return None, None
+        return min_page, max_page
     
     @staticmethod
-    def get_chunk_id_range_from_pages(all_chunks: List, start_page: int, end_page: int) -> tuple:
-        """根据页码范围获取对应的chunk_id范围"""
+    def find_first_chunk_containing_page(
+        all_chunks: List,
+        target_page: int,
+        index: Optional[PageIndex] = None
+    ) -> Optional[Dict]:
+        """找到page_num中第一个包含目标页码的语块，index 须由 all_chunks 构建，未传入时临时构建"""
         
-        min_chunk_id = None
-        max_chunk_id = None
+        if index is None:
+            index = PageIndex(all_chunks)
+        return index.first_containing(target_page)
+    
+    @staticmethod
+    def find_last_chunk_containing_page(
+        all_chunks: List,
+        target_page: int,
+        index: Optional[PageIndex] = None
+    ) -> Optional[Dict]:
+        """找到page_num中最后一个包含目标页码的语块，index 须由 all_chunks 构建，未传入时临时构建"""
         
-        for chunk in all_chunks:
-            # 兼容SearchResult对象和字典格式
-            if hasattr(chunk, 'page_num'):
-                page_num_str = chunk.page_num
-            else:
-                page_num_str = chunk['_source'].get('page_num', '')
-            chunk_pages = PageUtils.extract_page_numbers_from_string(page_num_str)
-            
-            if chunk_pages:
-                chunk_min_page = min(chunk_pages)
-                chunk_max_page = max(chunk_pages)
-                
-                # 检查是否与目标页码范围有交集
-                if chunk_max_page >= start_page and chunk_min_page <= end_page:
-                    # 兼容SearchResult对象和字典格式
-                    if hasattr(chunk, 'chunk_id'):
-                        chunk_id = chunk.chunk_id
-                    else:
-                        chunk_id = chunk['_source']['chunk_id']
-                    
-                    if min_chunk_id is None or chunk_id < min_chunk_id:
-                        min_chunk_id = chunk_id
-                    if max_chunk_id is None or chunk_id > max_chunk_id:
-                        max_chunk_id = chunk_id
+        if index is None:
+            index = PageIndex(all_chunks)
+        return index.last_containing(target_page)
+    
+    # 与 calculate_page_range 相同，保留旧名称
+    get_page_range_from_chunks = calculate_page_range
+    
+    @staticmethod
+    def get_chunk_id_range_from_pages(
+        all_chunks: List,
+        start_page: int,
+        end_page: int,
+        index: Optional[PageIndex] = None
+    ) -> tuple:
+        """根据页码范围获取对应的chunk_id范围，index 须由 all_chunks 构建，未传入时临时构建"""
         
-        return min_chunk_id, max_chunk_id
\ No newline at end of file
+        if index is None:
+            index = PageIndex(all_chunks)
+        return index.chunk_id_range(start_page, end_page)
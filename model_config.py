@@ -1,24 +1,31 @@
 # LLM模型配置
+# api_key 从环境变量 <PROVIDER>_API_KEY 读取（如 ZHIPU_API_KEY、DEEPSEEK_API_KEY），首次访问时解析并缓存
+# base_url 可用环境变量 <PROVIDER>_BASE_URL 覆盖（如私有化部署或代理网关），未设置时使用内置地址
 
-MODEL_CONFIG = {
-    "zhipu": {
-        "glm-4.5": {
-            "model": "glm-4.5",
-            "api_key": "*****",
-            "base_url": "https://open.bigmodel.cn/api/paas/v4/"
-        },
-        "glm-4.6": {
-            "model": "glm-4.6",
-            "api_key": "*****",
-            "base_url": "https://open.bigmodel.cn/api/paas/v4/"
-        },
-    },
-    "deepseek": {
-        "deepseek-reasoner": {
-            "model": "deepseek-reasoner",
-            "api_key": "*****",
-            "base_url": "https://api.deepseek.com"
-        },
-    }
+import functools
+import os
+from dataclasses import dataclass, field
+
+_BASE_URLS = {
+    "zhipu": "https://open.bigmodel.cn/api/paas/v4/",
+    "deepseek": "https://api.deepseek.com",
 }
 
+
+@dataclass(frozen=True, slots=True)
+class ModelSpec:
+    """单个模型的调用配置"""
+    model: str
+    api_key: str = field(repr=False)  # 避免日志中打印密钥
+    base_url: str
+
+
+@functools.cache
+def get_model_config(provider: str, name: str) -> ModelSpec:
+    """获取模型配置，未设置 api_key 环境变量或提供商无可用 base_url 时抛出 KeyError"""
+    prefix = provider.upper()
+    return ModelSpec(
+        model=name,
+        api_key=os.environ[f"{prefix}_API_KEY"],
+        base_url=os.environ.get(f"{prefix}_BASE_URL") or _BASE_URLS[provider],
+    )